@@ -10,7 +10,8 @@ try:  # Python 3
 except ImportError:  # Python 2
     from urllib import unquote_plus
 
-from kodiutils import container_refresh, end_of_directory, execute_builtin, get_global_setting, localize, log_access, notification, ok_dialog, refresh_caches
+from kodiutils import (container_refresh, end_of_directory, execute_builtin, get_global_setting, invalidate_settings, localize, log_access, notification,
+                       ok_dialog, refresh_caches)
 from utils import from_unicode, to_unicode
 
 plugin = Plugin()  # pylint: disable=invalid-name
@@ -320,7 +321,18 @@ def show_settings_addons():
     execute_builtin('ActivateWindow(SystemSettings,addons)')
 
 
+@plugin.route('/tracing')
+@plugin.route('/tracing/<invocations>')
+def show_tracing(invocations=10):
+    """Show HTTP request latencies of the last plugin invocations"""
+    from tracing import show_summary
+    show_summary(int(invocations))
+
+
 def run(argv):
     """Addon entry point from wrapper"""
+    from tracing import start_invocation
+    invalidate_settings()  # The language invoker is reused, read the settings again for every invocation
     log_access(argv)
+    start_invocation(argv[0])
     plugin.run(argv)
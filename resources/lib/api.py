@@ -5,21 +5,54 @@
 from __future__ import absolute_import, division, unicode_literals
 
 try:  # Python 3
+    from urllib.error import HTTPError
     from urllib.parse import quote_plus
 except ImportError:  # Python 2
     from urllib import quote_plus
+    from urllib2 import HTTPError
 
 from data import CHANNELS
-from helperobjects import TitleItem
-from kodiutils import (colour, delete_cached_thumbnail, get_cache, get_setting_bool, get_setting_int, get_url_json, has_addon, has_credentials,
-                       localize, localize_from_data, log, update_cache, url_for)
-from utils import find_entry, from_unicode, reformat_image_url, shorten_link, to_unicode, url_to_program, youtube_to_plugin_url
-from graphql_data import EPISODE_TILE
+from helperobjects import GraphQLQuery, TitleItem
+from kodiutils import (CACHE_STALE_TIME, colour, delete_cached_thumbnail, get_cache, get_cached_setting, get_cached_setting_bool, get_cached_setting_int,
+                       get_property, get_url_json, get_url_json_many, has_addon, has_credentials, invalidate_caches, is_transient_error, localize,
+                       localize_from_data, log, log_error, prefetch_listing, queue_revalidation, register_persisted_query, set_property, single_flight,
+                       ttl, update_cache, url_for, use_stale_caches)
+from utils import find_entry, from_unicode, parse_datetime, reformat_image_url, shorten_link, to_unicode, url_to_program, youtube_to_plugin_url
+from graphql_data import (LATEST_EPISODE_QUERY, LISTED_EPISODES_QUERIES, PAGINATED_PROGRAMS_QUERIES, SEASONS_QUERY, get_episode_query,
+                          get_list_type)
+import tracing
 
 SCREENSHOT_URL = 'https://www.vrt.be/vrtnu-static/screenshots'
 GRAPHQL_URL = 'https://www.vrt.be/vrtnu-api/graphql/v1'
 RESUMEPOINTS_URL = 'https://ddt.profiel.vrt.be/resumePoints'
 RESUMEPOINTS_MARGIN = 30  # The margin at start/end to consider a video as watched
+GRAPHQL_BATCH_SIZE = 25  # The maximum number of operations in a batched GraphQL request
+GRAPHQL_BATCH_RETRY = 60 * 60  # Try batching again one hour after it was rejected
+# The cache ttl kind of cacheable GraphQL operations, other operations are never cached
+GRAPHQL_CACHE_TTL = {
+    'ListedEpisodes': 'direct',  # Recent, continue and search episode lists change often
+    'Page': 'indirect',
+    'PaginatedPrograms': 'indirect',
+    'Stream': 'indirect',
+    'StreamId': 'indirect',
+    'VideoProgramPage': 'indirect',  # Program seasons and episodes
+}
+# The cached GraphQL operations affected by a mutation
+GRAPHQL_CACHE_INVALIDATES = {
+    'finishItem': ('ListedEpisodes',),
+    'listDelete': ('ListedEpisodes',),
+    'setFavorite': ('PaginatedPrograms', 'VideoProgramPage'),
+}
+RESUMEPOINT_CACHE_INVALIDATES = ('ListedEpisodes',)  # Continue lists show resume points
+PERSISTED_QUERY_RETRY = 60 * 60  # Try persisted queries again one hour after they were rejected
+PERSISTED_QUERY_NOT_FOUND = ('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+PERSISTED_QUERY_UNSUPPORTED = ('PersistedQueryNotSupported', 'PERSISTED_QUERY_NOT_SUPPORTED')
+
+FAVORITE_MARKER = '[COLOR={highlighted}]ᵛ[/COLOR]'
+
+_QUERIES = {}
+_CONTEXT_MENU_LABELS = {}  # Formatted follow and unfollow labels, per process
+_FAVORITE_MARKERS = {}  # Coloured favorite markers, per colour theme
 
 
 def get_sort(program_type):
@@ -46,16 +79,15 @@ def get_context_menu(program_name, program_id, program_title, program_type, is_f
     context_menu = []
 
     # Follow/unfollow
-    follow_suffix = localize(30410) if program_type != 'oneoff' else ''  # program
     encoded_program_title = to_unicode(quote_plus(from_unicode(program_title)))  # We need to ensure forward slashes are quoted
     if is_favorite:
         context_menu.append((
-            localize(30412, title=follow_suffix),  # Unfollow
+            get_follow_label(30412, program_type),  # Unfollow
             'RunPlugin(%s)' % url_for('unfollow', program_id=program_id, program_title=encoded_program_title)
         ))
     else:
         context_menu.append((
-            localize(30411, title=follow_suffix),  # Follow
+            get_follow_label(30411, program_type),  # Follow
             'RunPlugin(%s)' % url_for('follow', program_id=program_id, program_title=encoded_program_title)
         ))
 
@@ -81,6 +113,25 @@ def get_context_menu(program_name, program_id, program_title, program_type, is_f
     return context_menu
 
 
+def get_follow_label(string_id, program_type):
+    """Return the follow or unfollow context menu label for a program type, format it only once per process"""
+    oneoff = program_type == 'oneoff'
+    label = _CONTEXT_MENU_LABELS.get((string_id, oneoff))
+    if label is None:
+        follow_suffix = '' if oneoff else localize(30410)  # program
+        label = _CONTEXT_MENU_LABELS[(string_id, oneoff)] = localize(string_id, title=follow_suffix)
+    return label
+
+
+def get_favorite_marker():
+    """Return the favorite marker in the colours of the colour theme, colour it only once per process"""
+    theme = get_cached_setting('colour_theme', 'dark')
+    marker = _FAVORITE_MARKERS.get(theme)
+    if marker is None:
+        marker = _FAVORITE_MARKERS[theme] = colour(FAVORITE_MARKER)
+    return marker
+
+
 def format_label(program_title, episode_title, program_type, ontime=None, is_favorite=False, item_type='episode'):
     """Format label"""
     if item_type == 'program' or program_type == 'oneoff':
@@ -94,7 +145,7 @@ def format_label(program_title, episode_title, program_type, ontime=None, is_fav
 
     # Favorite marker
     if is_favorite:
-        label += colour('[COLOR={highlighted}]ᵛ[/COLOR]')
+        label += get_favorite_marker()
 
     return label
 
@@ -149,19 +200,19 @@ def format_plot(plot, region, product_placement, mpaa, offtime, permalink):
         plot = '{}\n\n{}'.format(plot_meta, plot)
 
     permalink = shorten_link(permalink)
-    if permalink and get_setting_bool('showpermalink', default=False):
+    if permalink and get_cached_setting_bool('showpermalink', default=False):
         plot = '{}\n\n[COLOR={{highlighted}}]{}[/COLOR]'.format(plot, permalink)
     return colour(plot)
 
 
 def resumepoints_is_activated():
     """Is resumepoints activated in the menu and do we have credentials ?"""
-    return get_setting_bool('usefavorites', default=True) and get_setting_bool('useresumepoints', default=True) and has_credentials()
+    return get_cached_setting_bool('usefavorites', default=True) and get_cached_setting_bool('useresumepoints', default=True) and has_credentials()
 
 
 def get_resumepoint_data(episode_id):
     """Get resumepoint data from GraphQL API"""
-    data_json = get_single_episode_data(episode_id)
+    data_json = get_single_episode_data(episode_id, projection='ResumePoint')
     video_id = data_json.get('data').get('catalogMember').get('watchAction').get('videoId')
     resumepoint_title = data_json.get('data').get('catalogMember').get('watchAction').get('resumePointTitle')
     return video_id, resumepoint_title
@@ -169,9 +220,8 @@ def get_resumepoint_data(episode_id):
 
 def get_next_info(episode_id):
     """ Get up next data"""
-    import dateutil.parser
     next_info = {}
-    data_json = get_single_episode_data(episode_id)
+    data_json = get_single_episode_data(episode_id, projection='UpNext')
     current_ep = data_json.get('data').get('catalogMember')
     # Only get add data when there is a next episode
     if current_ep.get('nextUp').get('title') == 'Volgende aflevering':
@@ -195,7 +245,7 @@ def get_next_info(episode_id):
             'season': int(''.join(i for i in current_ep.get('season').get('titleRaw') if i.isdigit()) or 0),
             'episode': int(current_ep.get('episodeNumberRaw') or 0),
             'rating': None,
-            'firstaired': dateutil.parser.parse(current_ep.get('analytics').get('airDate')).strftime('%Y-%m-%d'),
+            'firstaired': parse_datetime(current_ep.get('analytics').get('airDate')).strftime('%Y-%m-%d'),
             'runtime': int(current_ep.get('durationSeconds')),
         }
 
@@ -217,7 +267,7 @@ def get_next_info(episode_id):
             'season': int(''.join(i for i in next_ep.get('season').get('titleRaw') if i.isdigit()) or 0),
             'episode': int(next_ep.get('episodeNumberRaw') or 0),
             'rating': None,
-            'firstaired': dateutil.parser.parse(next_ep.get('analytics').get('airDate')).strftime('%Y-%m-%d'),
+            'firstaired': parse_datetime(next_ep.get('analytics').get('airDate')).strftime('%Y-%m-%d'),
             'runtime': int(next_ep.get('durationSeconds')),
         }
         next_info = {
@@ -264,168 +314,17 @@ def get_stream_id_data(vrtmax_url):
     return api_req(graphql_query, operation_name, variables)
 
 
-def get_single_episode_data(episode_id):
-    """Get single episode data from GraphQL API"""
-    graphql_query = """
-        query PlayerData($id: ID!) {
-          catalogMember(id: $id) {
-            __typename
-          ...episode
-          }
-        }
-        fragment episode on Episode {
-          __typename
-          id
-          title
-          description
-          episodeNumberRaw
-          durationSeconds
-          offTimeRaw
-          onTimeRaw
-          image {
-            alt
-            templateUrl
-          }
-          analytics {
-            airDate
-            categories
-          }
-          program {
-            id
-            title
-            link
-            programType
-            image {
-              alt
-              templateUrl
-            }
-            posterImage {
-              alt
-              templateUrl
-            }
-          }
-          season {
-            titleRaw
-          }
-          watchAction {
-            avodUrl
-            completed
-            resumePoint
-            resumePointTotal
-            resumePointProgress
-            resumePointTitle
-            episodeId
-            videoId
-            publicationId
-            streamId
-          }
-          favoriteAction {
-            favorite
-            id
-            title
-          }
-          nextUp {
-            title
-            autoPlay
-            countdown
-            tile {
-              __typename
-              ...episodeTile
-            }
-          }
-        }
-        %s
-    """ % EPISODE_TILE
-    operation_name = 'PlayerData'
+def get_single_episode_data(episode_id, projection='PlayerData'):
+    """Get single episode data from GraphQL API, a projection limits the episode fields to a use case"""
     variables = {
         'id': episode_id,
     }
-    return api_req(graphql_query, operation_name, variables)
+    return api_req(get_episode_query(projection), projection, variables)
 
 
 def get_latest_episode_data(program_name):
     """Get latest episode data from GraphQL API"""
-    graphql_query = """
-        query VideoProgramPage($pageId: ID!, $lazyItemCount: Int = 500, $after: ID) {
-          page(id: $pageId) {
-            ... on ProgramPage {
-              components {
-                __typename
-                ... on PageHeader {
-                  mostRelevantEpisodeTile {
-                    __typename
-                    title
-                    tile {
-                      ...episodeTile
-                      __typename
-                    }
-                    __typename
-                  }
-                  __typename
-                }
-                ... on ContainerNavigation {
-                  items {
-                    title
-                    components {
-                      __typename
-                      ... on PaginatedTileList {
-                        __typename
-                        paginatedItems(first: $lazyItemCount, after: $after) {
-                          __typename
-                          edges {
-                            __typename
-                            cursor
-                            node {
-                              __typename
-                              ... on EpisodeTile {
-                                id
-                                description
-                                ...episodeTile
-                              }
-                            }
-                          }
-                        }
-                      }
-                      ... on ContainerNavigation {
-                        items {
-                          title
-                          components {
-                            __typename
-                            ... on PaginatedTileList {
-                              __typename
-                              paginatedItems(first: $lazyItemCount, after: $after) {
-                                __typename
-                                edges {
-                                  __typename
-                                  cursor
-                                  node {
-                                    __typename
-                                    ... on EpisodeTile {
-                                      id
-                                      description
-                                      ...episodeTile
-                                    }
-                                  }
-                                }
-                              }
-                            }
-                          }
-                        }
-                        __typename
-                      }
-                    }
-                    __typename
-                  }
-                  __typename
-                }
-              }
-              __typename
-            }
-            __typename
-          }
-        }
-        %s
-    """ % EPISODE_TILE
+    graphql_query = LATEST_EPISODE_QUERY
     operation_name = 'VideoProgramPage'
     variables = {
         'pageId': '/vrtnu/a-z/{}.model.json'.format(program_name),
@@ -435,125 +334,7 @@ def get_latest_episode_data(program_name):
 
 def get_seasons_data(program_name):
     """Get seasons data from GraphQL API"""
-    graphql_query = """
-        query VideoProgramPage(
-          $pageId: ID!) {
-          page(id: $pageId) {
-            ... on ProgramPage {
-              id
-              permalink
-              components {
-                __typename
-                ... on PageHeader {
-                  mostRelevantEpisodeTile {
-                    __typename
-                    title
-                    tile {
-                      ...episodeTile
-                      __typename
-                    }
-                    __typename
-                  }
-                  __typename
-                }
-                ... on PaginatedTileList {
-                  __typename
-                  id: objectId
-                  objectId
-                  listId
-                  title
-                  tileContentType
-                }
-                ... on ContainerNavigation {
-                  id: objectId
-                  navigationType
-                  items {
-                    id: objectId
-                    title
-                    active
-                    components {
-                      __typename
-                      ... on PaginatedTileList {
-                        __typename
-                        id: objectId
-                        objectId
-                        listId
-                        title
-                        tileContentType
-                      }
-                      ... on StaticTileList {
-                        __typename
-                        id: objectId
-                        objectId
-                        listId
-                        title
-                        tileContentType
-                      }
-                      ... on LazyTileList {
-                        __typename
-                        id: objectId
-                        objectId
-                        listId
-                        title
-                        tileContentType
-                      }
-                      ... on IComponent {
-                        ... on ContainerNavigation {
-                          id: objectId
-                          navigationType
-                          items {
-                            id: objectId
-                            title
-                            components {
-                              __typename
-                              ... on Component {
-                                ... on PaginatedTileList {
-                                  __typename
-                                  id: objectId
-                                  objectId
-                                  listId
-                                  title
-                                  tileContentType
-                                }
-                                ... on StaticTileList {
-                                  __typename
-                                  id: objectId
-                                  objectId
-                                  listId
-                                  title
-                                  tileContentType
-                                }
-                                ... on LazyTileList {
-                                  __typename
-                                  id: objectId
-                                  objectId
-                                  listId
-                                  title
-                                  tileContentType
-                                }
-                                __typename
-                              }
-                            }
-                            __typename
-                          }
-                          __typename
-                        }
-                        __typename
-                      }
-                    }
-                    __typename
-                  }
-                  __typename
-                }
-                __typename
-              }
-              __typename
-            }
-            __typename
-          }
-        }
-        %s
-    """ % EPISODE_TILE
+    graphql_query = SEASONS_QUERY
     operation_name = 'VideoProgramPage'
     variables = {
         'pageId': '/vrtnu/a-z/{}.model.json'.format(program_name),
@@ -621,6 +402,7 @@ def set_resumepoint(video_id, title, position, total):
         data = dumps(payload).encode('utf-8')
         data_json = get_url_json(url='{}/{}'.format(RESUMEPOINTS_URL, video_id), cache=None, headers=headers, data=data, raise_errors='all')
         log(3, '[Resumepoints] Updated resumepoint {data}', data=data_json)
+        invalidate_api_caches(RESUMEPOINT_CACHE_INVALIDATES)
     return data_json
 
 
@@ -695,133 +477,51 @@ def finish_continue(episode_id):
 
 def get_paginated_episodes(list_id, page_size, end_cursor=''):
     """Get paginated list of episodes from GraphQL API"""
-    graphql_query = """
-        query ListedEpisodes(
-          $listId: ID!
-          $endCursor: ID!
-          $pageSize: Int!
-        ) {
-          list(listId: $listId) {
-            __typename
-            ... on PaginatedTileList {
-              paginated: paginatedItems(first: $pageSize, after: $endCursor) {
-                edges {
-                  node {
-                    __typename
-                    ...episodeTile
-                  }
-                }
-                pageInfo {
-                  startCursor
-                  endCursor
-                  hasNextPage
-                  hasPreviousPage
-                  __typename
-                }
-              }
-            }
-          }
-        }
-        %s
-    """ % EPISODE_TILE
-    # FIXME: Find a better way to change GraphQL typename
-    if list_id.startswith('static:/'):
-        graphql_query = graphql_query.replace('on PaginatedTileList', 'on StaticTileList')
+    query = get_paginated_episodes_query(list_id, page_size, end_cursor)
+    return api_req(*query)
+
 
+def get_paginated_episodes_query(list_id, page_size, end_cursor=''):
+    """Return GraphQL query, operation name and variables for a paginated list of episodes"""
+    graphql_query = LISTED_EPISODES_QUERIES.get(get_list_type(list_id))
     operation_name = 'ListedEpisodes'
     variables = {
         'listId': list_id,
         'endCursor': end_cursor,
         'pageSize': page_size,
     }
-    return api_req(graphql_query, operation_name, variables)
+    return graphql_query, operation_name, variables
 
 
 def get_paginated_programs(list_id, page_size, end_cursor='', client='WEB'):
-    """Get paginated list of episodes from GraphQL API"""
-    graphql_query = """
-        query PaginatedPrograms(
-          $listId: ID!
-          $endCursor: ID!
-          $pageSize: Int!
-        ) {
-          list(listId: $listId) {
-            __typename
-            ... on PaginatedTileList {
-              paginated: paginatedItems(first: $pageSize, after: $endCursor) {
-                edges {
-                  node {
-                    __typename
-                    ...ep
-                  }
-                }
-                pageInfo {
-                  startCursor
-                  endCursor
-                  hasNextPage
-                  hasPreviousPage
-                  __typename
-                }
-              }
-            }
-          }
-        }
-        fragment ep on ProgramTile {
-          __typename
-          objectId
-          id
-          link
-          tileType
-          image {
-            alt
-            templateUrl
-          }
-          title
-          program {
-            title
-            id
-            link
-            programType
-            description
-            shortDescription
-            subtitle
-            announcementType
-            announcementValue
-            whatsonId
-            image {
-              alt
-              templateUrl
-            }
-            posterImage {
-              alt
-              templateUrl
-            }
-            favoriteAction {
-              favorite
-              id
-              title
-            }
-          }
-        }
-    """
-    # FIXME: Find a better way to change GraphQL typename
-    if list_id.startswith('static:/'):
-        graphql_query = graphql_query.replace('on PaginatedTileList', 'on StaticTileList')
+    """Get paginated list of programs from GraphQL API"""
+    query = get_paginated_programs_query(list_id, page_size, end_cursor)
+    return api_req(*query, client=client)
 
+
+def get_paginated_programs_query(list_id, page_size, end_cursor=''):
+    """Return GraphQL query, operation name and variables for a paginated list of programs"""
+    graphql_query = PAGINATED_PROGRAMS_QUERIES.get(get_list_type(list_id))
     operation_name = 'PaginatedPrograms'
     variables = {
         'listId': list_id,
         'endCursor': end_cursor,
         'pageSize': page_size,
     }
-    return api_req(graphql_query, operation_name, variables, client)
+    return graphql_query, operation_name, variables
 
 
-def convert_programs(api_data, destination, use_favorites=False, **kwargs):
+def convert_programs(api_data, destination, use_favorites=False, lazy=False, **kwargs):
     """Convert paginated list of programs to Kodi list items"""
+    programs = iterate_programs(api_data, destination, use_favorites=use_favorites, **kwargs)
+    if lazy:
+        return programs
+    return list(programs)
 
-    programs = []
 
+def iterate_programs(api_data, destination, use_favorites=False, **kwargs):
+    """Convert paginated list of programs to Kodi list items, one edge at a time"""
+    count = 0
     item_list = api_data.get('data').get('list')
     if item_list:
         for item in item_list.get('paginated').get('edges'):
@@ -861,26 +561,25 @@ def convert_programs(api_data, destination, use_favorites=False, **kwargs):
             # Label
             label = format_label(program_title, episode_title, program_type, ontime, is_favorite, item_type='program')
 
-            programs.append(
-                TitleItem(
-                    label=label,
-                    path=path,
-                    art_dict={
-                        'thumb': thumb,
-                        'poster': poster,
-                        'banner': fanart,
-                        'fanart': fanart,
-                    },
-                    info_dict={
-                        'title': label,
-                        'tvshowtitle': program_title,
-                        'plot': plot,
-                        'plotoutline': plotoutline,
-                        'mediatype': 'tvshow',
-                    },
-                    context_menu=context_menu,
-                    is_playable=False,
-                )
+            count += 1
+            yield TitleItem(
+                label=label,
+                path=path,
+                art_dict={
+                    'thumb': thumb,
+                    'poster': poster,
+                    'banner': fanart,
+                    'fanart': fanart,
+                },
+                info_dict={
+                    'title': label,
+                    'tvshowtitle': program_title,
+                    'plot': plot,
+                    'plotoutline': plotoutline,
+                    'mediatype': 'tvshow',
+                },
+                context_menu=context_menu,
+                is_playable=False,
             )
 
         # Paging
@@ -889,25 +588,22 @@ def convert_programs(api_data, destination, use_favorites=False, **kwargs):
         page_info = api_data.get('data').get('list').get('paginated').get('pageInfo')
 
         # FIXME: find a better way to disable more when favorites are filtered
-        page_size = get_setting_int('itemsperpage', default=50)
-        if len(programs) == page_size and page_info.get('hasNextPage'):
+        page_size = get_cached_setting_int('itemsperpage', default=50)
+        if count == page_size and page_info.get('hasNextPage'):
             end_cursor = page_info.get('endCursor')
+            prefetch_listing(destination, end_cursor=end_cursor, **kwargs)
             # Add 'More...' entry at the end
-            programs.append(
-                TitleItem(
-                    label=colour(localize(30300)),
-                    path=url_for(destination, end_cursor=end_cursor, **kwargs),
-                    art_dict={'thumb': 'DefaultInProgressShows.png'},
-                    info_dict={},
-                    prop_dict={'SpecialSort': 'bottom'},
-                )
+            yield TitleItem(
+                label=colour(localize(30300)),
+                path=url_for(destination, end_cursor=end_cursor, **kwargs),
+                art_dict={'thumb': 'DefaultInProgressShows.png'},
+                info_dict={},
+                prop_dict={'SpecialSort': 'bottom'},
             )
-    return programs
 
 
 def convert_episode(item, destination=None):
     """Convert paginated episode item to TitleItem"""
-    import dateutil.parser
     data = item.get('node') or item.get('data') or item.get('tile')
     episode = data.get('episode') or data.get('catalogMember')
     # FIXME: find a better way to abort when we have no valid api data
@@ -928,8 +624,8 @@ def convert_episode(item, destination=None):
 
     episode_title = episode.get('title')
 
-    offtime = dateutil.parser.parse(episode.get('offTimeRaw') or '1970-01-01T00:00:00.000+00:00')
-    ontime = dateutil.parser.parse(episode.get('onTimeRaw') or '1970-01-01T00:00:00.000+00:00')
+    offtime = parse_datetime(episode.get('offTimeRaw') or '1970-01-01T00:00:00.000+00:00')
+    ontime = parse_datetime(episode.get('onTimeRaw') or '1970-01-01T00:00:00.000+00:00')
     mpaa = episode.get('ageRaw') or ''
     product_placement = episode.get('productPlacementShortValue') == 'pp'
     region = episode.get('regionRaw')
@@ -941,9 +637,9 @@ def convert_episode(item, destination=None):
     episode_no = int(episode.get('episodeNumberRaw') or 0)
     season_no = int(''.join(i for i in episode.get('season').get('titleRaw') if i.isdigit()) or 0)
     studio = episode.get('brand').title() if episode.get('brand') else 'VRT'
-    aired = dateutil.parser.parse(episode.get('analytics').get('airDate')).strftime('%Y-%m-%d')
+    aired = parse_datetime(episode.get('analytics').get('airDate')).strftime('%Y-%m-%d')
     dateadded = ontime.strftime('%Y-%m-%d %H:%M:%S')
-    year = int(dateutil.parser.parse(episode.get('onTimeRaw')).strftime('%Y'))
+    year = int(parse_datetime(episode.get('onTimeRaw')).strftime('%Y'))
     tag = [tag.title() for tag in episode.get('analytics').get('categories').split(',') if tag]
 
     # Art
@@ -1026,23 +722,51 @@ def convert_episode(item, destination=None):
     )
 
 
-def convert_episodes(api_data, destination, use_favorites=False, **kwargs):
+def convert_episodes(api_data, destination, use_favorites=False, lazy=False, **kwargs):
     """Convert paginated episode list to TitleItems"""
-    episodes = []
-    sort = 'unsorted'
-    ascending = True
+    sort, ascending = get_episodes_sort(api_data, destination)
+    episodes = iterate_episodes(api_data, destination, use_favorites=use_favorites, **kwargs)
+    if not lazy:
+        episodes = list(episodes)
+    return episodes, sort, ascending
+
 
+def get_episodes_sort(api_data, destination):
+    """Return the sort method and order of a paginated episode list, based on its last episode"""
+    item_list = api_data.get('data').get('list')
+    if item_list:
+        for item in reversed(item_list.get('paginated').get('edges')):
+            data = item.get('node') or item.get('data') or item.get('tile')
+            episode = data.get('episode') or data.get('catalogMember')
+            if not episode:
+                continue
+            program_type = episode.get('program').get('programType')
+            # FIXME: Find a better way to determine mixed episodes
+            if destination in ('recent', 'favorites_recent', 'resumepoints_continue', 'featured', 'search_query'):
+                program_type = 'mixed_episodes'
+            return get_sort(program_type)
+    return 'unsorted', True
+
+
+def iterate_episodes(api_data, destination, use_favorites=False, **kwargs):
+    """Convert paginated episode list to TitleItems, one edge at a time"""
+    count = 0
     item_list = api_data.get('data').get('list')
     if item_list:
         for item in item_list.get('paginated').get('edges'):
 
-            sort, ascending, is_favorite, title_item = convert_episode(item, destination)
+            _, _, is_favorite, title_item = convert_episode(item, destination)
+
+            # Skip items without valid api data
+            if title_item is None:
+                continue
 
             # Filter favorites for favorites menu
             if use_favorites and is_favorite is False:
                 continue
 
-            episodes.append(title_item)
+            count += 1
+            yield title_item
 
         # Paging
         # Remove kwargs with None value
@@ -1050,20 +774,18 @@ def convert_episodes(api_data, destination, use_favorites=False, **kwargs):
         page_info = api_data.get('data').get('list').get('paginated').get('pageInfo')
 
         # FIXME: find a better way to disable more when favorites are filtered
-        page_size = get_setting_int('itemsperpage', default=50)
-        if len(episodes) == page_size and page_info.get('hasNextPage'):
+        page_size = get_cached_setting_int('itemsperpage', default=50)
+        if count == page_size and page_info.get('hasNextPage'):
             end_cursor = page_info.get('endCursor')
+            prefetch_listing(destination, end_cursor=end_cursor, **kwargs)
             # Add 'More...' entry at the end
-            episodes.append(
-                TitleItem(
-                    label=colour(localize(30300)),
-                    path=url_for(destination, end_cursor=end_cursor, **kwargs),
-                    art_dict={'thumb': 'DefaultInProgressShows.png'},
-                    info_dict={},
-                    prop_dict={'SpecialSort': 'bottom'},
-                )
+            yield TitleItem(
+                label=colour(localize(30300)),
+                path=url_for(destination, end_cursor=end_cursor, **kwargs),
+                art_dict={'thumb': 'DefaultInProgressShows.png'},
+                info_dict={},
+                prop_dict={'SpecialSort': 'bottom'},
             )
-    return episodes, sort, ascending
 
 
 def get_single_episode(episode_id):
@@ -1106,27 +828,25 @@ def get_latest_episode(program_name):
     return video
 
 
-def get_favorite_programs(end_cursor=''):
+def get_favorite_programs(end_cursor='', lazy=False):
     """Get favorite programs"""
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     list_id = 'dynamic:/vrtnu.model.json@favorites-list-video'
     api_data = get_paginated_programs(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-    programs = convert_programs(api_data, destination='favorites_programs')
+    programs = convert_programs(api_data, destination='favorites_programs', lazy=lazy)
     return programs
 
 
-def get_search(keywords, end_cursor=''):
+def get_search(keywords, end_cursor='', lazy=False):
     """Get search items"""
     import base64
     from json import dumps
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     query_string = None
     destination = None
 
     entity_types = ['video-program', 'video-episode']
-    programs = []
-    episodes = []
-    items = []
+    queries = []
 
     for entity_type in entity_types:
         facets = []
@@ -1152,21 +872,39 @@ def get_search(keywords, end_cursor=''):
         list_id = '#{}'.format(base64.b64encode(list_id.encode('utf-8')).decode('utf-8'))
 
         if entity_type == 'video-program' and not end_cursor:
-            programs_data = get_paginated_programs(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-            programs = convert_programs(programs_data, destination=destination, keywords=keywords)
-            items.extend(programs)
+            queries.append(get_paginated_programs_query(list_id=list_id, page_size=page_size, end_cursor=end_cursor))
         elif entity_type == 'video-episode':
-            episodes_data = get_paginated_episodes(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-            episodes, _, _ = convert_episodes(episodes_data, destination=destination, keywords=keywords)
-            items.extend(episodes)
-    return items
+            queries.append(get_paginated_episodes_query(list_id=list_id, page_size=page_size, end_cursor=end_cursor))
+
+    # Search programs and episodes in one batched request
+    from itertools import chain
+    items = []
+    for (_, operation_name, _), api_data in zip(queries, api_req_batch(queries)):
+        if operation_name == 'PaginatedPrograms':
+            items.append(convert_programs(api_data, destination=destination, lazy=True, keywords=keywords))
+        else:
+            episodes, _, _ = convert_episodes(api_data, destination=destination, lazy=True, keywords=keywords)
+            items.append(episodes)
+    items = chain.from_iterable(items)
+    if lazy:
+        return items
+    return list(items)
 
 
-def get_programs(category=None, channel=None, keywords=None, end_cursor=''):
+def get_programs(category=None, channel=None, keywords=None, end_cursor='', api_data=None, lazy=False):
     """Get programs"""
+    destination, query = get_programs_query(category=category, channel=channel, keywords=keywords, end_cursor=end_cursor)
+    if api_data is None:
+        api_data = api_req(*query)
+    programs = convert_programs(api_data, destination=destination, lazy=lazy, category=category, channel=channel, keywords=keywords)
+    return programs
+
+
+def get_programs_query(category=None, channel=None, keywords=None, end_cursor=''):
+    """Return the destination and the GraphQL query for a list of programs"""
     import base64
     from json import dumps
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     query_string = None
     destination = None
     facets = []
@@ -1203,46 +941,44 @@ def get_programs(category=None, channel=None, keywords=None, end_cursor=''):
     list_id = 'tl-pag-srch|o%14|{}|{}%'.format(dumps(search_dict), 'watch')
     list_id = '#{}'.format(base64.b64encode(list_id.encode('utf-8')).decode('utf-8'))
 
-    api_data = get_paginated_programs(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-    programs = convert_programs(api_data, destination=destination, category=category, channel=channel, keywords=keywords)
-    return programs
+    return destination, get_paginated_programs_query(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
 
 
-def get_continue_episodes(end_cursor=''):
+def get_continue_episodes(end_cursor='', lazy=False):
     """Get continue episodes"""
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     list_id = 'dynamic:/vrtnu.model.json@resume-list-video'
     api_data = get_paginated_episodes(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-    episodes, sort, ascending = convert_episodes(api_data, destination='resumepoints_continue')
+    episodes, sort, ascending = convert_episodes(api_data, destination='resumepoints_continue', lazy=lazy)
     return episodes, sort, ascending, 'episodes'
 
 
-def get_recent_episodes(end_cursor='', use_favorites=False):
+def get_recent_episodes(end_cursor='', use_favorites=False, lazy=False):
     """Get recent episodes"""
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     list_id = 'static:/vrtnu/kijk.model.json@par_list_copy_copy_copy'
     api_data = get_paginated_episodes(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
     destination = 'favorites_recent' if use_favorites else 'recent'
-    episodes, sort, ascending = convert_episodes(api_data, destination=destination, use_favorites=use_favorites)
+    episodes, sort, ascending = convert_episodes(api_data, destination=destination, use_favorites=use_favorites, lazy=lazy)
     return episodes, sort, ascending, 'episodes'
 
 
-def get_offline_programs(end_cursor='', use_favorites=False):
+def get_offline_programs(end_cursor='', use_favorites=False, lazy=False):
     """Get laatste kans/soon offline programs"""
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     list_id = 'dynamic:/vrtnu.model.json@par_list_1624607593_copy_1408213323'
     api_data = get_paginated_programs(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
     destination = 'favorites_offline' if use_favorites else 'offline'
-    programs = convert_programs(api_data, destination=destination, use_favorites=use_favorites)
+    programs = convert_programs(api_data, destination=destination, use_favorites=use_favorites, lazy=lazy)
     return programs
 
 
-def get_episodes(program_name, season_name=None, end_cursor=''):
+def get_episodes(program_name, season_name=None, end_cursor='', lazy=False):
     """Get episodes"""
     sort = 'unsorted'
     ascending = True
     content = 'files'
-    page_size = get_setting_int('itemsperpage', default=50)
+    page_size = get_cached_setting_int('itemsperpage', default=50)
     if season_name is None:
         # Check for multiple seasons
         api_data = get_seasons(program_name)
@@ -1259,7 +995,7 @@ def get_episodes(program_name, season_name=None, end_cursor=''):
         else:
             list_id = 'static:/vrtnu/a-z/{}/{}.episodes-list.json'.format(program_name, season_name)
         api_data = get_paginated_episodes(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-        episodes, sort, ascending = convert_episodes(api_data, destination='programs', program_name=program_name, season_name=season_name)
+        episodes, sort, ascending = convert_episodes(api_data, destination='programs', lazy=lazy, program_name=program_name, season_name=season_name)
         return episodes, sort, ascending, 'episodes'
     return None
 
@@ -1344,29 +1080,310 @@ def get_seasons(program_name):
 
 
 def api_req(graphql_query, operation_name, variables, client='WEB'):
-    """GraphQL API Request"""
+    """GraphQL API Request, responses of cacheable operations are cached"""
+    cache_file = get_api_cache_file(graphql_query, operation_name, variables, client)
+    data_json = get_api_cache(cache_file, operation_name)
+    if data_json is None:
+        data_json = get_stale_api_cache(cache_file, (graphql_query, operation_name, variables), client)
+    if data_json is None:
+        data_json = get_api_json(graphql_query, operation_name, variables, client)
+        update_api_cache(cache_file, operation_name, data_json)
+    return data_json
+
+
+def api_req_batch(queries, client='WEB'):
+    """Batched GraphQL API Requests, queries is a list of (graphql_query, operation_name, variables) tuples
+
+    Queries are sent as array payloads of up to GRAPHQL_BATCH_SIZE operations, with a fallback to separate requests
+    when the endpoint rejects batching."""
+    return get_cached_api_json(queries, client, get_api_json_batch)
+
+
+def get_cached_api_json(queries, client, fetch):
+    """Return GraphQL API data of multiple operations from cache, and fetch the others"""
+    cache_files = [get_api_cache_file(*query, client=client) for query in queries]
+    results = [get_api_cache(cache_file, operation_name) for cache_file, (_, operation_name, _) in zip(cache_files, queries)]
+    results = [get_stale_api_cache(cache_file, query, client) if data_json is None else data_json
+               for cache_file, query, data_json in zip(cache_files, queries, results)]
+    missed = [idx for idx, data_json in enumerate(results) if data_json is None]
+    if missed:
+        for idx, data_json in zip(missed, fetch([queries[idx] for idx in missed], client)):
+            update_api_cache(cache_files[idx], queries[idx][1], data_json)
+            results[idx] = data_json
+    return results
+
+
+def get_api_cache_file(graphql_query, operation_name, variables, client='WEB'):
+    """Return the cache file of a GraphQL operation, scoped to the query and the user, or None if the operation is not cacheable"""
+    if operation_name not in GRAPHQL_CACHE_TTL:
+        return None
+    from hashlib import md5
     from json import dumps
-    from tokenresolver import TokenResolver
-    access_token = TokenResolver().get_token('vrtnu-site_profile_at')
+    # Query variants of an operation, e.g. per list type or projection, return different data
+    key = dumps([get_query(graphql_query, operation_name).hash, variables, client, get_cached_setting('credentials_hash')], sort_keys=True)
+    return 'graphql.{operation}.{key}.json'.format(operation=operation_name, key=md5(key.encode('utf-8')).hexdigest())
+
+
+def get_api_cache(cache_file, operation_name, stale=False):
+    """Return cached GraphQL API data, if it is still fresh, or recently expired if stale is True"""
+    if not cache_file:
+        return None
+    cache_ttl = ttl(GRAPHQL_CACHE_TTL.get(operation_name))
+    if stale:
+        cache_ttl += CACHE_STALE_TIME
+    data_json = get_cache(cache_file, ttl=cache_ttl)
+    if data_json is not None:
+        tracing.end(tracing.begin(GRAPHQL_URL, cache=cache_file), cache='stale' if stale else 'hit')
+    return data_json
+
+
+def get_stale_api_cache(cache_file, query, client='WEB'):
+    """Return recently expired GraphQL API data and let the service refresh it, or None"""
+    if not cache_file or not use_stale_caches():
+        return None
+    graphql_query, operation_name, variables = query
+    data_json = get_api_cache(cache_file, operation_name, stale=True)
+    if data_json is not None:
+        queue_revalidation('graphql', graphql_query=graphql_query, operation_name=operation_name, variables=variables, client=client)
+    return data_json
+
+
+def revalidate_api_cache(graphql_query, operation_name, variables, client='WEB'):
+    """Refresh cached GraphQL API data, returns True if the data changed"""
+    cache_file = get_api_cache_file(graphql_query, operation_name, variables, client)
+    if not cache_file:
+        return False
+    with single_flight(cache_file):
+        # Another process may have refreshed the cache already
+        if get_api_cache(cache_file, operation_name) is not None:
+            return False
+        cached_json = get_cache(cache_file)
+        data_json = get_api_json(graphql_query, operation_name, variables, client)
+        update_api_cache(cache_file, operation_name, data_json)
+    return bool(data_json) and not data_json.get('errors') and data_json != cached_json
+
+
+def update_api_cache(cache_file, operation_name, data_json):
+    """Cache GraphQL API data, and invalidate cached data affected by a mutation"""
+    if not data_json or data_json.get('errors'):
+        return
+    if cache_file:
+        from json import dumps
+        update_cache(cache_file, dumps(data_json))
+    invalidates = GRAPHQL_CACHE_INVALIDATES.get(operation_name)
+    if invalidates:
+        invalidate_api_caches(invalidates)
+
+
+def invalidate_api_caches(operation_names):
+    """Invalidate the cached responses of GraphQL operations"""
+    # Pre-rendered listings show favorites and continue items too
+    invalidate_caches('listing.*.json', *['graphql.{operation}.*.json'.format(operation=operation) for operation in operation_names])
+
+
+def get_api_json(graphql_query, operation_name, variables, client='WEB'):
+    """Return GraphQL API data, a persisted query hash is sent first and the full query text only when the server does not recognize it"""
     data_json = {}
-    if access_token:
-        payload = {
-            'operationName': operation_name,
-            'query': graphql_query,
-            'variables': variables,
-        }
-        data = dumps(payload).encode('utf-8')
-        headers = {
-            'Accept': 'application/json',
-            'Authorization': 'Bearer ' + access_token,
-            'Content-Type': 'application/json',
-            'x-vrt-client-name': client,
-            'x-vrt-client-version': '1.5.7',
-        }
-        data_json = get_url_json(url=GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
+    if use_persisted_queries():
+        request = get_api_request(graphql_query, operation_name, variables, client, persisted=True)
+        if request:
+            data_json = get_persisted_json(request)
+            if not is_persisted_query_miss(data_json):
+                return data_json
+    missed_json = data_json
+    request = get_api_request(graphql_query, operation_name, variables, client)
+    if request:
+        data_json = get_url_json(**request)
+        reject_persisted_queries(missed_json, data_json)
     return data_json
 
 
+def get_api_json_many(queries, client='WEB'):
+    """Return GraphQL API data of multiple operations, fetched concurrently"""
+    if use_persisted_queries():
+        results = get_url_json_many([get_api_request(*query, client=client, persisted=True) for query in queries], get_json=get_persisted_json)
+        # Send the full query text of unknown persisted queries
+        missed = [idx for idx, data_json in enumerate(results) if is_persisted_query_miss(data_json)]
+    else:
+        results = [None] * len(queries)
+        missed = list(range(len(queries)))
+    for idx, data_json in zip(missed, get_url_json_many([get_api_request(*queries[idx], client=client) for idx in missed])):
+        reject_persisted_queries(results[idx], data_json)
+        results[idx] = data_json
+    return [data_json or {} for data_json in results]
+
+
+def get_api_json_batch(queries, client='WEB'):
+    """Return GraphQL API data of multiple operations, sent as array payloads of up to GRAPHQL_BATCH_SIZE operations"""
+    if len(queries) <= 1 or is_graphql_feature_rejected('batching'):
+        return get_api_json_many(queries, client)
+    persisted = use_persisted_queries()
+    chunks = [queries[idx:idx + GRAPHQL_BATCH_SIZE] for idx in range(0, len(queries), GRAPHQL_BATCH_SIZE)]
+    requests = [get_api_request_batch(chunk, client, persisted=persisted) for chunk in chunks]
+    if requests[0] is None:  # No access token
+        return [{} for _ in queries]
+    results = []
+    for chunk, data_json in zip(chunks, get_url_json_many(requests, get_json=get_batch_json)):
+        if data_json is None:
+            # A timeout or a server error says nothing about batching
+            log(2, 'GraphQL batch request failed, use separate requests')
+            results.extend(get_api_json_many(chunk, client))
+            continue
+        if isinstance(data_json, list) and len(data_json) == len(chunk):
+            missed = [idx for idx, item in enumerate(data_json) if persisted and is_persisted_query_miss(item)]
+            if missed:
+                # Resend the operations with unknown persisted queries, including their full query text
+                full_json = get_batch_json(get_api_request_batch([chunk[idx] for idx in missed], client))
+                if not isinstance(full_json, list) or len(full_json) != len(missed):
+                    full_json = get_api_json_many([chunk[idx] for idx in missed], client)
+                for idx, item in zip(missed, full_json):
+                    reject_persisted_queries(data_json[idx], item)
+                    data_json[idx] = item
+            results.extend(item or {} for item in data_json)
+            continue
+        log(2, 'GraphQL batching was rejected, use separate requests')
+        reject_graphql_feature('batching', GRAPHQL_BATCH_RETRY)
+        results.extend(get_api_json_many(chunk, client))
+    return results
+
+
+def get_batch_json(request):
+    """Return the response of a batched GraphQL request, or None when it failed for a reason other than batching"""
+    try:
+        return get_persisted_json(request)
+    except HTTPError as exc:
+        if is_transient_error(exc):
+            log_error('GraphQL batch request failed: {error}', error=exc)
+            return None
+        if exc.code in (401, 403):
+            raise
+        # The server does not accept array payloads
+        return {'errors': [{'message': 'HTTP Error {code}: {reason}'.format(code=exc.code, reason=exc.reason)}]}
+
+
+def is_graphql_feature_rejected(feature):
+    """Whether the GraphQL API recently rejected batching or persisted queries"""
+    from time import time
+    try:
+        return float(get_property('vrtmax_graphql_{feature}'.format(feature=feature), default=0)) > time()
+    except ValueError:
+        return False
+
+
+def reject_graphql_feature(feature, retry):
+    """Stop using batching or persisted queries for a while"""
+    from time import time
+    set_property('vrtmax_graphql_{feature}'.format(feature=feature), str(time() + retry))
+
+
+def use_persisted_queries():
+    """Whether to send persisted query hashes instead of the full query text"""
+    return not is_graphql_feature_rejected('persisted')
+
+
+def get_query(graphql_query, operation_name):
+    """Return the registered GraphQL query with its persisted query hash and payload prefixes, registered once per process"""
+    key = (operation_name, graphql_query)
+    query = _QUERIES.get(key)
+    if query is None:
+        query = GraphQLQuery(graphql_query, operation_name)
+        register_persisted_query(query.hash, query.is_mutation)
+        _QUERIES[key] = query
+    return query
+
+
+def get_persisted_json(request):
+    """Return the response of a persisted query or batched request, the server may reject an unknown hash or a batch with HTTP Error 400"""
+    try:
+        return get_url_json(**request)
+    except HTTPError as exc:
+        if exc.code != 400:
+            raise
+        from json import loads
+        try:
+            return loads(exc.read().decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            return {'errors': [{'message': 'HTTP Error 400: {reason}'.format(reason=exc.reason)}]}
+
+
+def get_persisted_query_error(data_json):
+    """Return the error code of a response when the server rejected a persisted query, or None"""
+    for error in data_json.get('errors') or []:
+        for code in (error.get('message'), (error.get('extensions') or {}).get('code')):
+            if code in PERSISTED_QUERY_NOT_FOUND + PERSISTED_QUERY_UNSUPPORTED:
+                return code
+    return None
+
+
+def is_persisted_query_miss(data_json):
+    """Whether the server did not answer a persisted query, so it must be sent again with the full query text"""
+    if not isinstance(data_json, dict):
+        return False
+    if get_persisted_query_error(data_json):
+        return True
+    # A server without automatic persisted queries answers a payload without query text with a generic error
+    return bool(data_json.get('errors')) and not data_json.get('data')
+
+
+def reject_persisted_queries(missed_json, data_json):
+    """Stop sending persisted queries when the server does not support them, or answered only the full query text"""
+    if not is_persisted_query_miss(missed_json):
+        return
+    code = get_persisted_query_error(missed_json)
+    if code in PERSISTED_QUERY_NOT_FOUND:
+        return  # The server stores the query now
+    if code is None and not (isinstance(data_json, dict) and data_json.get('data')):
+        return  # The full query text failed as well, so the error was not about the persisted query
+    log(2, 'GraphQL persisted queries are not supported, send the full query text')
+    reject_graphql_feature('persisted', PERSISTED_QUERY_RETRY)
+
+
+def get_api_payload(graphql_query, operation_name, variables, persisted=False):
+    """Return the serialized payload of a GraphQL operation, a persisted query payload has the query hash instead of the query text"""
+    if not use_persisted_queries():
+        kind = 'query'
+    elif persisted:
+        kind = 'persisted'
+    else:
+        # Sending the query text with its hash lets the server store it as a persisted query
+        kind = 'register'
+    from json import dumps
+    return get_query(graphql_query, operation_name).prefixes.get(kind) + dumps(variables) + '}'
+
+
+def get_api_request(graphql_query, operation_name, variables, client='WEB', persisted=False):
+    """Return get_url_json() arguments for a GraphQL API Request"""
+    return get_graphql_request(get_api_payload(graphql_query, operation_name, variables, persisted), client)
+
+
+def get_api_request_batch(queries, client='WEB', persisted=False):
+    """Return get_url_json() arguments for a batched GraphQL API Request"""
+    return get_graphql_request('[' + ', '.join(get_api_payload(graphql_query, operation_name, variables, persisted)
+                                               for graphql_query, operation_name, variables in queries) + ']', client)
+
+
+def get_graphql_request(payload, client='WEB'):
+    """Return get_url_json() arguments for a serialized GraphQL payload"""
+    from tokenresolver import TokenResolver
+    access_token = TokenResolver().get_token('vrtnu-site_profile_at')
+    if not access_token:
+        return None
+    headers = {
+        'Accept': 'application/json',
+        'Authorization': 'Bearer ' + access_token,
+        'Content-Type': 'application/json',
+        'x-vrt-client-name': client,
+        'x-vrt-client-version': '1.5.7',
+    }
+    return {
+        'url': GRAPHQL_URL,
+        'cache': None,
+        'headers': headers,
+        'data': payload.encode('utf-8'),
+        'raise_errors': 'all',
+    }
+
+
 def get_featured_data():
     """Get featured data"""
     graphql_query = """
@@ -1436,23 +1453,23 @@ def get_featured_data():
     return api_req(graphql_query, operation_name, variables)
 
 
-def get_featured(feature=None, end_cursor=''):
+def get_featured(feature=None, end_cursor='', lazy=False):
     """Get featured menu items"""
     content = 'files'
     sort = 'unsorted'
     ascending = True
     if feature:
-        page_size = get_setting_int('itemsperpage', default=50)
+        page_size = get_cached_setting_int('itemsperpage', default=50)
         if feature.startswith('program_'):
             list_id = feature.replace('_proto_', ':/').split('program_')[1]
             api_data = get_paginated_programs(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-            programs = convert_programs(api_data, destination='featured', feature=feature)
+            programs = convert_programs(api_data, destination='featured', lazy=lazy, feature=feature)
             return programs, sort, ascending, 'tvshows'
 
         if feature.startswith('episode_'):
             list_id = feature.replace('_proto_', ':/').split('episode_')[1]
             api_data = get_paginated_episodes(list_id=list_id, page_size=page_size, end_cursor=end_cursor)
-            episodes, sort, ascending = convert_episodes(api_data, destination='featured', feature=feature)
+            episodes, sort, ascending = convert_episodes(api_data, destination='featured', lazy=lazy, feature=feature)
             return episodes, sort, ascending, 'episodes'
     else:
         featured = []
@@ -1508,7 +1525,7 @@ def get_categories():
     categories = []
     from data import CATEGORIES
     for category in localize_categories(categories_data, CATEGORIES):
-        if get_setting_bool('showfanart', default=True):
+        if get_cached_setting_bool('showfanart', default=True):
             thumbnail = category.get('thumbnail', 'DefaultGenre.png')
         else:
             thumbnail = 'DefaultGenre.png'
@@ -1753,20 +1770,20 @@ def get_episode_by_air_date(channel_name, start_date, end_date=None):
     # Guess the episode
     episode_guess = None
     if not offairdate:
-        mindate = min(abs(onairdate - dateutil.parser.parse(episode.get('startTime'))) for episode in episodes)
-        episode_guess = next((episode for episode in episodes if abs(onairdate - dateutil.parser.parse(episode.get('startTime'))) == mindate), None)
+        mindate = min(abs(onairdate - parse_datetime(episode.get('startTime'))) for episode in episodes)
+        episode_guess = next((episode for episode in episodes if abs(onairdate - parse_datetime(episode.get('startTime'))) == mindate), None)
     else:
         duration = offairdate - onairdate
         midairdate = onairdate + timedelta(seconds=duration.total_seconds() / 2)
         mindate = min(abs(midairdate
-                          - (dateutil.parser.parse(episode.get('startTime'))
-                             + timedelta(seconds=(dateutil.parser.parse(episode.get('endTime'))
-                                                  - dateutil.parser.parse(episode.get('startTime'))).total_seconds() / 2))) for episode in episodes)
+                          - (parse_datetime(episode.get('startTime'))
+                             + timedelta(seconds=(parse_datetime(episode.get('endTime'))
+                                                  - parse_datetime(episode.get('startTime'))).total_seconds() / 2))) for episode in episodes)
         episode_guess = next((episode for episode in episodes
                               if abs(midairdate
-                                     - (dateutil.parser.parse(episode.get('startTime'))
-                                        + timedelta(seconds=(dateutil.parser.parse(episode.get('endTime'))
-                                                             - dateutil.parser.parse(episode.get('startTime'))).total_seconds() / 2))) == mindate), None)
+                                     - (parse_datetime(episode.get('startTime'))
+                                        + timedelta(seconds=(parse_datetime(episode.get('endTime'))
+                                                             - parse_datetime(episode.get('startTime'))).total_seconds() / 2))) == mindate), None)
     if episode_guess:
         if episode_guess.get('episodeId'):
             episode = get_single_episode_data(episode_guess.get('episodeId'))
@@ -1780,8 +1797,8 @@ def get_episode_by_air_date(channel_name, start_date, end_date=None):
                 return video
 
         # Airdate live2vod feature: use livestream cache of last 24 hours if no video was found
-        offairdate_guess = dateutil.parser.parse(episode_guess.get('endTime'))
-        if now - timedelta(hours=24) <= dateutil.parser.parse(episode_guess.get('endTime')) <= now:
+        offairdate_guess = parse_datetime(episode_guess.get('endTime'))
+        if now - timedelta(hours=24) <= parse_datetime(episode_guess.get('endTime')) <= now:
             start_date = onairdate.astimezone(dateutil.tz.UTC).isoformat()[0:19]
             end_date = offairdate_guess.astimezone(dateutil.tz.UTC).isoformat()[0:19]
 
@@ -1860,7 +1877,7 @@ def get_channels(channels=None, live=True):
                 label = '[B]%s[/B]' % label
             is_playable = True
             if channel.get('name') in ['een', 'canvas', 'ketnet']:
-                if get_setting_bool('showfanart', default=True):
+                if get_cached_setting_bool('showfanart', default=True):
                     art_dict['fanart'] = get_live_screenshot(channel.get('name', art_dict.get('fanart')))
                 plot = '%s\n\n%s' % (localize(30142, **channel), _tvguide.live_description(channel.get('name')))
             else:
@@ -1896,7 +1913,7 @@ def get_youtube(channels=None):
 
     youtube_items = []
 
-    if not has_addon('plugin.video.youtube') or not get_setting_bool('showyoutube', default=True):
+    if not has_addon('plugin.video.youtube') or not get_cached_setting_bool('showyoutube', default=True):
         return youtube_items
 
     for channel in CHANNELS:
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Implements a keep-alive connection pool for urllib openers"""
+
+from __future__ import absolute_import, division, unicode_literals
+from select import select
+from socket import error as socket_error, getaddrinfo, socket, timeout, SOCK_STREAM, _GLOBAL_DEFAULT_TIMEOUT
+from threading import Lock
+from time import time
+from timeit import default_timer
+from kodiutils import is_idempotent
+import tracing
+
+try:  # Python 3
+    from http.client import BadStatusLine, HTTPConnection, HTTPResponse, HTTPSConnection
+    from urllib.error import URLError
+    from urllib.request import HTTPHandler, HTTPSHandler
+except ImportError:  # Python 2
+    from httplib import BadStatusLine, HTTPConnection, HTTPResponse, HTTPSConnection
+    from urllib2 import HTTPHandler, HTTPSHandler, URLError
+
+
+class PooledHTTPResponse(HTTPResponse):
+    """An HTTPResponse that hands its connection back to the pool once the body has been read"""
+
+    on_release = None
+    complete = False
+
+    def _read_and_discard_trailer(self):
+        """Mark a chunked response as complete once the last chunk was read"""
+        HTTPResponse._read_and_discard_trailer(self)  # pylint: disable=protected-access
+        self.complete = True
+
+    def _close_conn(self):
+        """Release the connection when the response body is exhausted (Python 3)"""
+        HTTPResponse._close_conn(self)  # pylint: disable=protected-access
+        if self.length == 0 or getattr(self, '_method', None) == 'HEAD':
+            self.complete = True
+        self.release()
+
+    def close(self):
+        """Release the connection when the response is closed"""
+        HTTPResponse.close(self)
+        self.release()
+
+    def release(self):
+        """Call the release callback only once"""
+        on_release, self.on_release = self.on_release, None
+        if on_release is not None:
+            on_release(self)
+
+
+def traced_create_connection(address, timeout=_GLOBAL_DEFAULT_TIMEOUT, source_address=None):  # pylint: disable=redefined-outer-name
+    """Connect to a host like socket.create_connection(), tracing the DNS lookup and the TCP connect separately"""
+    host, port = address
+    with tracing.phase('dns'):
+        addresses = getaddrinfo(host, port, 0, SOCK_STREAM)
+    error = socket_error('getaddrinfo returns an empty list')
+    with tracing.phase('connect'):
+        for family, socktype, proto, _, sockaddr in addresses:
+            sock = None
+            try:
+                sock = socket(family, socktype, proto)
+                if timeout is not _GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket_error as exc:
+                error = exc
+                if sock is not None:
+                    sock.close()
+    raise error
+
+
+class TracedConnectionMixin:  # pylint: disable=too-few-public-methods
+    """Trace DNS lookup, TCP connect and TLS handshake of new connections"""
+
+    def connect(self):
+        """Connect to the host, traced when a request is being traced"""
+        if not tracing.is_active():
+            return self.connection_class.connect(self)
+        record = tracing.get_record()
+        before = record.get('dns', 0) + record.get('connect', 0)
+        start = default_timer()
+        create_connection, self._create_connection = self._create_connection, traced_create_connection
+        try:
+            self.connection_class.connect(self)
+        finally:
+            self._create_connection = create_connection
+        if self.connection_class is HTTPSConnection:
+            # What remains is the TLS handshake (and proxy tunnel setup)
+            elapsed = default_timer() - start - (record.get('dns', 0) + record.get('connect', 0) - before)
+            tracing.add('tls', max(0, elapsed))
+        return None
+
+
+class PooledHTTPConnection(TracedConnectionMixin, HTTPConnection):
+    """An HTTPConnection using a pooled response class"""
+    connection_class = HTTPConnection
+    response_class = PooledHTTPResponse
+
+
+class PooledHTTPSConnection(TracedConnectionMixin, HTTPSConnection):
+    """An HTTPSConnection using a pooled response class"""
+    connection_class = HTTPSConnection
+    response_class = PooledHTTPResponse
+
+
+class ConnectionPool:
+    """A thread-safe pool of idle keep-alive connections, keyed by connection class, host and tunnel"""
+
+    def __init__(self, max_connections=4, idle_timeout=60):
+        """Initialize an empty connection pool"""
+        self._lock = Lock()
+        self._idle = {}
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+
+    def acquire(self, key):
+        """Return an idle connection for key, or None"""
+        now = time()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                connection, expires = connections.pop()
+                if expires > now and not self.is_dropped(connection):
+                    return connection
+                connection.close()
+        return None
+
+    def release(self, key, connection):
+        """Return a connection to the pool, or close it when the pool is full or disabled"""
+        if self.idle_timeout <= 0:
+            connection.close()
+            return
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) >= self.max_connections:
+                connection.close()
+                return
+            connections.append((connection, time() + self.idle_timeout))
+
+    def clear(self):
+        """Close all idle connections"""
+        with self._lock:
+            for connections in self._idle.values():
+                for connection, _ in connections:
+                    connection.close()
+            self._idle = {}
+
+    @staticmethod
+    def is_dropped(connection):
+        """Check whether the remote end closed an idle connection"""
+        if connection.sock is None:
+            return True
+        try:
+            readable, _, _ = select([connection.sock], [], [], 0)
+        except (socket_error, ValueError):
+            return True
+        # An idle keep-alive socket has nothing to read, unless the server closed it
+        return bool(readable)
+
+
+class KeepAliveHandlerMixin:  # pylint: disable=too-few-public-methods
+    """Shared do_open() implementation for keep-alive HTTP and HTTPS handlers"""
+
+    pool = None
+
+    @staticmethod
+    def is_dropped_error(exc):
+        """Check whether an exception indicates a connection closed by the server"""
+        reason = getattr(exc, 'reason', exc)
+        return isinstance(reason, (BadStatusLine, socket_error)) and not isinstance(reason, timeout)
+
+    def do_open(self, http_class, req, **http_conn_args):  # pylint: disable=arguments-differ
+        """Open a request on a pooled connection, based on urllib's AbstractHTTPHandler.do_open()"""
+        host = req.host
+        if not host:
+            raise URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items() if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict((name.title(), val) for name, val in headers.items())
+
+        tunnel_host = getattr(req, '_tunnel_host', None)
+        tunnel_headers = {}
+        if tunnel_host and 'Proxy-Authorization' in headers:
+            tunnel_headers['Proxy-Authorization'] = headers.pop('Proxy-Authorization')
+
+        # Only pass an explicit method, so that a GraphQL query sent as a POST request counts as idempotent
+        method = req.get_method()
+        if method == ('GET' if req.data is None else 'POST'):
+            method = None
+        idempotent = is_idempotent(req.data, method)
+
+        key = (http_class.__name__, host, tunnel_host)
+        connection = self.pool.acquire(key)
+        reused = connection is not None
+        while True:
+            if connection is None:
+                connection = http_class(host, timeout=req.timeout, **http_conn_args)
+                if tunnel_host:
+                    connection.set_tunnel(tunnel_host, headers=tunnel_headers)
+            try:
+                try:
+                    if connection.sock is None:
+                        connection.connect()
+                    start = default_timer()
+                    connection.request(req.get_method(), req.selector, req.data, headers,
+                                       encode_chunked=req.has_header('Transfer-encoding'))
+                except socket_error as err:  # timeout error
+                    raise URLError(err)  # pylint: disable=raise-missing-from
+                response = connection.getresponse()
+                tracing.add('ttfb', default_timer() - start)
+            except BaseException as exc:
+                connection.close()
+                # A reused connection may have been dropped by the server, retry an idempotent request once on a new connection
+                if reused and idempotent and self.is_dropped_error(exc):
+                    connection = None
+                    reused = False
+                    continue
+                raise
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            def on_release(resp, pool=self.pool, key=key, connection=connection):
+                """Put the connection back into the pool when the response was read completely"""
+                if resp.complete and not resp.will_close:
+                    pool.release(key, connection)
+                else:
+                    connection.close()
+            response.on_release = on_release
+            if response.isclosed():  # Empty body, e.g. 204 or 304
+                response.release()
+
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, HTTPHandler):
+    """An HTTPHandler reusing connections from a ConnectionPool"""
+
+    def __init__(self, pool, debuglevel=0):
+        """Initialize the handler with a connection pool"""
+        HTTPHandler.__init__(self, debuglevel=debuglevel)
+        self.pool = pool
+
+    def http_open(self, req):
+        """Open an HTTP request"""
+        return self.do_open(PooledHTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, HTTPSHandler):
+    """An HTTPSHandler reusing connections from a ConnectionPool"""
+
+    def __init__(self, pool, debuglevel=0, context=None):
+        """Initialize the handler with a connection pool"""
+        HTTPSHandler.__init__(self, debuglevel=debuglevel, context=context)
+        self.pool = pool
+
+    def https_open(self, req):
+        """Open an HTTPS request"""
+        return self.do_open(PooledHTTPSConnection, req, context=self._context)  # pylint: disable=no-member
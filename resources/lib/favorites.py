@@ -10,16 +10,15 @@ try:  # Python 3
 except ImportError:  # Python 2
     from urllib2 import unquote
 
-from kodiutils import (container_refresh, get_cache, get_setting_bool, get_url_json,
+from kodiutils import (container_refresh, get_cache, get_cached_setting_bool,
                        has_credentials, input_down, invalidate_caches, localize,
-                       multiselect, notification, ok_dialog, update_cache)
+                       multiselect, notification, ok_dialog, single_flight, update_cache)
 from utils import url_to_program
 
 
 class Favorites:
     """Track, cache and manage VRT favorites"""
 
-    GRAPHQL_URL = 'https://www.vrt.be/vrtnu-api/graphql/v1'
     FAVORITES_CACHE_FILE = 'favorites.json'
 
     def __init__(self):
@@ -29,7 +28,7 @@ class Favorites:
     @staticmethod
     def is_activated():
         """Is favorites activated in the menu and do we have credentials ?"""
-        return get_setting_bool('usefavorites', default=True) and has_credentials()
+        return get_cached_setting_bool('usefavorites', default=True) and has_credentials()
 
     def refresh(self, ttl=None):
         """Get a cached copy or a newer favorites from VRT, or fall back to a cached file"""
@@ -37,7 +36,15 @@ class Favorites:
             return
         favorites_dict = get_cache(self.FAVORITES_CACHE_FILE, ttl)
         if not favorites_dict:
-            favorites_dict = self._generate_favorites_dict(self.get_favorites())
+            with single_flight(self.FAVORITES_CACHE_FILE) as waited:
+                if waited:  # Favorites were refreshed by another process
+                    favorites_dict = get_cache(self.FAVORITES_CACHE_FILE, ttl)
+                if not favorites_dict:
+                    favorites_dict = self._generate_favorites_dict(self.get_favorites())
+                    if favorites_dict is not None:
+                        # Publish before releasing the lock, so waiting processes find it
+                        from json import dumps
+                        update_cache(self.FAVORITES_CACHE_FILE, dumps(favorites_dict))
         if favorites_dict is not None:
             from json import dumps
             self._favorites = favorites_dict
@@ -68,7 +75,7 @@ class Favorites:
         # Update cache dict
         from json import dumps
         update_cache(self.FAVORITES_CACHE_FILE, dumps(self._favorites))
-        invalidate_caches('my-offline-*.json', 'my-recent-*.json')
+        invalidate_caches('listing.*.json', 'my-offline-*.json', 'my-recent-*.json')
 
         # Update online
         self.set_favorite_graphql(program_id, title, is_favorite)
@@ -76,137 +83,96 @@ class Favorites:
 
     def get_favorites(self):
         """Get favorites using GraphQL API"""
-        from tokenresolver import TokenResolver
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        favorites_json = {}
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
-            }
-            graphql = """
-                query Favs(
-                  $listId: ID!
-                  $endCursor: ID!
-                  $pageSize: Int!
-                ) {
-                  list(listId: $listId) {
-                    __typename
-                    ... on PaginatedTileList {
-                      paginated: paginatedItems(first: $pageSize, after: $endCursor) {
-                        edges {
-                          node {
-                            __typename
-                            ...programTile
-                          }
-                        }
+        from api import api_req
+        graphql_query = """
+            query Favs(
+              $listId: ID!
+              $endCursor: ID!
+              $pageSize: Int!
+            ) {
+              list(listId: $listId) {
+                __typename
+                ... on PaginatedTileList {
+                  paginated: paginatedItems(first: $pageSize, after: $endCursor) {
+                    edges {
+                      node {
+                        __typename
+                        ...programTile
                       }
                     }
                   }
                 }
-                fragment programTile on ProgramTile {
-                  id
-                  title
-                  description
-                  action {
-                    __typename
-                    ...action
-                  }
-                }
-                fragment action on Action {
-                  __typename
-                  ... on LinkAction {
-                    link
-                    linkType
-                    __typename
-                  }
-                }
-            """
-            payload = {
-                'operationName': 'Favs',
-                'variables': {
-                    'listId': 'dynamic:/vrtnu.model.json@favorites-list-video',
-                    'endCursor': '',
-                    'pageSize': 1000,
-                },
-                'query': graphql,
+              }
             }
-            from json import dumps
-            data = dumps(payload).encode('utf-8')
-            favorites_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
-        return favorites_json
+            fragment programTile on ProgramTile {
+              id
+              title
+              description
+              action {
+                __typename
+                ...action
+              }
+            }
+            fragment action on Action {
+              __typename
+              ... on LinkAction {
+                link
+                linkType
+                __typename
+              }
+            }
+        """
+        operation_name = 'Favs'
+        variables = {
+            'listId': 'dynamic:/vrtnu.model.json@favorites-list-video',
+            'endCursor': '',
+            'pageSize': 1000,
+        }
+        return api_req(graphql_query, operation_name, variables)
 
     def get_program_id_graphql(self, program_name):
         """Get programId from programName using GraphQL API"""
-        from tokenresolver import TokenResolver
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        program_id = None
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
-            }
-            graphql = """
-                query Page($id: ID!) {
-                  page(id: $id) {
-                    ... on IPage {
-                      id
-                    }
-                  }
+        from api import api_req
+        graphql_query = """
+            query Page($id: ID!) {
+              page(id: $id) {
+                ... on IPage {
+                  id
                 }
-            """
-            payload = {
-                'variables': {
-                    'id': '/vrtnu/a-z/{}.model.json'.format(program_name)
-                },
-                'query': graphql,
+              }
             }
-            from json import dumps
-            data = dumps(payload).encode('utf-8')
-            page_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
+        """
+        operation_name = 'Page'
+        variables = {
+            'id': '/vrtnu/a-z/{}.model.json'.format(program_name)
+        }
+        program_id = None
+        page_json = api_req(graphql_query, operation_name, variables)
+        if page_json:
             program_id = page_json.get('data').get('page').get('id')
         return program_id
 
     def set_favorite_graphql(self, program_id, title, is_favorite=True):
         """Set favorite using GraphQL API"""
-        from tokenresolver import TokenResolver
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        result_json = {}
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
+        from api import api_req
+        graphql_query = """
+            mutation setFavorite($input: FavoriteActionInput!) {
+              setFavorite(input: $input) {
+                __typename
+                id
+                favorite
+              }
             }
-            graphql_query = """
-                mutation setFavorite($input: FavoriteActionInput!) {
-                  setFavorite(input: $input) {
-                    __typename
-                    id
-                    favorite
-                  }
-                }
-            """
-            payload = {
-                'operationName': 'setFavorite',
-                'variables': {
-                    'input': {
-                        'id': program_id,
-                        'title': title,
-                        'favorite': is_favorite,
-                    },
-                },
-                'query': graphql_query,
-            }
-            from json import dumps
-            data = dumps(payload).encode('utf-8')
-            result_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
-        return result_json
+        """
+        operation_name = 'setFavorite'
+        variables = {
+            'input': {
+                'id': program_id,
+                'title': title,
+                'favorite': is_favorite,
+            },
+        }
+        return api_req(graphql_query, operation_name, variables)
 
     def is_favorite(self, program_name):
         """Is a program a favorite ?"""
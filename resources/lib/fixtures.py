@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Implements recording and replaying HTTP responses as fixtures, and routing requests to a local stand-in server
+
+This is a development aid, enabled by environment variables:
+ - VRTMAX_FIXTURES=record|replay to record responses to, or replay responses from a fixture store
+ - VRTMAX_FIXTURES_DIR to use another fixture store than tests/fixtures
+ - VRTMAX_STANDIN=http://127.0.0.1:8765 to send all requests to a stand-in server (see tests/standin.py)
+
+Recorded fixtures contain cookies and tokens, never publish fixtures recorded with real credentials.
+"""
+
+from __future__ import absolute_import, division, unicode_literals
+import os
+from io import BytesIO
+
+try:  # Python 3
+    from urllib.error import HTTPError
+    from urllib.parse import urlsplit
+    from urllib.request import BaseHandler
+    from urllib.response import addinfourl
+except ImportError:  # Python 2
+    from urllib import addinfourl
+    from urllib2 import BaseHandler, HTTPError
+    from urlparse import urlsplit
+
+FIXTURES_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, os.pardir, 'tests', 'fixtures'))
+GRAPHQL_DIR = 'graphql'
+SKIP_HEADERS = ('connection', 'content-encoding', 'content-length', 'keep-alive', 'transfer-encoding')
+
+
+def get_config(environ=None):
+    """Return the fixtures configuration from the environment"""
+    if environ is None:
+        environ = os.environ
+    return {
+        'mode': environ.get('VRTMAX_FIXTURES'),
+        'directory': environ.get('VRTMAX_FIXTURES_DIR') or FIXTURES_DIR,
+        'standin': environ.get('VRTMAX_STANDIN'),
+    }
+
+
+def get_handlers(environ=None):
+    """Return the urllib handlers for the configured fixtures mode"""
+    config = get_config(environ)
+    handlers = []
+    if config.get('standin'):
+        handlers.append(StandInHandler(config.get('standin')))
+    if config.get('mode') == 'record':
+        handlers.append(FixtureRecorder(config.get('directory')))
+    elif config.get('mode') == 'replay':
+        handlers.append(FixtureReplayer(config.get('directory')))
+    return handlers
+
+
+def digest(value):
+    """Return a short stable digest"""
+    from hashlib import sha1
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return sha1(value).hexdigest()[:10]
+
+
+def get_graphql_payload(data):
+    """Return the GraphQL payload of a request body, if any"""
+    if not data:
+        return None
+    from json import loads
+    try:
+        payload = loads(data.decode('utf-8') if isinstance(data, bytes) else data)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if isinstance(payload, dict) and payload.get('operationName'):
+        return payload
+    return None
+
+
+def fixture_name(url, data=None):
+    """Return the fixture name of a request, GraphQL requests are keyed by operation name and variables"""
+    import re
+    from json import dumps
+    payload = get_graphql_payload(data)
+    if payload:
+        variables = dumps(payload.get('variables') or {}, sort_keys=True)
+        name = '{dir}/{operation}.{digest}'.format(dir=GRAPHQL_DIR, operation=payload.get('operationName'), digest=digest(variables))
+    else:
+        parts = urlsplit(url)
+        name = parts.netloc + '/' + (parts.path.strip('/') or 'index')
+        if parts.query or data:
+            name += '.' + digest(parts.query.encode('utf-8') + (data or b''))
+    name = re.sub(r'[^\w./-]', '_', name).replace('..', '_')
+    if not name.endswith('.json'):
+        name += '.json'
+    return name
+
+
+def load_fixture(directory, name):
+    """Return a stored fixture, or None"""
+    from io import open as io_open
+    from json import load
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return None
+    with io_open(path, 'r', encoding='utf-8') as fdesc:
+        return load(fdesc)
+
+
+def save_fixture(directory, name, fixture):
+    """Store a fixture"""
+    from io import open as io_open
+    from json import dumps
+    path = os.path.join(directory, name)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with io_open(path, 'w', encoding='utf-8') as fdesc:
+        fdesc.write(dumps(fixture, indent=2, sort_keys=True, ensure_ascii=False))
+
+
+def fixture_body(fixture):
+    """Return the response body of a fixture as bytes"""
+    from json import dumps
+    if 'json' in fixture:
+        return dumps(fixture.get('json')).encode('utf-8')
+    return (fixture.get('text') or '').encode('utf-8')
+
+
+def build_headers(headers):
+    """Return a message object from a list of header name and value pairs"""
+    text = ''.join('{name}: {value}\r\n'.format(name=name, value=value) for name, value in headers) + '\r\n'
+    try:  # Python 3
+        from http.client import parse_headers
+        return parse_headers(BytesIO(text.encode('iso-8859-1')))
+    except ImportError:  # Python 2
+        from httplib import HTTPMessage
+        from StringIO import StringIO
+        return HTTPMessage(StringIO(text.encode('iso-8859-1')))
+
+
+def build_response(url, status, reason, headers, body):
+    """Return a urllib response from a fixture"""
+    response = addinfourl(BytesIO(body), build_headers(headers), url, status)
+    response.msg = reason
+    return response
+
+
+class StandInHandler(BaseHandler):
+    """Send all requests to a stand-in server, the original host becomes the first path component"""
+    handler_order = 100
+
+    def __init__(self, standin):
+        """Initialize the handler with the stand-in base url"""
+        self.standin = standin.rstrip('/')
+
+    def http_request(self, request):
+        """Rewrite the request url"""
+        parts = urlsplit(request.get_full_url())
+        if not request.get_full_url().startswith(self.standin):
+            request.full_url = '{standin}/{host}{path}{query}'.format(
+                standin=self.standin, host=parts.netloc, path=parts.path or '/', query='?' + parts.query if parts.query else '')
+        return request
+
+    https_request = http_request
+
+
+class FixtureReplayer(BaseHandler):
+    """Serve responses from a fixture store instead of the network"""
+    handler_order = 100  # Before the HTTP(S) handlers open a connection
+
+    def __init__(self, directory):
+        """Initialize the handler with a fixture store"""
+        self.directory = directory
+
+    def http_open(self, request):
+        """Return a stored response, or an HTTP 404 error if there is none"""
+        url = request.get_full_url()
+        name = fixture_name(url, request.data)
+        fixture = load_fixture(self.directory, name)
+        if fixture is None:
+            raise HTTPError(url, 404, 'No fixture {name}'.format(name=name), build_headers([]), BytesIO())
+        return build_response(url, fixture.get('status', 200), fixture.get('reason', 'OK'), fixture.get('headers', []), fixture_body(fixture))
+
+    https_open = http_open
+
+
+class FixtureRecorder(BaseHandler):
+    """Store (decompressed) responses in a fixture store"""
+    handler_order = 995  # After ContentDecoding, before HTTPErrorProcessor
+
+    def __init__(self, directory):
+        """Initialize the handler with a fixture store"""
+        self.directory = directory
+
+    def http_response(self, request, response):
+        """Store a response and return a copy of it"""
+        from json import loads
+        url = request.get_full_url()
+        body = response.read()
+        response.close()
+        headers = [(name, value) for name, value in response.info().items() if name.lower() not in SKIP_HEADERS]
+        status = response.getcode()
+        reason = getattr(response, 'msg', None) or getattr(response, 'reason', None) or ''
+        fixture = {'url': url.split('?')[0], 'status': status, 'reason': reason, 'headers': headers}
+        try:
+            fixture['json'] = loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            fixture['text'] = body.decode('utf-8', 'replace')
+        save_fixture(self.directory, fixture_name(url, request.data), fixture)
+        return build_response(url, status, reason, headers, body)
+
+    https_response = http_response
@@ -128,3 +128,411 @@ EPISODE_TILE = """
       }
     }
 """
+
+LATEST_EPISODE_QUERY = """
+    query VideoProgramPage($pageId: ID!, $lazyItemCount: Int = 500, $after: ID) {
+      page(id: $pageId) {
+        ... on ProgramPage {
+          components {
+            __typename
+            ... on PageHeader {
+              mostRelevantEpisodeTile {
+                __typename
+                title
+                tile {
+                  ...episodeTile
+                  __typename
+                }
+                __typename
+              }
+              __typename
+            }
+            ... on ContainerNavigation {
+              items {
+                title
+                components {
+                  __typename
+                  ... on PaginatedTileList {
+                    __typename
+                    paginatedItems(first: $lazyItemCount, after: $after) {
+                      __typename
+                      edges {
+                        __typename
+                        cursor
+                        node {
+                          __typename
+                          ... on EpisodeTile {
+                            id
+                            description
+                            ...episodeTile
+                          }
+                        }
+                      }
+                    }
+                  }
+                  ... on ContainerNavigation {
+                    items {
+                      title
+                      components {
+                        __typename
+                        ... on PaginatedTileList {
+                          __typename
+                          paginatedItems(first: $lazyItemCount, after: $after) {
+                            __typename
+                            edges {
+                              __typename
+                              cursor
+                              node {
+                                __typename
+                                ... on EpisodeTile {
+                                  id
+                                  description
+                                  ...episodeTile
+                                }
+                              }
+                            }
+                          }
+                        }
+                      }
+                    }
+                    __typename
+                  }
+                }
+                __typename
+              }
+              __typename
+            }
+          }
+          __typename
+        }
+        __typename
+      }
+    }
+    %s
+""" % EPISODE_TILE
+
+SEASONS_QUERY = """
+    query VideoProgramPage(
+      $pageId: ID!) {
+      page(id: $pageId) {
+        ... on ProgramPage {
+          id
+          permalink
+          components {
+            __typename
+            ... on PageHeader {
+              mostRelevantEpisodeTile {
+                __typename
+                title
+                tile {
+                  ...episodeTile
+                  __typename
+                }
+                __typename
+              }
+              __typename
+            }
+            ... on PaginatedTileList {
+              __typename
+              id: objectId
+              objectId
+              listId
+              title
+              tileContentType
+            }
+            ... on ContainerNavigation {
+              id: objectId
+              navigationType
+              items {
+                id: objectId
+                title
+                active
+                components {
+                  __typename
+                  ... on PaginatedTileList {
+                    __typename
+                    id: objectId
+                    objectId
+                    listId
+                    title
+                    tileContentType
+                  }
+                  ... on StaticTileList {
+                    __typename
+                    id: objectId
+                    objectId
+                    listId
+                    title
+                    tileContentType
+                  }
+                  ... on LazyTileList {
+                    __typename
+                    id: objectId
+                    objectId
+                    listId
+                    title
+                    tileContentType
+                  }
+                  ... on IComponent {
+                    ... on ContainerNavigation {
+                      id: objectId
+                      navigationType
+                      items {
+                        id: objectId
+                        title
+                        components {
+                          __typename
+                          ... on Component {
+                            ... on PaginatedTileList {
+                              __typename
+                              id: objectId
+                              objectId
+                              listId
+                              title
+                              tileContentType
+                            }
+                            ... on StaticTileList {
+                              __typename
+                              id: objectId
+                              objectId
+                              listId
+                              title
+                              tileContentType
+                            }
+                            ... on LazyTileList {
+                              __typename
+                              id: objectId
+                              objectId
+                              listId
+                              title
+                              tileContentType
+                            }
+                            __typename
+                          }
+                        }
+                        __typename
+                      }
+                      __typename
+                    }
+                    __typename
+                  }
+                }
+                __typename
+              }
+              __typename
+            }
+            __typename
+          }
+          __typename
+        }
+        __typename
+      }
+    }
+    %s
+""" % EPISODE_TILE
+
+LISTED_EPISODES_QUERY = """
+    query ListedEpisodes(
+      $listId: ID!
+      $endCursor: ID!
+      $pageSize: Int!
+    ) {
+      list(listId: $listId) {
+        __typename
+        ... on %(list_type)s {
+          paginated: paginatedItems(first: $pageSize, after: $endCursor) {
+            edges {
+              node {
+                __typename
+                ...episodeTile
+              }
+            }
+            pageInfo {
+              startCursor
+              endCursor
+              hasNextPage
+              hasPreviousPage
+              __typename
+            }
+          }
+        }
+      }
+    }
+    %(fragments)s
+"""
+
+PAGINATED_PROGRAMS_QUERY = """
+    query PaginatedPrograms(
+      $listId: ID!
+      $endCursor: ID!
+      $pageSize: Int!
+    ) {
+      list(listId: $listId) {
+        __typename
+        ... on %(list_type)s {
+          paginated: paginatedItems(first: $pageSize, after: $endCursor) {
+            edges {
+              node {
+                __typename
+                ...ep
+              }
+            }
+            pageInfo {
+              startCursor
+              endCursor
+              hasNextPage
+              hasPreviousPage
+              __typename
+            }
+          }
+        }
+      }
+    }
+    fragment ep on ProgramTile {
+      __typename
+      objectId
+      id
+      link
+      tileType
+      image {
+        alt
+        templateUrl
+      }
+      title
+      program {
+        title
+        id
+        link
+        programType
+        description
+        shortDescription
+        subtitle
+        announcementType
+        announcementValue
+        whatsonId
+        image {
+          alt
+          templateUrl
+        }
+        posterImage {
+          alt
+          templateUrl
+        }
+        favoriteAction {
+          favorite
+          id
+          title
+        }
+      }
+    }
+"""
+
+# Lists are paginated or static, static lists have static:/ list ids
+LIST_TYPES = ('PaginatedTileList', 'StaticTileList')
+
+# Every list type variant of the list queries, built once
+LISTED_EPISODES_QUERIES = {list_type: LISTED_EPISODES_QUERY % {'list_type': list_type, 'fragments': EPISODE_TILE} for list_type in LIST_TYPES}
+PAGINATED_PROGRAMS_QUERIES = {list_type: PAGINATED_PROGRAMS_QUERY % {'list_type': list_type} for list_type in LIST_TYPES}
+
+# The canonical fields of an episode, a field is a name or a (name, subfields) tuple
+EPISODE_FIELDS = (
+    '__typename',
+    'id',
+    'title',
+    'description',
+    'episodeNumberRaw',
+    'durationSeconds',
+    'offTimeRaw',
+    'onTimeRaw',
+    ('image', ('alt', 'templateUrl')),
+    ('analytics', ('airDate', 'categories')),
+    ('program', (
+        'id',
+        'title',
+        'link',
+        'programType',
+        ('image', ('alt', 'templateUrl')),
+        ('posterImage', ('alt', 'templateUrl')),
+    )),
+    ('season', ('titleRaw',)),
+    ('watchAction', (
+        'avodUrl',
+        'completed',
+        'resumePoint',
+        'resumePointTotal',
+        'resumePointProgress',
+        'resumePointTitle',
+        'episodeId',
+        'videoId',
+        'publicationId',
+        'streamId',
+    )),
+    ('favoriteAction', ('favorite', 'id', 'title')),
+    ('nextUp', (
+        'title',
+        'autoPlay',
+        'countdown',
+        ('tile', ('__typename', '...episodeTile')),
+    )),
+)
+
+# The episode fields needed per use case as dotted paths into EPISODE_FIELDS, None selects all fields
+EPISODE_PROJECTIONS = {
+    'PlayerData': None,
+    'ResumePoint': ('id', 'watchAction.videoId', 'watchAction.resumePointTitle'),
+    'Stream': ('watchAction.videoId', 'watchAction.publicationId'),
+    'UpNext': ('id', 'title', 'description', 'episodeNumberRaw', 'durationSeconds', 'image', 'analytics.airDate',
+               'program.id', 'program.title', 'program.image', 'program.posterImage', 'season', 'nextUp'),
+}
+
+EPISODE_QUERY = """
+    query %s($id: ID!) {
+      catalogMember(id: $id) {
+        __typename
+        ...episode
+      }
+    }
+    fragment episode on Episode {
+%s
+    }
+"""
+
+_EPISODE_QUERIES = {}
+
+
+def select_fields(fields, paths=None, indent='  '):
+    """Return the GraphQL selection of the fields matching dotted paths, a path selects a field with all its subfields"""
+    lines = []
+    for field in fields:
+        name, subfields = field if isinstance(field, tuple) else (field, None)
+        subpaths = None
+        if paths is not None and name not in paths:
+            subpaths = [path[len(name) + 1:] for path in paths if path.startswith(name + '.')]
+            if not subpaths or not subfields:
+                continue
+        if subfields:
+            lines.append('{indent}{name} {{'.format(indent=indent, name=name))
+            lines.append(select_fields(subfields, subpaths, indent + '  '))
+            lines.append('{indent}}}'.format(indent=indent))
+        else:
+            lines.append(indent + name)
+    return '\n'.join(lines)
+
+
+def get_episode_query(operation_name):
+    """Return the query of an episode projection, generated once per process"""
+    graphql_query = _EPISODE_QUERIES.get(operation_name)
+    if graphql_query is None:
+        selection = select_fields(EPISODE_FIELDS, EPISODE_PROJECTIONS.get(operation_name), indent=' ' * 6)
+        graphql_query = EPISODE_QUERY % (operation_name, selection)
+        if '...episodeTile' in selection:
+            graphql_query += EPISODE_TILE
+        _EPISODE_QUERIES[operation_name] = graphql_query
+    return graphql_query
+
+
+def get_list_type(list_id):
+    """Return the GraphQL type of a list"""
+    if list_id.startswith('static:/'):
+        return 'StaticTileList'
+    return 'PaginatedTileList'
@@ -5,8 +5,9 @@
 from __future__ import absolute_import, division, unicode_literals
 
 
-class ApiData:
+class ApiData(object):  # pylint: disable=useless-object-inheritance
     """This helper object holds all media information"""
+    __slots__ = ('client', 'media_api_url', 'video_id', 'publication_id', 'is_live_stream')
 
     def __init__(self, client, media_api_url, video_id, publication_id, is_live_stream):
         """The constructor for the ApiData class"""
@@ -17,8 +18,32 @@ class ApiData:
         self.is_live_stream = is_live_stream
 
 
-class StreamURLS:
+class GraphQLQuery(object):  # pylint: disable=useless-object-inheritance
+    """This helper object holds a GraphQL query with its persisted query hash and serialized payload prefixes"""
+    __slots__ = ('query', 'operation_name', 'hash', 'is_mutation', 'prefixes')
+
+    def __init__(self, query, operation_name):
+        """The constructor for the GraphQLQuery class"""
+        from hashlib import sha256
+        from json import dumps
+        self.query = query
+        self.operation_name = operation_name
+        self.hash = sha256(query.encode('utf-8')).hexdigest()
+        self.is_mutation = query.lstrip().startswith('mutation')
+        operation = '{"operationName": %s, ' % dumps(operation_name)
+        extensions = '"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "%s"}}, ' % self.hash
+        text = '"query": %s, ' % dumps(query)
+        # A payload is a prefix followed by the serialized variables and a closing brace
+        self.prefixes = {
+            'query': operation + text + '"variables": ',
+            'persisted': operation + extensions + '"variables": ',
+            'register': operation + extensions + text + '"variables": ',
+        }
+
+
+class StreamURLS(object):  # pylint: disable=useless-object-inheritance
     """This helper object holds all information to be used when playing streams"""
+    __slots__ = ('stream_url', 'subtitle_url', 'license_url', 'license_headers', 'use_inputstream_adaptive', 'video_id')
 
     def __init__(self, stream_url, subtitle_url=None, license_url=None, license_headers=None, use_inputstream_adaptive=False):
         """The constructor for the StreamURLS class"""
@@ -30,8 +55,9 @@ class StreamURLS:
         self.video_id = None
 
 
-class TitleItem:
+class TitleItem(object):  # pylint: disable=useless-object-inheritance
     """This helper object holds all information to be used with Kodi xbmc's ListItem object"""
+    __slots__ = ('label', 'path', 'art_dict', 'info_dict', 'stream_dict', 'prop_dict', 'context_menu', 'is_playable')
 
     def __init__(self, label, path=None, art_dict=None, info_dict=None, stream_dict=None, prop_dict=None, context_menu=None, is_playable=False):
         """The constructor for the TitleItem class"""
@@ -7,6 +7,8 @@ from contextlib import contextmanager
 from sys import version_info
 from socket import timeout
 from ssl import SSLError
+from string import Formatter
+from threading import local
 
 import xbmc
 import xbmcplugin
@@ -18,16 +20,51 @@ except ImportError:  # Kodi 19 alpha 1 and lower
 
 from xbmcaddon import Addon
 from utils import from_unicode, to_unicode
+import tracing
 
 try:  # Python 3
     from urllib.parse import quote, urlencode
-    from urllib.request import HTTPErrorProcessor
+    from urllib.error import HTTPError
+    from urllib.request import BaseHandler, HTTPErrorProcessor
 except ImportError:  # Python 2
     from urllib import urlencode
-    from urllib2 import quote, HTTPErrorProcessor
+    from urllib2 import quote, BaseHandler, HTTPError, HTTPErrorProcessor
 
 ADDON = Addon()
+FORMATTER = Formatter()
 DEFAULT_CACHE_DIR = 'cache'
+VALIDATORS_CACHE_DIR = 'validators'
+CACHE_DB = 'cache.db'
+CACHE_DB_VERSION = 3
+CACHE_DB_TAGS = (DEFAULT_CACHE_DIR, VALIDATORS_CACHE_DIR)  # Cache entries are tagged with the cache directory they replace
+CACHE_ACCESS_INTERVAL = 60  # Only record the access time of a cache entry once a minute, to avoid a write for every read
+CACHE_BUDGET = 50  # The default cache size budget in MB
+CACHE_BUDGET_TARGET = 0.9  # Evict cache entries until the cache uses 90% of its budget, so not every write evicts
+CACHE_UNUSED_TIME = 30 * 24 * 60 * 60  # Remove cache entries that have not been used for 30 days
+CACHE_GC_INTERVAL = 60 * 60  # Collect cache garbage once an hour
+CACHE_GC_IDLE_TIME = 5 * 60  # Only collect cache garbage when Kodi is idle for 5 minutes
+CACHE_STALE_TIME = 24 * 60 * 60  # Serve cache entries up to a day past their ttl while they are refreshed in the background
+NETWORK_CONFIG_TTL = 5 * 60
+READ_CHUNK_SIZE = 64 * 1024
+SINGLE_FLIGHT_TIMEOUT = 10
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+CIRCUIT_FAILURES = 3
+CIRCUIT_OPEN_TIME = 30
+TEMPLATES_CACHE_SIZE = 1024
+PREFETCH_DEPTH = 1  # The number of next pages of a listing to render in the background
+PREFETCH_SIZE = 2 * 1024 * 1024  # Stop prefetching a listing after this many bytes
+PREFETCH_DESTINATIONS = ('categories', 'favorites_offline', 'favorites_programs', 'favorites_recent', 'featured', 'offline', 'programs', 'recent',
+                         'resumepoints_continue')  # The paginated listings that are cached pre-rendered
+
+_STRINGS = {}  # Localized strings, per process
+_TEMPLATES = {}  # Parsed label templates, per process
+_SETTINGS = {}  # Add-on settings, per invocation
+_CACHE_DB = local()  # SQLite cache store connections, per thread
+_CIRCUITS = {}  # Consecutive failures and open circuits, per host
+_PERSISTED_QUERIES = {}  # Maps persisted GraphQL query hashes to whether they are mutations
+_PREFETCH = local()  # The listing the service is rendering in the background, per thread
+_DIALOGS = local()  # OK dialogs collected instead of shown, per thread
 
 SORT_METHODS = {
     # 'date': xbmcplugin.SORT_METHOD_DATE,
@@ -104,6 +141,94 @@ class NoRedirection(HTTPErrorProcessor):
     https_response = http_response
 
 
+class ContentDecoding(BaseHandler):
+    """Negotiate compressed transfers and decompress response bodies while they are being read"""
+    handler_order = 990  # Before HTTPErrorProcessor, so HTTP error bodies are decompressed as well
+
+    @staticmethod
+    def http_request(request):
+        """Accept gzip and deflate content encodings"""
+        if not request.has_header('Accept-encoding'):
+            request.add_unredirected_header('Accept-Encoding', 'gzip, deflate')
+        return request
+
+    @staticmethod
+    def http_response(request, response):  # pylint: disable=unused-argument
+        """Wrap compressed responses"""
+        tracing.update(status=response.getcode())
+        encoding = (response.info().get('Content-Encoding') or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            return DecodedResponse(response, encoding)
+        return response
+
+    https_request = http_request
+    https_response = http_response
+
+
+class DecodedResponse:
+    """A file-like wrapper that incrementally decompresses a gzip or deflate encoded response"""
+
+    def __init__(self, response, encoding='gzip'):
+        """Initialize the decompressor for the given content encoding"""
+        import zlib
+        self._response = response
+        self._encoding = encoding
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding in ('gzip', 'x-gzip') else zlib.MAX_WBITS)
+        self._buffer = b''
+        self._eof = False
+        self.bytes_received = 0
+
+    def __getattr__(self, name):
+        """Delegate everything else (info, getcode, headers, close, ...) to the original response"""
+        return getattr(self._response, name)
+
+    def _decompress(self, chunk):
+        """Decompress a chunk, accept raw deflate streams as sent by some servers"""
+        import zlib
+        try:
+            return self._decompressor.decompress(chunk)
+        except zlib.error:
+            if self._encoding != 'deflate' or self.bytes_received != len(chunk):
+                raise
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(chunk)
+
+    def _fill(self, size=None):
+        """Decompress data until size bytes are buffered or the response is exhausted"""
+        while not self._eof and (size is None or len(self._buffer) < size):
+            chunk = self._response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                self._buffer += self._decompressor.flush()
+                self._eof = True
+                break
+            self.bytes_received += len(chunk)
+            self._buffer += self._decompress(chunk)
+
+    def read(self, amt=None):
+        """Return up to amt decompressed bytes, or everything when amt is not given"""
+        if amt is None or amt < 0:
+            self._fill()
+            data, self._buffer = self._buffer, b''
+            return data
+        self._fill(amt)
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def readline(self, limit=-1):
+        """Return a single decompressed line"""
+        while b'\n' not in self._buffer and not self._eof and (limit < 0 or len(self._buffer) < limit):
+            self._fill(len(self._buffer) + 1)
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if 0 <= limit < end:
+            end = limit
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+    def __iter__(self):
+        """Iterate over decompressed lines"""
+        return iter(self.readline, b'')
+
+
 class SafeDict(dict):
     """A safe dictionary implementation that does not break down on missing keys"""
     def __missing__(self, key):
@@ -147,20 +272,158 @@ def addon_profile():
 
 
 def url_for(name, *args, **kwargs):
-    """Wrapper for routing.url_for() to lookup by name"""
+    """Build a plugin URL by view function name from the route templates, like routing.url_for() does"""
+    base_url, templates = get_route_templates()
+    for pattern, positional, keywords in templates.get(name, ()):
+        path = make_route_path(pattern, positional, keywords, args, kwargs)
+        if path is not None:
+            return base_url + (path if path.startswith('/') else '/' + path)
+    # Let routing raise its RoutingError
     import addon
     return addon.plugin.url_for(getattr(addon, name), *args, **kwargs)
 
 
-def show_listing(list_items, category=None, sort='unsorted', ascending=True, content=None, cache=None, selected=None):
-    """Show a virtual directory in Kodi"""
+def get_route_templates():
+    """Return the base URL and the URL templates of the plugin routes by view function name, and use a static variable to remember"""
+    cached = getattr(get_route_templates, 'cached', None)
+    if cached is None:
+        import re
+        import addon
+        templates = {}
+        try:
+            # These are routing internals, without them url_for() falls back to plugin.url_for()
+            for func, rules in addon.plugin._rules.items():  # pylint: disable=protected-access
+                templates[func.__name__] = [
+                    (rule._pattern, re.sub(r'{[A-z_][A-z0-9_]*}', r'%s', rule._pattern), set(rule._keywords))  # pylint: disable=protected-access
+                    for rule in rules
+                ]
+        except AttributeError as exc:
+            log(2, 'Cannot read route templates, use routing to build URLs: {error}', error=exc)
+            templates = {}
+        cached = get_route_templates.cached = (addon.plugin.base_url, templates)
+    return cached
+
+
+def make_route_path(pattern, positional, keywords, args, kwargs):
+    """Return the path of a route template for the given arguments, or None when they do not fit, like routing.UrlRule.make_path()"""
+    if args and kwargs:
+        return None
+    if args:
+        try:
+            return positional % args
+        except TypeError:
+            return None
+    # Path arguments are used as-is, other arguments go to the query string
+    url_kwargs = {}
+    qs_kwargs = {}
+    for key, value in kwargs.items():
+        if key in keywords:
+            url_kwargs[key] = value
+        else:
+            qs_kwargs[key] = value
+    query = '?' + urlencode(qs_kwargs) if qs_kwargs else ''
+    try:
+        return pattern.format(**url_kwargs) + query
+    except KeyError:
+        return None
+
+
+def get_listing_cache_file(path=None):
+    """Return the pre-rendered listing cache file of a plugin path, by default the current one, scoped to the user"""
+    from hashlib import md5
+    if path is None:
+        path = getattr(_PREFETCH, 'path', None)
+    if path is None:
+        from addon import plugin
+        path = plugin.path
+    key = '{path}|{credentials}'.format(path=path, credentials=get_cached_setting('credentials_hash'))
+    return 'listing.{key}.json'.format(key=md5(key.encode('utf-8')).hexdigest())
+
+
+def is_prefetching():
+    """Whether a listing is being rendered in the background by the service"""
+    return getattr(_PREFETCH, 'path', None) is not None
+
+
+def prefetch_listing(destination, **kwargs):
+    """Ask the service to render a listing into the listing cache in the background, e.g. the next page behind 'More...'"""
+    if destination not in PREFETCH_DESTINATIONS:
+        return
+    if not get_cached_setting_bool('prefetch', default=True) or not get_cached_setting_bool('usehttpcaching', default=True):
+        return
+    if is_prefetching():
+        # The service renders the next page itself, up to PREFETCH_DEPTH pages
+        _PREFETCH.next_page = (destination, kwargs)
+        return
+    notify(sender=addon_id() + '.SIGNAL', message='prefetch', data={'destination': destination, 'kwargs': kwargs})
+
+
+def render_listing(destination, **kwargs):
+    """Render a listing into the listing cache without showing it, returns its next page and its size in bytes"""
+    try:  # Python 3
+        from urllib.parse import urlsplit
+    except ImportError:  # Python 2
+        from urlparse import urlsplit
+    import addon
+    _PREFETCH.path = urlsplit(url_for(destination, **kwargs)).path
+    _PREFETCH.next_page = None
+    _PREFETCH.size = 0
+    try:
+        getattr(addon, destination)(**kwargs)
+    finally:
+        _PREFETCH.path = None
+    return _PREFETCH.next_page, _PREFETCH.size
+
+
+def prefetch_listings(destination, kwargs, depth=PREFETCH_DEPTH, size=PREFETCH_SIZE):
+    """Render a listing and its next pages into the listing cache, up to a number of pages and bytes"""
+    rendered = 0
+    for _ in range(depth):
+        next_page, listing_size = render_listing(destination, **kwargs)
+        rendered += listing_size
+        log(3, 'Prefetched listing {destination} {kwargs}', destination=destination, kwargs=kwargs)
+        if next_page is None or rendered >= size:
+            return
+        destination, kwargs = next_page
+
+
+def show_cached_listing(ttl):  # pylint: disable=redefined-outer-name
+    """Show the pre-rendered listing of the current plugin path from cache, returns False if there is none"""
+    if is_prefetching():
+        # Render the listing again to find its next page
+        return False
+    listing = get_cache(get_listing_cache_file(), ttl=ttl)
+    if not listing:
+        return False
+    from helperobjects import TitleItem
+    title_items = (TitleItem(**dict(item, context_menu=[tuple(menu_item) for menu_item in item.get('context_menu') or []]))
+                   for item in listing.pop('items'))
+    show_listing(title_items, **listing)
+    return True
+
+
+def show_listing(list_items, category=None, sort='unsorted', ascending=True, content=None, cache=None, selected=None, cache_listing=False):
+    """Show a virtual directory in Kodi, a listing is cached pre-rendered for show_cached_listing() if cache_listing is True"""
     from xbmcgui import ListItem
     from addon import plugin
 
+    # Remember the arguments to show a pre-rendered listing again
+    listing_args = {'category': category, 'sort': sort, 'ascending': ascending, 'content': content, 'cache': cache}
+    rendered_items = [] if cache_listing else None
+
+    if is_prefetching():
+        # There is no directory to show a listing in from the service, only store it pre-rendered
+        if cache_listing:
+            from json import dumps
+            listing = dumps(dict(listing_args, items=[{key: getattr(title_item, key) for key in title_item.__slots__} for title_item in list_items]))
+            _PREFETCH.size = len(listing)
+            update_cache(get_listing_cache_file(), listing)
+        return
+
     set_property('container.url', 'plugin://' + addon_id() + plugin.path)
     xbmcplugin.setPluginFanart(handle=plugin.handle, image=from_unicode(addon_fanart()))
 
-    usemenucaching = get_setting_bool('usemenucaching', default=True)
+    usemenucaching = get_cached_setting_bool('usemenucaching', default=True)
     if cache is None:
         cache = usemenucaching
     elif usemenucaching is False:
@@ -190,7 +453,7 @@ def show_listing(list_items, category=None, sort='unsorted', ascending=True, con
         sort = 'unsorted'
 
     # NOTE: When showing tvshow listings and 'showoneoff' was set, force 'unsorted'
-    if get_setting_bool('showoneoff', default=True) and sort == 'label' and content == 'tvshows':
+    if get_cached_setting_bool('showoneoff', default=True) and sort == 'label' and content == 'tvshows':
         sort = 'unsorted'
 
     # Add all sort methods to GUI (start with preferred)
@@ -208,7 +471,7 @@ def show_listing(list_items, category=None, sort='unsorted', ascending=True, con
 #        xbmcplugin.setProperty(handle=plugin.handle, key='sort.order', value=str(SORT_METHODS['unsorted']))
 
     listing = []
-    showfanart = get_setting_bool('showfanart', default=True)
+    showfanart = get_cached_setting_bool('showfanart', default=True)
     for title_item in list_items:
         # Three options:
         #  - item is a virtual directory/folder (not playable, path)
@@ -261,6 +524,9 @@ def show_listing(list_items, category=None, sort='unsorted', ascending=True, con
         if title_item.path:
             url = title_item.path
 
+        if rendered_items is not None:
+            rendered_items.append({key: getattr(title_item, key) for key in title_item.__slots__})
+
         listing.append((url, list_item, is_folder))
 
     # Jump to specific item
@@ -273,6 +539,10 @@ def show_listing(list_items, category=None, sort='unsorted', ascending=True, con
     succeeded = xbmcplugin.addDirectoryItems(plugin.handle, listing, len(listing))
     xbmcplugin.endOfDirectory(plugin.handle, succeeded, updateListing=False, cacheToDisc=cache)
 
+    if rendered_items and succeeded:
+        from json import dumps
+        update_cache(get_listing_cache_file(), dumps(dict(listing_args, items=rendered_items)))
+
 
 def play(stream, video=None):
     """Create a virtual directory listing to play its only item"""
@@ -358,7 +628,11 @@ def generate_ia_license_key(license_url, license_headers='', postdata_type='R',
 
 
 def ok_dialog(heading='', message=''):
-    """Show Kodi's OK dialog"""
+    """Show Kodi's OK dialog, or collect it when the current thread defers its dialogs"""
+    pending = getattr(_DIALOGS, 'pending', None)
+    if pending is not None:
+        pending.append((heading, message))
+        return True
     from xbmcgui import Dialog
     if not heading:
         heading = addon_name()
@@ -367,6 +641,25 @@ def ok_dialog(heading='', message=''):
     return Dialog().ok(heading=heading, message=message)
 
 
+@contextmanager
+def deferred_dialogs(dialogs):
+    """Collect the OK dialogs of the current thread in a list instead of showing them"""
+    previous = getattr(_DIALOGS, 'pending', None)
+    _DIALOGS.pending = dialogs
+    try:
+        yield
+    finally:
+        _DIALOGS.pending = previous
+
+
+def textviewer(heading='', text=''):
+    """Show Kodi's text viewer dialog"""
+    from xbmcgui import Dialog
+    if not heading:
+        heading = addon_name()
+    return Dialog().textviewer(heading=heading, text=text)
+
+
 def notification(heading='', message='', icon='info', time=4000):
     """Show a Kodi notification"""
     from xbmcgui import Dialog
@@ -409,9 +702,36 @@ def localize(string_id, **kwargs):
     if not isinstance(string_id, int) and not string_id.isdecimal():
         return string_id
     if kwargs:
-        from string import Formatter
-        return Formatter().vformat(ADDON.getLocalizedString(string_id), (), SafeDict(**kwargs))
-    return ADDON.getLocalizedString(string_id)
+        return format_template(get_localized_string(string_id), **kwargs)
+    return get_localized_string(string_id)
+
+
+def get_localized_string(string_id):
+    """Return a string from the .po language files, look it up in Kodi only once per process"""
+    string = _STRINGS.get(string_id)
+    if string is None:
+        string = _STRINGS[string_id] = ADDON.getLocalizedString(string_id)
+    return string
+
+
+def format_template(template, **kwargs):
+    """Format a template like string.Formatter().vformat() with a SafeDict, parse every template only once per process"""
+    fields = _TEMPLATES.get(template)
+    if fields is None:
+        fields = list(FORMATTER.parse(template))
+        if len(_TEMPLATES) < TEMPLATES_CACHE_SIZE:
+            _TEMPLATES[template] = fields
+    values = SafeDict(**kwargs)
+    parts = []
+    for literal, field_name, format_spec, conversion in fields:
+        parts.append(literal)
+        if field_name is None:
+            continue
+        if format_spec and '{' in format_spec:  # Nested replacement fields
+            format_spec = format_template(format_spec, **kwargs)
+        value = FORMATTER.convert_field(FORMATTER.get_field(field_name, (), values)[0], conversion)
+        parts.append(FORMATTER.format_field(value, format_spec))
+    return ''.join(parts)
 
 
 def localize_time(time):
@@ -518,13 +838,43 @@ def get_setting_float(key, default=None):
         return default
 
 
+def get_cached_setting(key, default=None):
+    """Get an add-on setting as string, read only once per invocation"""
+    return get_settings_snapshot(get_setting, key, default)
+
+
+def get_cached_setting_bool(key, default=None):
+    """Get an add-on setting as boolean, read only once per invocation"""
+    return get_settings_snapshot(get_setting_bool, key, default)
+
+
+def get_cached_setting_int(key, default=None):
+    """Get an add-on setting as integer, read only once per invocation"""
+    return get_settings_snapshot(get_setting_int, key, default)
+
+
+def get_settings_snapshot(getter, key, default):
+    """Return a setting from the snapshot of this invocation, read it from Kodi on first use"""
+    snapshot_key = (getter.__name__, key, default)
+    if snapshot_key not in _SETTINGS:
+        _SETTINGS[snapshot_key] = getter(key, default)
+    return _SETTINGS.get(snapshot_key)
+
+
+def invalidate_settings():
+    """Forget the settings snapshot, the next reads come from Kodi again"""
+    _SETTINGS.clear()
+
+
 def set_setting(key, value):
     """Set an add-on setting"""
+    invalidate_settings()
     return ADDON.setSetting(key, from_unicode(str(value)))
 
 
 def set_setting_bool(key, value):
     """Set an add-on setting as boolean"""
+    invalidate_settings()
     try:
         return ADDON.setSettingBool(key, value)
     except (AttributeError, TypeError):  # On Krypton or older, or when not a boolean
@@ -537,6 +887,7 @@ def set_setting_bool(key, value):
 
 def set_setting_int(key, value):
     """Set an add-on setting as integer"""
+    invalidate_settings()
     try:
         return ADDON.setSettingInt(key, value)
     except (AttributeError, TypeError):  # On Krypton or older, or when not an integer
@@ -545,6 +896,7 @@ def set_setting_int(key, value):
 
 def set_setting_float(key, value):
     """Set an add-on setting"""
+    invalidate_settings()
     try:
         return ADDON.setSettingNumber(key, value)
     except (AttributeError, TypeError):  # On Krypton or older, or when not a float
@@ -554,6 +906,7 @@ def set_setting_float(key, value):
 def open_settings():
     """Open the add-in settings window, shows Credentials"""
     ADDON.openSettings()
+    invalidate_settings()
 
 
 def get_global_setting(key):
@@ -660,6 +1013,11 @@ def has_socks():
 
 
 def get_proxies():
+    """Return a usable proxies dictionary from the cached network configuration"""
+    return get_network_config().get('proxies')
+
+
+def resolve_proxies():
     """Return a usable proxies dictionary from Kodi proxy settings"""
     usehttpproxy = get_global_setting('network.usehttpproxy')
     if usehttpproxy is not True:
@@ -701,6 +1059,84 @@ def get_proxies():
     return {'http': proxy_address, 'https': proxy_address}
 
 
+def get_network_config():
+    """Return the proxy and opener configuration, and use a static variable to remember"""
+    from time import time
+    config = getattr(get_network_config, 'cached', None)
+    stamp = get_property('vrtmax_network_config', default='')
+    if config and config.get('stamp') == stamp:
+        if config.get('expires') > time():
+            return config
+        # Only the Kodi proxy settings need to be read again, keep the idle connections
+        pool = config.get('pool')
+    else:
+        if config:
+            config.get('pool').clear()
+        from connectionpool import ConnectionPool
+        pool = ConnectionPool(
+            max_connections=get_setting_int('httpmaxconnections', default=4),
+            idle_timeout=get_setting_int('httpidletimeout', default=30),
+        )
+
+    get_network_config.cached = {
+        'proxies': resolve_proxies(),
+        'pool': pool,
+        'openers': {},
+        'stamp': stamp,
+        # Kodi does not notify add-ons about changes to its network settings
+        'expires': time() + NETWORK_CONFIG_TTL,
+    }
+    return get_network_config.cached
+
+
+def invalidate_network_config():
+    """Invalidate the proxy and opener configuration of all add-on processes"""
+    from time import time
+    if hasattr(get_network_config, 'cached'):
+        get_network_config.cached.get('pool').clear()
+        del get_network_config.cached
+    set_property('vrtmax_network_config', str(time()))
+
+
+def get_connection_pool():
+    """Return the keep-alive connection pool"""
+    return get_network_config().get('pool')
+
+
+def get_opener(follow_redirects=True, cookiejar=None):
+    """Return a urllib opener, reuse it when no cookiejar is needed"""
+    try:  # Python 3
+        from urllib.request import build_opener, HTTPCookieProcessor, ProxyHandler
+    except ImportError:  # Python 2
+        from urllib2 import build_opener, HTTPCookieProcessor, ProxyHandler
+
+    config = get_network_config()
+    openers = config.get('openers')
+    if cookiejar is None and follow_redirects in openers:
+        return openers.get(follow_redirects)
+
+    opener_args = [ContentDecoding]
+    if version_info[0] >= 3:
+        # Reuse keep-alive connections to the same host
+        from connectionpool import KeepAliveHTTPHandler, KeepAliveHTTPSHandler
+        pool = config.get('pool')
+        opener_args.extend([KeepAliveHTTPHandler(pool), KeepAliveHTTPSHandler(pool)])
+    if not follow_redirects:
+        opener_args.append(NoRedirection)
+    if cookiejar is not None:
+        opener_args.append(HTTPCookieProcessor(cookiejar))
+    proxies = config.get('proxies')
+    if proxies:
+        opener_args.append(ProxyHandler(proxies))
+    # Record or replay fixtures, or use a stand-in server, when requested by the environment
+    from fixtures import get_handlers
+    opener_args.extend(get_handlers())
+    opener = build_opener(*opener_args)
+    if cookiejar is None:
+        openers[follow_redirects] = opener
+    return opener
+
+
 def get_cond_visibility(condition):
     """Test a condition in XBMC"""
     return xbmc.getCondVisibility(condition)
@@ -720,7 +1156,7 @@ def has_addon(name):
 
 def has_credentials():
     """Whether the add-on has credentials filled in"""
-    return bool(get_setting('username') and get_setting('password'))
+    return bool(get_cached_setting('username') and get_cached_setting('password'))
 
 
 def kodi_version():
@@ -767,14 +1203,14 @@ COLOUR_THEMES = {
 
 def themecolour(kind):
     """Get current theme color by kind (highlighted, availability, geoblocked, greyedout)"""
-    theme = get_setting('colour_theme', 'dark')
+    theme = get_cached_setting('colour_theme', 'dark')
     color = COLOUR_THEMES.get(theme).get(kind, COLOUR_THEMES.get('dark').get(kind))
     return color
 
 
 def colour(text):
     """Convert stub color bbcode into colors from the settings"""
-    theme = get_setting('colour_theme', 'dark')
+    theme = get_cached_setting('colour_theme', 'dark')
     try:
         text = text.format(**COLOUR_THEMES.get(theme))
     except KeyError:
@@ -957,8 +1393,7 @@ def log(level=1, message='', **kwargs):
     if not debug_logging and not (level <= max_log_level and max_log_level != 0):
         return
     if kwargs:
-        from string import Formatter
-        message = Formatter().vformat(message, (), SafeDict(**kwargs))
+        message = format_template(message, **kwargs)
     message = '[{addon}] {message}'.format(addon=addon_id(), message=message)
     xbmc.log(from_unicode(message), level % 3 if debug_logging else 2)
 
@@ -971,8 +1406,7 @@ def log_access(argv):
 def log_error(message, **kwargs):
     """Log error messages to Kodi"""
     if kwargs:
-        from string import Formatter
-        message = Formatter().vformat(message, (), SafeDict(**kwargs))
+        message = format_template(message, **kwargs)
     message = '[{addon}] {message}'.format(addon=addon_id(), message=message)
     xbmc.log(from_unicode(message), 4)
 
@@ -1021,11 +1455,151 @@ def human_delta(seconds):
     return '%d second%s' % (seconds, 's' if seconds != 1 else '')
 
 
+def get_cache_db():
+    """Return the connection of the current thread to the SQLite cache store, create and migrate the store when needed"""
+    connection = getattr(_CACHE_DB, 'connection', None)
+    if connection is not None:
+        return connection
+    import os
+    import sqlite3
+    if not exists(addon_profile()):
+        mkdirs(addon_profile())
+    # Autocommit, every statement is a transaction
+    connection = sqlite3.connect(os.path.join(addon_profile(), CACHE_DB), timeout=SINGLE_FLIGHT_TIMEOUT, isolation_level=None)
+    # Readers do not block the writer, and NORMAL synchronization in WAL mode saves an fsync per write
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    if connection.execute('PRAGMA user_version').fetchone()[0] < CACHE_DB_VERSION:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have upgraded the store meanwhile
+            migrated = upgrade_cache_db(connection, connection.execute('PRAGMA user_version').fetchone()[0])
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            connection.execute('ROLLBACK')
+            raise
+        # Only remove the migrated cache files once the cache store holds them
+        for path in migrated:
+            delete(path)
+    _CACHE_DB.connection = connection
+    return connection
+
+
+def upgrade_cache_db(connection, version):
+    """Create or upgrade the tables of the cache store, returns the paths of migrated cache files"""
+    migrated = []
+    if version < 1:
+        connection.execute('CREATE TABLE IF NOT EXISTS cache (tag TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+                           'updated REAL NOT NULL, expiry REAL, PRIMARY KEY (tag, key))')
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_expiry ON cache (expiry)')
+        migrated = migrate_cache_files(connection)
+    if version < 2:
+        connection.execute('ALTER TABLE cache ADD COLUMN accessed REAL')
+        connection.execute('UPDATE cache SET accessed = updated')
+        connection.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        connection.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+    if version < 3:
+        connection.execute('CREATE TABLE IF NOT EXISTS locks (tag TEXT NOT NULL, key TEXT NOT NULL, expiry REAL NOT NULL, PRIMARY KEY (tag, key))')
+    connection.execute('PRAGMA user_version = {version}'.format(version=CACHE_DB_VERSION))
+    return migrated
+
+
+def execute_cache_db(query, params=()):
+    """Execute a statement on the cache store, returns a cursor or None if the cache store failed"""
+    import sqlite3
+    try:
+        return get_cache_db().execute(query, params)
+    except sqlite3.Error as exc:
+        log_error('Cache store failed: {error}', error=exc)
+        return None
+
+
+def migrate_cache_files(connection):
+    """Copy the cache files of former versions into the cache store, returns their paths"""
+    import os
+    migrated = []
+    for cache_dir in CACHE_DB_TAGS:
+        directory = get_cache_dir(cache_dir)
+        if not exists(directory):
+            continue
+        _, files = listdir(directory)
+        for filename in files:
+            if filename.endswith('.lock'):
+                continue
+            fullpath = os.path.join(directory, filename)
+            try:
+                with open_file(fullpath, 'r') as fdesc:
+                    data = fdesc.read()
+            except (IOError, OSError) as exc:
+                log_error("Failed to migrate cache file '{path}': {error}", path=fullpath, error=exc)
+                continue
+            connection.execute('INSERT OR REPLACE INTO cache (tag, key, value, updated, expiry) VALUES (?, ?, ?, ?, ?)',
+                               (cache_dir, filename, to_blob(data), stat_file(fullpath).st_mtime(), get_cache_expiry(data)))
+            migrated.append(fullpath)
+    log(2, 'Migrated cache files to the cache store')
+    return migrated
+
+
+def to_blob(data):
+    """Return cached data as a value for the cache store"""
+    import sqlite3
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return sqlite3.Binary(data)
+
+
+def get_cache_expiry(data):
+    """Return the expiration time of cached data with an expirationDate (e.g. tokens and livestreams), or None"""
+    if '"expirationDate"' not in data:
+        return None
+    from calendar import timegm
+    from json import loads
+    from utils import parse_datetime
+    try:
+        expiration_date = loads(data).get('expirationDate')
+        if not expiration_date:
+            return None
+        return timegm(parse_datetime(expiration_date).utctimetuple())
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
 def get_cache(cache_file, ttl=None, cache_dir=DEFAULT_CACHE_DIR):  # pylint: disable=redefined-outer-name
     """Get the content from cache, if it is still fresh"""
     if not get_setting_bool('usehttpcaching', default=True):
         return None
 
+    if cache_dir not in CACHE_DB_TAGS:
+        return get_file_cache(cache_file, ttl, cache_dir)
+
+    cursor = execute_cache_db('SELECT value, updated, expiry, accessed FROM cache WHERE tag = ? AND key = ?', (cache_dir, cache_file))
+    row = cursor.fetchone() if cursor else None
+    if row is None:
+        return None
+
+    from time import time
+    value, updated, expiry, accessed = row
+    now = time()
+    if ttl is not None and now >= updated + ttl:
+        return None
+
+    if ttl is None and expiry is not None and expiry <= now:
+        log(2, "Cache expired: '{key}'", key=cache_file)
+        return None
+
+    from json import loads
+    try:
+        json = loads(bytes(value).decode('utf-8'))
+    except ValueError:
+        return None
+    if accessed is None or now >= accessed + CACHE_ACCESS_INTERVAL:
+        execute_cache_db('UPDATE cache SET accessed = ? WHERE tag = ? AND key = ?', (now, cache_dir, cache_file))
+    log(2, "Got item from cache '{key}'", key=cache_file)
+    return json
+
+
+def get_file_cache(cache_file, ttl=None, cache_dir=DEFAULT_CACHE_DIR):  # pylint: disable=redefined-outer-name
+    """Get the content from a cache file, if it is still fresh"""
     fullpath = get_cache_path(cache_file, cache_dir)
     if not exists(fullpath):
         return None
@@ -1037,10 +1611,6 @@ def get_cache(cache_file, ttl=None, cache_dir=DEFAULT_CACHE_DIR):  # pylint: dis
         if now >= mtime + ttl:
             return None
 
-#    if ttl is None:
-#        log(3, "Cache '{path}' is forced from cache.", path=path)
-#    else:
-#        log(3, "Cache '{path}' is fresh, expires in {time}.", path=path, time=human_delta(mtime + ttl - now))
     with open_file(fullpath, 'r') as fdesc:
         json = get_json_data(fdesc)
 
@@ -1062,11 +1632,87 @@ def get_cache(cache_file, ttl=None, cache_dir=DEFAULT_CACHE_DIR):  # pylint: dis
     return json
 
 
+def has_cache(cache_file, cache_dir=DEFAULT_CACHE_DIR):
+    """Whether there is a cache entry, fresh or not"""
+    cursor = execute_cache_db('SELECT 1 FROM cache WHERE tag = ? AND key = ?', (cache_dir, cache_file))
+    return bool(cursor and cursor.fetchone())
+
+
+def touch_cache(cache_file, cache_dir=DEFAULT_CACHE_DIR):
+    """Make a cache entry fresh again, returns False if there is none"""
+    from time import time
+    log(3, "Cache '{key}' has not changed, updating time only.", key=cache_file)
+    cursor = execute_cache_db('UPDATE cache SET updated = ? WHERE tag = ? AND key = ?', (time(), cache_dir, cache_file))
+    return bool(cursor and cursor.rowcount)
+
+
 def update_cache(cache_file, data, cache_dir=DEFAULT_CACHE_DIR):
     """Update the cache, if necessary"""
     if not get_setting_bool('usehttpcaching', default=True):
         return
 
+    if cache_dir not in CACHE_DB_TAGS:
+        update_file_cache(cache_file, data, cache_dir)
+        return
+
+    from time import time
+    log(3, "Write cache '{key}'.", key=cache_file)
+    now = time()
+    execute_cache_db('INSERT OR REPLACE INTO cache (tag, key, value, updated, expiry, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+                     (cache_dir, cache_file, to_blob(data), now, get_cache_expiry(data), now))
+
+
+def collect_cache_garbage(budget=None):
+    """Remove expired and unused cache entries, and evict the least recently used entries that do not fit the cache budget"""
+    from time import time
+    if budget is None:
+        budget = get_setting_int('httpcachebudget', default=CACHE_BUDGET) * 1024 * 1024
+    now = time()
+    cursor = execute_cache_db('DELETE FROM cache WHERE expiry < ? OR accessed < ?', (now, now - CACHE_UNUSED_TIME))
+    if cursor is None:
+        return
+    expired = max(cursor.rowcount, 0)
+
+    evicted = 0
+    size = get_cache_stats().get('size') or 0
+    cursor = execute_cache_db('SELECT accessed, LENGTH(value) FROM cache ORDER BY accessed') if size > budget else None
+    if cursor is not None:
+        # Find the access time up to which entries have to be evicted
+        cutoff = None
+        for accessed, length in cursor.fetchall():
+            if size <= budget * CACHE_BUDGET_TARGET:
+                break
+            cutoff = accessed
+            size -= length
+        cursor = execute_cache_db('DELETE FROM cache WHERE accessed IS NULL OR accessed <= ?', (cutoff,))
+        if cursor is not None:
+            evicted = max(cursor.rowcount, 0)
+
+    for name, value in (('expirations', expired), ('evictions', evicted)):
+        if value:
+            execute_cache_db('INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)', (name,))
+            execute_cache_db('UPDATE counters SET value = value + ? WHERE name = ?', (value, name))
+    # Keep the write-ahead log small
+    execute_cache_db('PRAGMA wal_checkpoint(TRUNCATE)')
+    log(2, 'Collected cache garbage: {expired} expired, {evicted} evicted, {size} bytes of {budget} bytes used',
+        expired=expired, evicted=evicted, size=size, budget=budget)
+
+
+def get_cache_stats():
+    """Return the number of entries, the size and the eviction counters of the cache store"""
+    stats = {'entries': 0, 'size': 0, 'expirations': 0, 'evictions': 0}
+    cursor = execute_cache_db('SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache')
+    if cursor is None:
+        return stats
+    stats['entries'], stats['size'] = cursor.fetchone()
+    cursor = execute_cache_db('SELECT name, value FROM counters')
+    if cursor is not None:
+        stats.update(cursor.fetchall())
+    return stats
+
+
+def update_file_cache(cache_file, data, cache_dir=DEFAULT_CACHE_DIR):
+    """Update a cache file, if necessary"""
     fullpath = get_cache_path(cache_file, cache_dir)
     if not exists(fullpath):
         # Create cache directory if missing
@@ -1104,30 +1750,113 @@ def update_timestamp(fullpath):
 def ttl(kind='direct'):
     """Return the HTTP cache ttl in seconds based on kind of relation"""
     if kind == 'direct':
-        return get_setting_int('httpcachettldirect', default=5) * 60
+        return get_cached_setting_int('httpcachettldirect', default=5) * 60
     if kind == 'indirect':
-        return get_setting_int('httpcachettlindirect', default=60) * 60
+        return get_cached_setting_int('httpcachettlindirect', default=60) * 60
     return 5 * 60
 
 
+def is_idempotent(data=None, method=None):
+    """Whether a request can safely be retried, i.e. a GET request or a GraphQL query but not a mutation"""
+    if method not in (None, 'GET', 'HEAD'):
+        return False
+    if data is None:
+        return True
+    from json import loads
+    try:
+        payload = loads(to_unicode(data))
+    except (TypeError, ValueError):
+        return False
+    # A batched GraphQL request is an array of operations
+    payloads = payload if isinstance(payload, list) else [payload]
+    return bool(payloads) and all(isinstance(item, dict) and is_graphql_query(item) for item in payloads)
+
+
+def is_graphql_query(payload):
+    """Whether a GraphQL operation is a query and not a mutation, persisted queries sent without query text are looked up by hash"""
+    if payload.get('query'):
+        return not payload.get('query').lstrip().startswith('mutation')
+    query_hash = ((payload.get('extensions') or {}).get('persistedQuery') or {}).get('sha256Hash')
+    # Unknown hashes may be mutations
+    return _PERSISTED_QUERIES.get(query_hash) is False
+
+
+def register_persisted_query(query_hash, is_mutation):
+    """Remember whether a persisted query hash belongs to a mutation, so requests sent by hash can be retried safely"""
+    _PERSISTED_QUERIES[query_hash] = is_mutation
+
+
+def is_transient_error(exc):
+    """Whether a failed request may succeed when retried"""
+    code = getattr(exc, 'code', None)
+    if code is not None:  # HTTPError
+        return code in (429, 500, 502, 503, 504)
+    # Connection errors and timeouts, but not certificate errors
+    return not isinstance(getattr(exc, 'reason', None), SSLError)
+
+
+def is_circuit_open(host):
+    """Whether requests to a failing host should fail fast, shared between the plugin and the service"""
+    from time import time
+    open_until = _CIRCUITS.get(host, {}).get('open_until', 0)
+    try:
+        open_until = max(open_until, float(get_property('vrtmax_circuit_' + host, default=0)))
+    except ValueError:
+        pass
+    return open_until > time()
+
+
+def record_failure(host):
+    """Count a failed request, open the circuit of a host after too many consecutive failures"""
+    from time import time
+    circuit = _CIRCUITS.setdefault(host, {'failures': 0, 'open_until': 0})
+    circuit['failures'] += 1
+    if circuit.get('failures') >= CIRCUIT_FAILURES:
+        log_error('Host {host} failed {failures} times, failing fast for {seconds} seconds',
+                  host=host, failures=circuit.get('failures'), seconds=CIRCUIT_OPEN_TIME)
+        circuit['open_until'] = time() + CIRCUIT_OPEN_TIME
+        set_property('vrtmax_circuit_' + host, str(circuit.get('open_until')))
+
+
+def record_success(host):
+    """Close the circuit of a host that responds again"""
+    if _CIRCUITS.pop(host, None) is not None:
+        clear_property('vrtmax_circuit_' + host)
+
+
+def open_request(opener, req, retries=0):
+    """Open a request, retry transient failures with jittered exponential backoff"""
+    try:  # Python 3
+        from urllib.error import URLError
+    except ImportError:  # Python 2
+        from urllib2 import URLError
+    from random import uniform
+    attempt = 0
+    while True:
+        try:
+            return opener.open(req)
+        except (URLError, timeout) as exc:
+            if attempt >= retries or not is_transient_error(exc):
+                raise
+            if hasattr(exc, 'close'):  # Release the connection of an HTTPError
+                exc.close()
+            delay = uniform(0, RETRY_BACKOFF * 2 ** attempt)
+            log(2, 'Retry {url} in {delay:.2f} seconds: {error}', url=req.get_full_url(), delay=delay, error=exc)
+            tracing.add('retries', 1)
+            xbmc.sleep(int(delay * 1000))
+            attempt += 1
+
+
 def open_url(url, data=None, headers=None, method=None, cookiejar=None, follow_redirects=True, raise_errors=None):
     """Return a urllib http response"""
     try:  # Python 3
-        from urllib.error import HTTPError, URLError
+        from urllib.error import URLError
         from urllib.parse import unquote
-        from urllib.request import build_opener, HTTPCookieProcessor, ProxyHandler, Request
+        from urllib.request import Request
     except ImportError:  # Python 2
-        from urllib2 import build_opener, HTTPError, HTTPCookieProcessor, ProxyHandler, Request, URLError, unquote
+        from urllib2 import Request, URLError, unquote
 
-    opener_args = []
-    if not follow_redirects:
-        opener_args.append(NoRedirection)
-    if cookiejar is not None:
-        opener_args.append(HTTPCookieProcessor(cookiejar))
-    proxies = get_proxies()
-    if proxies:
-        opener_args.append(ProxyHandler(proxies))
-    opener = build_opener(*opener_args)
+    opener = get_opener(follow_redirects=follow_redirects, cookiejar=cookiejar)
 
     if not headers:
         headers = {}
@@ -1148,9 +1877,23 @@ def open_url(url, data=None, headers=None, method=None, cookiejar=None, follow_r
 
     if raise_errors is None:
         raise_errors = []
+    host = req.host if hasattr(req, 'host') else req.get_host()
+    if is_circuit_open(host):
+        log_error('Host {host} is failing, skipping {url}', host=host, url=unquote(url))
+        return None
+    retries = RETRY_ATTEMPTS - 1 if is_idempotent(data, method) else 0
+    trace = tracing.begin(url, data=data)
     try:
-        return opener.open(req)
+        response = open_request(opener, req, retries=retries)
+        record_success(host)
+        return response
     except HTTPError as exc:
+        if is_transient_error(exc):
+            record_failure(host)
+        else:
+            record_success(host)
+        if exc.code == 304:  # Not Modified, the caller revalidates its cache
+            return exc
         if isinstance(raise_errors, list) and 401 in raise_errors or raise_errors == 'all':
             raise
         if hasattr(req, 'selector'):  # Python 3.4+
@@ -1182,6 +1925,8 @@ def open_url(url, data=None, headers=None, method=None, cookiejar=None, follow_r
         log_error('HTTP Error {code}: {reason}', code=exc.code, reason=exc.reason)
         return None
     except URLError as exc:
+        if is_transient_error(exc):
+            record_failure(host)
         ok_dialog(heading=localize(30968), message=localize(30969))
         log_error('URLError: {error}\nurl: {url}', error=exc.reason, url=url)
         return None
@@ -1196,15 +1941,22 @@ def open_url(url, data=None, headers=None, method=None, cookiejar=None, follow_r
             log_error('SSLError: {error}\nurl: {url}', error=str(exc), url=url)
         return None
     except timeout as exc:
+        record_failure(host)
         ok_dialog(heading=localize(30968), message=localize(30969))
         log_error('Timeout: {error}\nurl: {url}', error=exc, url=url)
         return None
+    finally:
+        tracing.end(trace)
 
 
 def get_json_data(response, fail=None):
     """Return json object from HTTP response"""
     from json import load, loads
     try:
+        if hasattr(response, 'getcode'):  # HTTP response
+            text = read_response_text(response)
+            with tracing.phase('decode'):
+                return loads(text)
         if (3, 0, 0) <= version_info < (3, 6, 0):  # the JSON object must be str, not 'bytes'
             return loads(to_unicode(response.read()))
         return load(response)
@@ -1216,17 +1968,152 @@ def get_json_data(response, fail=None):
         return fail
 
 
+def read_response_text(response, encoding='utf-8'):
+    """Read and decode (and decompress) an HTTP response body chunk by chunk while it is being received"""
+    from codecs import getincrementaldecoder
+    decoder = getincrementaldecoder(encoding)()
+    parts = []
+    size = 0
+    with tracing.phase('transfer'):
+        while True:
+            chunk = response.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b'', final=True))
+    # Compressed responses count the bytes on the wire
+    tracing.add('bytes', getattr(response, 'bytes_received', size))
+    return ''.join(parts)
+
+
 def get_url_json(url, cache=None, headers=None, data=None, fail=None, raise_errors=None):
     """Return HTTP data"""
-    response = open_url(url, headers=headers, data=data, raise_errors=raise_errors)
-    if response:
-        json_data = get_json_data(response, fail=fail)
-        if json_data:
-            if cache:
-                from json import dumps
-                update_cache(cache, dumps(json_data))
-            return json_data
-    return fail
+    trace = tracing.begin(url, cache=cache, data=data)
+    try:
+        response = open_url(url, headers=headers, data=data, raise_errors=raise_errors)
+        if response:
+            if cache and response.getcode() == 304:
+                # Not modified, only update the timestamp of the cached response
+                tracing.update(cache='revalidated')
+                response.close()
+                if touch_cache(cache):
+                    json_data = get_cache(cache)
+                    if json_data is not None:
+                        return json_data
+                # The cached response disappeared meanwhile, retry unconditionally
+                headers = dict((key, value) for key, value in headers.items() if key not in ('If-None-Match', 'If-Modified-Since'))
+                return get_url_json(url, cache=cache, headers=headers, data=data, fail=fail, raise_errors=raise_errors)
+            json_data = get_json_data(response, fail=fail)
+            if json_data:
+                if cache:
+                    from json import dumps
+                    update_cache(cache, dumps(json_data))
+                    update_validators(cache, response)
+                return json_data
+        return fail
+    finally:
+        tracing.end(trace)
+
+
+def get_url_json_many(requests, max_workers=None, get_json=None):
+    """Return HTTP data for multiple URLs or get_url_json() arguments, fetched concurrently and returned in order
+
+    A get_json function fetches the get_url_json() arguments of a request instead of get_url_json() or get_cached_url_json().
+    An HTTP error a request asks for with raise_errors is raised once all requests are done, and only one error dialog is shown."""
+    from threading import Thread
+    try:  # Python 3
+        from queue import Empty, Queue
+    except ImportError:  # Python 2
+        from Queue import Empty, Queue
+
+    results = [None] * len(requests)
+    errors = []
+    dialogs = []
+
+    def fetch(index, request):
+        """Fetch a single request and store its result, failures do not affect other requests"""
+        if request is None:
+            return
+        if not isinstance(request, dict):
+            request = {'url': request}
+        try:
+            if get_json is not None:
+                results[index] = get_json(request)
+            elif 'ttl' in request:  # Use the cache
+                results[index] = get_cached_url_json(**request)
+            else:
+                results[index] = get_url_json(**request)
+        except Exception as exc:  # pylint: disable=broad-except
+            if isinstance(exc, HTTPError) and request.get('raise_errors'):
+                errors.append((index, exc))
+                return
+            log_error('Request {url} failed: {error}', url=request.get('url'), error=exc)
+            results[index] = request.get('fail')
+
+    if max_workers is None:
+        max_workers = get_connection_pool().max_connections
+    max_workers = min(max_workers, len(requests))
+    if max_workers <= 1:
+        with deferred_dialogs(dialogs):
+            for index, request in enumerate(requests):
+                fetch(index, request)
+    else:
+        queue = Queue()
+        for index, request in enumerate(requests):
+            queue.put((index, request))
+
+        def worker():
+            """Fetch requests from the queue until it is empty"""
+            with deferred_dialogs(dialogs):
+                while True:
+                    try:
+                        index, request = queue.get_nowait()
+                    except Empty:
+                        return
+                    fetch(index, request)
+
+        workers = [Thread(target=worker) for _ in range(max_workers)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+    if dialogs:
+        ok_dialog(*dialogs[0])
+    if errors:
+        raise min(errors, key=lambda error: error[0])[1]
+    return results
+
+
+def get_validators(cache_file):
+    """Return conditional request headers to revalidate a cached HTTP response"""
+    if not has_cache(cache_file):
+        return {}
+    validators = get_cache(cache_file, cache_dir=VALIDATORS_CACHE_DIR)
+    if not isinstance(validators, dict):
+        return {}
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators.get('etag')
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators.get('last_modified')
+    return headers
+
+
+def update_validators(cache_file, response):
+    """Store the validators (ETag and Last-Modified) of an HTTP response next to its cache entry"""
+    info = response.info()
+    validators = {}
+    if info.get('ETag'):
+        validators['etag'] = info.get('ETag')
+    if info.get('Last-Modified'):
+        validators['last_modified'] = info.get('Last-Modified')
+    if validators:
+        from json import dumps
+        update_cache(cache_file, dumps(validators), VALIDATORS_CACHE_DIR)
+    else:
+        delete_cache(cache_file, VALIDATORS_CACHE_DIR)
 
 
 def generate_expiration_date(hours=2):
@@ -1238,23 +2125,117 @@ def generate_expiration_date(hours=2):
 
 def delete_cache(cache_file, cache_dir=DEFAULT_CACHE_DIR):
     """Delete a cached file"""
+    if cache_dir in CACHE_DB_TAGS:
+        execute_cache_db('DELETE FROM cache WHERE tag = ? AND key = ?', (cache_dir, cache_file))
+        return
     path = get_cache_path(cache_file, cache_dir)
     if exists(path):
         delete(path)
 
 
+@contextmanager
+def single_flight(cache_file, cache_dir=DEFAULT_CACHE_DIR, timeout=SINGLE_FLIGHT_TIMEOUT):  # pylint: disable=redefined-outer-name
+    """Serialize refreshes of a cache file between the plugin and the service using a lock in the cache store,
+       yields True if another process held the lock, so the caller should check the cache again"""
+    if not get_setting_bool('usehttpcaching', default=True):
+        yield False
+        return
+
+    from time import time
+    waited = False
+    locked = False
+    time_out = time() + timeout
+    while True:
+        now = time()
+        # Break a lock left behind by a crashed or killed process
+        cursor = execute_cache_db('DELETE FROM locks WHERE tag = ? AND key = ? AND expiry < ?', (cache_dir, cache_file, now))
+        if cursor is not None and cursor.rowcount > 0:
+            log(2, "Break stale lock '{path}'", path=cache_file)
+        cursor = execute_cache_db('INSERT OR IGNORE INTO locks (tag, key, expiry) VALUES (?, ?, ?)', (cache_dir, cache_file, now + timeout))
+        if cursor is None:  # Refresh without a lock when the cache store failed
+            break
+        if cursor.rowcount == 1:
+            locked = True
+            break
+        if now > time_out:  # Exit loop in case something goes wrong
+            log(2, "Timed out waiting for lock '{path}'", path=cache_file)
+            break
+        if not waited:
+            log(3, "Refresh of '{path}' is busy, wait", path=cache_file)
+        waited = True
+        xbmc.sleep(50)
+
+    try:
+        yield waited
+    finally:
+        if locked:
+            execute_cache_db('DELETE FROM locks WHERE tag = ? AND key = ?', (cache_dir, cache_file))
+
+
 def get_cached_url_json(url, cache, headers=None, ttl=None, fail=None):  # pylint: disable=redefined-outer-name
     """Return data from cache, if any, else make an HTTP request"""
     # Get api data from cache if it is fresh
     json_data = get_cache(cache, ttl=ttl)
     if json_data is not None:
+        tracing.end(tracing.begin(url, cache=cache), cache='hit')
         return json_data
-    return get_url_json(url, cache=cache, headers=headers, fail=fail)
+    # Serve a recently expired response, and let the service refresh it
+    if ttl is not None and use_stale_caches():
+        json_data = get_cache(cache, ttl=ttl + CACHE_STALE_TIME)
+        if json_data is not None:
+            tracing.end(tracing.begin(url, cache=cache), cache='stale')
+            queue_revalidation('url', url=url, cache=cache, headers=headers, ttl=ttl)
+            return json_data
+    with single_flight(cache) as waited:
+        # Another process may have refreshed the cache while we were waiting
+        if waited:
+            json_data = get_cache(cache, ttl=ttl)
+            if json_data is not None:
+                return json_data
+        # Revalidate an expired cached response
+        validators = get_validators(cache)
+        if validators:
+            validators.update(headers or {})
+            headers = validators
+        json_data = get_url_json(url, cache=cache, headers=headers, fail=fail)
+    if not json_data:
+        # Serve a stale cached response while the host is failing
+        stale_data = get_cache(cache)
+        if stale_data is not None:
+            log(2, "Serving stale cache '{cache}'", cache=cache)
+            return stale_data
+    return json_data
+
+
+def use_stale_caches():
+    """Whether recently expired cache entries are served while the service refreshes them"""
+    return get_cached_setting_bool('usehttpcaching', default=True) and get_cached_setting_bool('staleserving', default=True)
+
+
+def queue_revalidation(kind, **kwargs):
+    """Ask the service to refresh a recently expired cache entry, kind is 'url' or 'graphql'"""
+    log(3, "Queue revalidation of '{cache}'", cache=kwargs.get('cache') or kwargs.get('operation_name'))
+    notify(sender=addon_id() + '.SIGNAL', message='revalidate', data=dict(kwargs, kind=kind))
+
+
+def revalidate_cache(url, cache, headers=None, ttl=None):  # pylint: disable=redefined-outer-name
+    """Refresh a cached HTTP response, returns True if the response changed"""
+    with single_flight(cache):
+        # Another process may have refreshed the cache already
+        if get_cache(cache, ttl=ttl) is not None:
+            return False
+        cached_data = get_cache(cache)
+        validators = get_validators(cache)
+        if validators:
+            validators.update(headers or {})
+            headers = validators
+        json_data = get_url_json(url, cache=cache, headers=headers)
+    return bool(json_data) and json_data != cached_data
 
 
 def refresh_caches(cache_file=None):
     """Invalidate the needed caches and refresh container"""
-    files = ['favorites.json', 'oneoff.json', 'resume_points.json']
+    files = ['favorites.json', 'oneoff.json', 'resume_points.json', 'graphql.*.json', 'listing.*.json']
     if cache_file and cache_file not in files:
         files.append(cache_file)
     invalidate_caches(*files)
@@ -1263,12 +2244,10 @@ def refresh_caches(cache_file=None):
 
 
 def invalidate_caches(*caches):
-    """Invalidate multiple cache files"""
-    import fnmatch
-    _, files = listdir(get_cache_dir())
-    # Invalidate caches related to menu list refreshes
-    removes = set()
+    """Invalidate multiple cache files, using shell-style wildcards"""
+    if not caches:
+        return
+    # GLOB patterns use the same wildcards as fnmatch, and can use the primary key when a pattern starts with a literal prefix
+    tags = ', '.join('?' * len(CACHE_DB_TAGS))
     for expr in caches:
-        removes.update(fnmatch.filter(files, expr))
-    for filename in removes:
-        delete(get_cache_path(filename))
+        execute_cache_db('DELETE FROM cache WHERE tag IN ({tags}) AND key GLOB ?'.format(tags=tags), CACHE_DB_TAGS + (expr,))
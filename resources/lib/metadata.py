@@ -12,8 +12,8 @@ except ImportError:  # Python 2
     from urllib import quote_plus
 
 from data import CHANNELS, SECONDS_MARGIN
-from kodiutils import colour, get_setting_bool, localize, localize_datelong, log, url_for
-from utils import (find_entry, from_unicode, html_to_kodi, reformat_url,
+from kodiutils import colour, get_cached_setting_bool, localize, localize_datelong, log, url_for
+from utils import (find_entry, from_unicode, html_to_kodi, parse_datetime, reformat_url,
                    reformat_image_url, shorten_link, to_unicode, unescape)
 
 
@@ -237,9 +237,8 @@ class Metadata:
         # VRT MAX Schedule API (some are missing vrt.whatson-id)
         if api_data.get('vrt.whatson-id') or api_data.get('startTime'):
             from datetime import timedelta
-            import dateutil.parser
-            start_time = dateutil.parser.parse(api_data.get('startTime'))
-            end_time = dateutil.parser.parse(api_data.get('endTime'))
+            start_time = parse_datetime(api_data.get('startTime'))
+            end_time = parse_datetime(api_data.get('endTime'))
             if end_time < start_time:
                 end_time = end_time + timedelta(days=1)
             return (end_time - start_time).total_seconds()
@@ -250,7 +249,6 @@ class Metadata:
     def get_plot(self, api_data, season=False, date=None):
         """Get plot string from single item json api data"""
         from datetime import datetime
-        import dateutil.parser
         import dateutil.tz
 
         # VRT MAX Search API
@@ -269,7 +267,7 @@ class Metadata:
             plot_meta = ''
             # Only display when a video disappears if it is within the next 3 months
             if api_data.get('offTime'):
-                offtime = dateutil.parser.parse(api_data.get('offTime'))
+                offtime = parse_datetime(api_data.get('offTime'))
 
                 # Show the remaining days/hours the episode is still available
                 if offtime:
@@ -316,7 +314,7 @@ class Metadata:
                 plot = '%s\n\n%s' % (plot_meta, plot)
 
             permalink = shorten_link(api_data.get('permalink')) or api_data.get('externalPermalink')
-            if permalink and get_setting_bool('showpermalink', default=False):
+            if permalink and get_cached_setting_bool('showpermalink', default=False):
                 plot = '%s\n\n[COLOR={highlighted}]%s[/COLOR]' % (plot, permalink)
             return colour(plot)
 
@@ -324,7 +322,7 @@ class Metadata:
         if api_data.get('type') == 'program':
             plot = unescape(api_data.get('description', '???'))
             # permalink = shorten_link(api_data.get('programUrl'))
-            # if permalink and get_setting_bool('showpermalink', default=False):
+            # if permalink and get_cached_setting_bool('showpermalink', default=False):
             #     plot = '%s\n\n[COLOR={highlighted}]%s[/COLOR]' % (plot, permalink)
             return colour(plot)
 
@@ -425,8 +423,7 @@ class Metadata:
 
         # VRT MAX Search API
         if api_data.get('episodeType'):
-            import dateutil.parser
-            return dateutil.parser.parse(api_data.get('onTime')).strftime('%d.%m.%Y')
+            return parse_datetime(api_data.get('onTime')).strftime('%d.%m.%Y')
 
         # VRT MAX Suggest API
         if api_data.get('type') == 'program':
@@ -462,9 +459,8 @@ class Metadata:
         # VRT MAX Schedule API (some are missing vrt.whatson-id)
         if api_data.get('vrt.whatson-id') or api_data.get('startTime'):
             from datetime import datetime
-            import dateutil.parser
             import dateutil.tz
-            aired = dateutil.parser.parse(api_data.get('startTime')).astimezone(dateutil.tz.UTC).strftime('%Y-%m-%d')
+            aired = parse_datetime(api_data.get('startTime')).astimezone(dateutil.tz.UTC).strftime('%Y-%m-%d')
             return aired
 
         # Not Found
@@ -476,8 +472,7 @@ class Metadata:
 
         # VRT MAX Search API
         if api_data.get('episodeType'):
-            import dateutil.parser
-            return dateutil.parser.parse(api_data.get('onTime')).strftime('%Y-%m-%d %H:%M:%S')
+            return parse_datetime(api_data.get('onTime')).strftime('%Y-%m-%d %H:%M:%S')
 
         # VRT MAX Suggest API
         if api_data.get('type') == 'program':
@@ -549,7 +544,7 @@ class Metadata:
         # VRT MAX Search API
         if api_data.get('episodeType'):
             if season is not False:
-                if get_setting_bool('showfanart', default=True):
+                if get_cached_setting_bool('showfanart', default=True):
                     art_dict['fanart'] = reformat_image_url(api_data.get('programImageUrl', 'DefaultSets.png'))
                     if season != 'allseasons':
                         art_dict['thumb'] = reformat_image_url(api_data.get('videoThumbnailUrl', art_dict.get('fanart')))
@@ -562,7 +557,7 @@ class Metadata:
                 else:
                     art_dict['thumb'] = 'DefaultSets.png'
             else:
-                if get_setting_bool('showfanart', default=True):
+                if get_cached_setting_bool('showfanart', default=True):
                     art_dict['thumb'] = reformat_image_url(api_data.get('videoThumbnailUrl', 'DefaultAddonVideo.png'))
                     art_dict['fanart'] = reformat_image_url(api_data.get('programImageUrl', art_dict.get('thumb')))
                     art_dict['banner'] = art_dict.get('fanart')
@@ -576,7 +571,7 @@ class Metadata:
 
         # VRT MAX Suggest API
         if api_data.get('type') == 'program':
-            if get_setting_bool('showfanart', default=True):
+            if get_cached_setting_bool('showfanart', default=True):
                 art_dict['thumb'] = reformat_image_url(api_data.get('thumbnail', 'DefaultAddonVideo.png'))
                 art_dict['fanart'] = art_dict.get('thumb')
                 art_dict['banner'] = art_dict.get('fanart')
@@ -590,7 +585,7 @@ class Metadata:
 
         # VRT MAX Schedule API (some are missing vrt.whatson-id)
         if api_data.get('vrt.whatson-id') or api_data.get('startTime'):
-            if get_setting_bool('showfanart', default=True):
+            if get_cached_setting_bool('showfanart', default=True):
                 art_dict['thumb'] = reformat_image_url(api_data.get('image', 'DefaultAddonVideo.png'))
                 art_dict['fanart'] = art_dict.get('thumb')
                 art_dict['banner'] = art_dict.get('fanart')
@@ -708,8 +703,7 @@ class Metadata:
                     ascending = False
 
             elif titletype == 'daily':
-                import dateutil.parser
-                label = '%s - %s' % (dateutil.parser.parse(api_data.get('onTime')).strftime('%d/%m'), label)
+                label = '%s - %s' % (parse_datetime(api_data.get('onTime')).strftime('%d/%m'), label)
                 ascending = False
                 sort = 'dateadded'
 
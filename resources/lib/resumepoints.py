@@ -11,14 +11,13 @@ except ImportError:  # Python 2
     from urllib2 import HTTPError
 
 from data import SECONDS_MARGIN
-from kodiutils import (container_refresh, get_cache, get_setting_bool, get_url_json, has_credentials, invalidate_caches,
-                       localize, log, log_error, notification, open_url, update_cache)
+from kodiutils import (container_refresh, get_cache, get_cached_setting_bool, get_url_json, has_credentials, invalidate_caches,
+                       localize, log, log_error, notification, open_url, single_flight, update_cache)
 
 
 class ResumePoints:
     """Track, cache and manage VRT resume points and continue status"""
 
-    GRAPHQL_URL = 'https://www.vrt.be/vrtnu-api/graphql/v1'
     RESUMEPOINTS_URL = 'https://ddt.profiel.vrt.be/resumePoints'
     RESUMEPOINTS_CACHE_FILE = 'resume_points.json'
     CONTINUE_CACHE_FILE = 'continue.json'
@@ -31,7 +30,7 @@ class ResumePoints:
     @staticmethod
     def is_activated():
         """Is resumepoints activated in the menu and do we have credentials ?"""
-        return get_setting_bool('usefavorites', default=True) and get_setting_bool('useresumepoints', default=True) and has_credentials()
+        return get_cached_setting_bool('usefavorites', default=True) and get_cached_setting_bool('useresumepoints', default=True) and has_credentials()
 
     def refresh(self, ttl=None):
         """Get a cached copy or a newer resumepoints from VRT, or fall back to a cached file"""
@@ -44,11 +43,15 @@ class ResumePoints:
             return
         resumepoints_json = get_cache(self.RESUMEPOINTS_CACHE_FILE, ttl)
         if not resumepoints_json:
-            resumepoints_url = self.RESUMEPOINTS_URL + '?max=500&sortBy=-updated'
-            headers = self.resumepoints_headers()
-            if not headers:
-                return
-            resumepoints_json = get_url_json(url=resumepoints_url, cache=self.RESUMEPOINTS_CACHE_FILE, headers=headers)
+            with single_flight(self.RESUMEPOINTS_CACHE_FILE) as waited:
+                if waited:  # Resumepoints were refreshed by another process
+                    resumepoints_json = get_cache(self.RESUMEPOINTS_CACHE_FILE, ttl)
+                if not resumepoints_json:
+                    resumepoints_url = self.RESUMEPOINTS_URL + '?max=500&sortBy=-updated'
+                    headers = self.resumepoints_headers()
+                    if not headers:
+                        return
+                    resumepoints_json = get_url_json(url=resumepoints_url, cache=self.RESUMEPOINTS_CACHE_FILE, headers=headers)
         if resumepoints_json is not None:
             self._resumepoints = resumepoints_json
 
@@ -58,7 +61,15 @@ class ResumePoints:
             return
         continue_dict = get_cache(self.CONTINUE_CACHE_FILE, ttl)
         if not continue_dict:
-            continue_dict = self._generate_continue_dict(self.get_continue())
+            with single_flight(self.CONTINUE_CACHE_FILE) as waited:
+                if waited:  # Continue list was refreshed by another process
+                    continue_dict = get_cache(self.CONTINUE_CACHE_FILE, ttl)
+                if not continue_dict:
+                    continue_dict = self._generate_continue_dict(self.get_continue())
+                    if continue_dict is not None:
+                        # Publish before releasing the lock, so waiting processes find it
+                        from json import dumps
+                        update_cache(self.CONTINUE_CACHE_FILE, dumps(continue_dict))
         if continue_dict is not None:
             from json import dumps
             self._continue = continue_dict
@@ -109,7 +120,7 @@ class ResumePoints:
                 # Resumepoint is not changed, nothing to do
                 return True
 
-            menu_caches.append('continue-*.json')
+            menu_caches.extend(['continue-*.json', 'listing.*.json'])
 
             # Update online
             gdpr = '{asset_str} gekeken tot {at} seconden.'.format(asset_str=asset_str, at=position)
@@ -147,7 +158,7 @@ class ResumePoints:
                 return True
 
             # Add menu caches
-            menu_caches.append('continue-*.json')
+            menu_caches.extend(['continue-*.json', 'listing.*.json'])
 
             # Delete online
             try:
@@ -181,157 +192,113 @@ class ResumePoints:
 
     def _delete_continue_graphql(self, episode_id):
         """Delete continue episode using GraphQL API"""
-        from tokenresolver import TokenResolver
+        from api import api_req
         from json import dumps
         import base64
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        result_json = {}
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
-            }
-            graphql_query = """
-                mutation listDelete($input: ListDeleteActionInput!) {
-                  setListDeleteActionItem(input: $input) {
-                    title
-                    active
-                    action {
-                      __typename
-                      ... on NoAction {
-                        __typename
-                        reason
-                      }
-                      ... on ListTileDeletedAction {
-                        __typename
-                        listId
-                        listName
-                        id
-                      }
-                    }
+        graphql_query = """
+            mutation listDelete($input: ListDeleteActionInput!) {
+              setListDeleteActionItem(input: $input) {
+                title
+                active
+                action {
+                  __typename
+                  ... on NoAction {
+                    __typename
+                    reason
+                  }
+                  ... on ListTileDeletedAction {
                     __typename
+                    listId
+                    listName
+                    id
                   }
                 }
-            """
-            list_name = {
-                'listId': 'dynamic:/vrtnu.model.json@resume-list-video',
-                'listType': 'verderkijken',
+                __typename
+              }
             }
-            encoded_list_name = base64.b64encode(dumps(list_name).encode('utf-8'))
-            payload = {
-                'operationName': 'listDelete',
-                'variables': {
-                    'input': {
-                        'id': episode_id,
-                        'listName': encoded_list_name.decode('utf-8'),
-                    },
-                },
-                'query': graphql_query,
-            }
-            data = dumps(payload).encode('utf-8')
-            result_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
-        return result_json
+        """
+        list_name = {
+            'listId': 'dynamic:/vrtnu.model.json@resume-list-video',
+            'listType': 'verderkijken',
+        }
+        encoded_list_name = base64.b64encode(dumps(list_name).encode('utf-8'))
+        operation_name = 'listDelete'
+        variables = {
+            'input': {
+                'id': episode_id,
+                'listName': encoded_list_name.decode('utf-8'),
+            },
+        }
+        return api_req(graphql_query, operation_name, variables)
 
     def _finish_continue_graphql(self, episode_id):
         """Finish continue episode using GraphQL API"""
-        from tokenresolver import TokenResolver
-        from json import dumps
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        result_json = {}
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
-            }
-            graphql_query = """
-                mutation finishItem($input: FinishActionInput!) {
-                  setFinishActionItem(input: $input) {
+        from api import api_req
+        graphql_query = """
+            mutation finishItem($input: FinishActionInput!) {
+              setFinishActionItem(input: $input) {
+                __typename
+                objectId
+                title
+                accessibilityLabel
+                action {
+                  ... on FinishAction {
+                    id
                     __typename
-                    objectId
-                    title
-                    accessibilityLabel
-                    action {
-                      ... on FinishAction {
-                        id
-                        __typename
-                      }
-                      __typename
-                    }
                   }
+                  __typename
                 }
-            """
-            payload = {
-                'operationName': 'finishItem',
-                'variables': {
-                    'input': {
-                        'id': episode_id,
-                    },
-                },
-                'query': graphql_query,
+              }
             }
-            data = dumps(payload).encode('utf-8')
-            result_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
-        return result_json
+        """
+        operation_name = 'finishItem'
+        variables = {
+            'input': {
+                'id': episode_id,
+            },
+        }
+        return api_req(graphql_query, operation_name, variables)
 
     def get_continue(self):
         """Get continue using GraphQL API"""
-        from tokenresolver import TokenResolver
-        from json import dumps
-        access_token = TokenResolver().get_token('vrtnu-site_profile_at')
-        continue_json = {}
-        if access_token:
-            headers = {
-                'Authorization': 'Bearer ' + access_token,
-                'Content-Type': 'application/json',
-                'x-vrt-client-name': 'WEB',
-                'x-vrt-client-version': '1.5.0',
-            }
-            graphql_query = """
-                query ContinueEpisodes(
-                  $listId: ID!
-                  $endCursor: ID!
-                  $pageSize: Int!
-                ) {
-                  list(listId: $listId) {
-                    __typename
-                    ... on PaginatedTileList {
-                      paginated: paginatedItems(first: $pageSize, after: $endCursor) {
-                        edges {
-                          node {
-                            __typename
-                            ...episodeTile
-                          }
-                        }
+        from api import api_req
+        graphql_query = """
+            query ContinueEpisodes(
+              $listId: ID!
+              $endCursor: ID!
+              $pageSize: Int!
+            ) {
+              list(listId: $listId) {
+                __typename
+                ... on PaginatedTileList {
+                  paginated: paginatedItems(first: $pageSize, after: $endCursor) {
+                    edges {
+                      node {
+                        __typename
+                        ...episodeTile
                       }
                     }
                   }
                 }
-                fragment episodeTile on EpisodeTile {
-                  __typename
-                  id
-                  title
-                  episode {
-                    title
-                    id
-                  }
-                }
-            """
-            payload = {
-                'operationName': 'ContinueEpisodes',
-                'variables': {
-                    'listId': 'dynamic:/vrtnu.model.json@resume-list-video',
-                    'endCursor': '',
-                    'pageSize': 1000,
-                },
-                'query': graphql_query,
+              }
+            }
+            fragment episodeTile on EpisodeTile {
+              __typename
+              id
+              title
+              episode {
+                title
+                id
+              }
             }
-            data = dumps(payload).encode('utf-8')
-            continue_json = get_url_json(url=self.GRAPHQL_URL, cache=None, headers=headers, data=data, raise_errors='all')
-        return continue_json
+        """
+        operation_name = 'ContinueEpisodes'
+        variables = {
+            'listId': 'dynamic:/vrtnu.model.json@resume-list-video',
+            'endCursor': '',
+            'pageSize': 1000,
+        }
+        return api_req(graphql_query, operation_name, variables)
 
     @staticmethod
     def _generate_continue_dict(continue_json):
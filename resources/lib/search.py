@@ -85,13 +85,16 @@ class Search:
 
         self.add(keywords)
 
-        search_items = get_search(keywords=keywords, end_cursor=end_cursor)
-        if not search_items:
+        search_items = get_search(keywords=keywords, end_cursor=end_cursor, lazy=True)
+        # Peek at the first item, search items are converted while they are shown
+        first_item = next(search_items, None)
+        if first_item is None:
             ok_dialog(heading=localize(30135), message=localize(30136, keywords=keywords))
             end_of_directory()
             return
 
-        show_listing(search_items, category=30032, content='tvshows', cache=False)
+        from itertools import chain
+        show_listing(chain([first_item], search_items), category=30032, content='tvshows', cache=False)
 
     def clear(self):
         """Clear the search history"""
@@ -3,9 +3,10 @@
 """This is the actual VRT MAX service entry point"""
 
 from __future__ import absolute_import, division, unicode_literals
-from xbmc import Monitor
+from xbmc import Monitor, Player, getGlobalIdleTime
 from favorites import Favorites
-from kodiutils import container_refresh, log
+from kodiutils import (CACHE_GC_IDLE_TIME, CACHE_GC_INTERVAL, addon_id, collect_cache_garbage, container_refresh, current_container_url,
+                       invalidate_caches, invalidate_network_config, invalidate_settings, log, log_error, prefetch_listings, url_for)
 from playerinfo import PlayerInfo
 from resumepoints import ResumePoints
 from tokenresolver import TokenResolver
@@ -20,14 +21,22 @@ class VrtMonitor(Monitor, object):  # pylint: disable=useless-object-inheritance
         self._resumepoints = ResumePoints()
         self._playerinfo = None
         self._favorites = None
+        self._prefetch_queue = None
+        self._prefetch_pending = set()
         self.init_watching_activity()
         super(VrtMonitor, self).__init__()
 
     def run(self):
         """Main loop"""
+        from time import time
+        collected = time()
         while not self.abortRequested():
             if self.waitForAbort(10):
                 break
+            # Collect cache garbage once in a while, when Kodi is idle and not playing
+            if time() >= collected + CACHE_GC_INTERVAL and getGlobalIdleTime() >= CACHE_GC_IDLE_TIME and not Player().isPlaying():
+                collect_cache_garbage()
+                collected = time()
 
     def init_watching_activity(self):
         """Only load components for watching activity when needed"""
@@ -44,6 +53,30 @@ class VrtMonitor(Monitor, object):  # pylint: disable=useless-object-inheritance
         """Handler for notifications"""
         # log(2, '[Notification] sender={sender}, method={method}, data={data}', sender=sender, method=method, data=to_unicode(data))
 
+        # The network may have changed while Kodi was suspended
+        if sender == 'xbmc' and method == 'System.OnWake':
+            invalidate_network_config()
+            return
+
+        # Prefetch the next page of a listing in the background
+        if sender == addon_id() + '.SIGNAL' and method.endswith('prefetch'):
+            from json import loads
+            data = loads(data)
+            log(3, '[Prefetch notification] sender={sender}, method={method}, data={data}', sender=sender, method=method, data=data)
+            self.queue_prefetch(**data)
+            return
+
+        # Refresh a recently expired cache entry that was served to the plugin
+        if sender == addon_id() + '.SIGNAL' and method.endswith('revalidate'):
+            from json import loads
+            from threading import Thread
+            data = loads(data)
+            log(3, '[Revalidate notification] sender={sender}, method={method}, data={data}', sender=sender, method=method, data=data)
+            thread = Thread(target=self.revalidate, kwargs=data)
+            thread.daemon = True
+            thread.start()
+            return
+
         # Handle play_action events from upnextprovider
         if sender.startswith('upnextprovider') and method.endswith('plugin.video.vrt.nu_play_action'):
             from json import loads
@@ -58,10 +91,60 @@ class VrtMonitor(Monitor, object):  # pylint: disable=useless-object-inheritance
             log(2, '[Up Next notification] sender={sender}, method={method}, data={data}', sender=sender, method=method, data=to_unicode(data))
             self._playerinfo.add_upnext(data.get('episode_id'))
 
+    def queue_prefetch(self, destination, kwargs):
+        """Queue a listing to render in the background, unless it is pending already"""
+        key = url_for(destination, **kwargs)
+        if key in self._prefetch_pending:
+            return
+        self._prefetch_pending.add(key)
+        if self._prefetch_queue is None:
+            try:  # Python 3
+                from queue import Queue
+            except ImportError:  # Python 2
+                from Queue import Queue
+            from threading import Thread
+            self._prefetch_queue = Queue()
+            thread = Thread(target=self.prefetch_worker)
+            thread.daemon = True
+            thread.start()
+        self._prefetch_queue.put((key, destination, kwargs))
+
+    def prefetch_worker(self):
+        """Render queued listings one at a time"""
+        while not self.abortRequested():
+            key, destination, kwargs = self._prefetch_queue.get()
+            try:
+                prefetch_listings(destination, kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                log_error('Failed to prefetch listing {key}: {error}', key=key, error=exc)
+            finally:
+                self._prefetch_pending.discard(key)
+
+    @staticmethod
+    def revalidate(kind, **kwargs):
+        """Refresh a cache entry and refresh the add-on container when its content changed"""
+        if kind == 'graphql':
+            from api import revalidate_api_cache
+            changed = revalidate_api_cache(**kwargs)
+        else:
+            from kodiutils import revalidate_cache
+            changed = revalidate_cache(**kwargs)
+        if not changed:
+            return
+        # Pre-rendered listings were built from the stale data
+        invalidate_caches('listing.*.json')
+        url = current_container_url()
+        if url and url.startswith('plugin://' + addon_id()):
+            container_refresh()
+
     def onSettingsChanged(self):  # pylint: disable=invalid-name
         """Handler for changes to settings"""
 
         log(1, 'Settings changed')
+        invalidate_settings()
+        invalidate_network_config()
+        # Pre-rendered listings depend on settings, e.g. itemsperpage, showfanart and colour_theme
+        invalidate_caches('listing.*.json')
         TokenResolver().refresh_login()
 
         # Init watching activity again when settings change
@@ -12,7 +12,7 @@ except ImportError:  # Python 2
 
 from helperobjects import ApiData, StreamURLS
 from kodiutils import (addon_profile, can_play_drm, container_reload, exists, end_of_directory, generate_expiration_date, get_cache,
-                       get_max_bandwidth, get_setting_bool, get_url_json, has_inputstream_adaptive, invalidate_caches, kodi_version_major,
+                       get_cached_url_json, get_max_bandwidth, get_setting_bool, get_url_json, has_inputstream_adaptive, invalidate_caches, kodi_version_major,
                        localize, log, log_error, mkdir, ok_dialog, open_settings, open_url, supports_drm, to_unicode, update_cache)
 
 
@@ -36,17 +36,9 @@ class StreamService:
 
     def _get_vualto_license_url(self):
         """Get Widevine license URL from Vualto API"""
-        # Try cache
-        data = get_cache('vualto_license_url.json')
-        if data:
-            return data.get('la_url')
-
-        vualto_license_url = get_url_json(url=self._VUPLAY_API_URL, fail={}).get('drm_providers', {}).get('widevine', {})
-        if vualto_license_url:
-            from json import dumps
-            vualto_license_url.update(expirationDate=generate_expiration_date(hours=168))
-            update_cache('vualto_license_url.json', dumps(vualto_license_url))
-        return vualto_license_url.get('la_url')
+        # Cache the DRM providers document for a week, and revalidate it afterwards
+        drm_providers = get_cached_url_json(url=self._VUPLAY_API_URL, cache='vualto_drm_providers.json', ttl=7 * 24 * 60 * 60, fail={})
+        return drm_providers.get('drm_providers', {}).get('widevine', {}).get('la_url')
 
     @staticmethod
     def _create_settings_dir():
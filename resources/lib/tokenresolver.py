@@ -6,7 +6,7 @@ from __future__ import absolute_import, division, unicode_literals
 from kodiutils import (addon_profile, delete, delete_cache, exists, get_cache, get_cache_dir, get_setting, open_url,
                        get_url_json, has_credentials, invalidate_caches, listdir,
                        localize, log, log_error, notification, ok_dialog,
-                       open_settings, set_setting, update_cache)
+                       open_settings, set_setting, single_flight, update_cache)
 from utils import from_unicode
 
 try:  # Python 3
@@ -218,12 +218,24 @@ class TokenResolver:
     def get_token(self, name, variant=None, roaming=False):
         """Get a token"""
 
+        if roaming:
+            return self._request_token(name, variant, roaming=True)
+
         # Try to get a cached token
-        if not roaming:
-            token = self._get_cached_token(name, variant)
-            if token:
-                return token.get(name)
+        token = self._get_cached_token(name, variant)
+        if token:
+            return token.get(name)
+
+        # Avoid requesting the same token from both the plugin and the service
+        with single_flight(self._get_token_filename(name, variant), cache_dir=self._TOKEN_CACHE_DIR) as waited:
+            if waited:
+                token = self._get_cached_token(name, variant)
+                if token:
+                    return token.get(name)
+            return self._request_token(name, variant)
 
+    def _request_token(self, name, variant=None, roaming=False):
+        """Refresh a token, or get a new one"""
         # Try to refresh a token
         if name.startswith('vrtnu'):
             refresh_token = self._get_cached_token('vrtnu-site_profile_rt')
@@ -391,7 +403,7 @@ class TokenResolver:
 
         # Delete user-related caches
         invalidate_caches(
-            'continue-*.json', 'favorites.json', 'my-offline-*.json', 'my-recent-*.json',
+            'continue-*.json', 'favorites.json', 'listing.*.json', 'my-offline-*.json', 'my-recent-*.json',
             'resume_points.json')
 
     def logged_in(self):
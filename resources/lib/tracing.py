@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Implements opt-in tracing of HTTP requests with a timing breakdown"""
+
+from __future__ import absolute_import, division, unicode_literals
+from contextlib import contextmanager
+from threading import Lock, local
+from timeit import default_timer
+
+TRACE_FILE = 'tracing.jsonl'
+TRACE_FILE_SIZE = 1024 * 1024
+TRACE_PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer', 'decode')
+
+_STATE = local()
+_LOCK = Lock()
+_INVOCATION = {'id': None, 'path': None}
+
+
+def start_invocation(path):
+    """Tag the traces of a plugin invocation or the service"""
+    from time import time
+    _INVOCATION['id'] = '{:.3f}'.format(time())
+    _INVOCATION['path'] = path
+
+
+def is_enabled():
+    """Whether HTTP request tracing is enabled"""
+    from kodiutils import get_cached_setting_bool
+    return get_cached_setting_bool('tracing', default=False)
+
+
+def is_active():
+    """Whether a request is being traced in the current thread"""
+    return getattr(_STATE, 'record', None) is not None
+
+
+def get_record():
+    """Return the record of the request being traced in the current thread"""
+    return getattr(_STATE, 'record', None)
+
+
+def begin(url, cache=None, data=None):
+    """Start tracing a request in the current thread, returns None if disabled or a request is already being traced"""
+    if is_active() or not is_enabled():
+        return None
+    from time import time
+    try:  # Python 3
+        from urllib.parse import urlsplit
+    except ImportError:  # Python 2
+        from urlparse import urlsplit
+    parts = urlsplit(url)
+    record = {
+        'time': round(time(), 3),
+        'invocation': _INVOCATION.get('id'),
+        'path': _INVOCATION.get('path'),
+        # Never store query strings, they may contain tokens
+        'endpoint': parts.netloc + parts.path,
+        'caller': cache or get_operation_name(data),
+        'cache': 'miss' if cache else None,
+        'bytes': 0,
+        '_start': default_timer(),
+    }
+    _STATE.record = record
+    return record
+
+
+def get_operation_name(data):
+    """Return the GraphQL operation name of a request payload"""
+    if not data:
+        return None
+    from json import loads
+    try:
+        payload = loads(data)
+        if isinstance(payload, list):  # Batched operations
+            return '+'.join(item.get('operationName') for item in payload)
+        return payload.get('operationName')
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def add(key, value):
+    """Add a duration in seconds or a number of bytes to the request being traced"""
+    record = getattr(_STATE, 'record', None)
+    if record is not None:
+        record[key] = record.get(key, 0) + value
+
+
+def update(**kwargs):
+    """Set fields of the request being traced"""
+    record = getattr(_STATE, 'record', None)
+    if record is not None:
+        record.update(kwargs)
+
+
+@contextmanager
+def phase(name):
+    """Measure a phase of the request being traced"""
+    start = default_timer()
+    try:
+        yield
+    finally:
+        add(name, default_timer() - start)
+
+
+def end(record, **kwargs):
+    """Finish tracing a request and write the record"""
+    if record is None:
+        return
+    _STATE.record = None
+    record.update(kwargs)
+    record['total'] = default_timer() - record.pop('_start')
+    for key in TRACE_PHASES + ('total',):
+        if key in record:
+            record[key] = round(record.get(key) * 1000, 1)
+    write_record(record)
+
+
+def get_trace_files():
+    """Return the current and the rotated trace file"""
+    import os
+    from kodiutils import addon_profile
+    path = os.path.join(addon_profile(), TRACE_FILE)
+    return path[:-len('.jsonl')] + '.1.jsonl', path
+
+
+def write_record(record):
+    """Append a record to the trace file, rotate it when it grows too large"""
+    import os
+    from io import open as io_open
+    from json import dumps
+    from kodiutils import log_error
+    rotated, path = get_trace_files()
+    line = dumps(record, sort_keys=True) + '\n'
+    with _LOCK:
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            if os.path.exists(path) and os.path.getsize(path) > TRACE_FILE_SIZE:
+                if os.path.exists(rotated):
+                    os.remove(rotated)
+                os.rename(path, rotated)
+            with io_open(path, 'a', encoding='utf-8') as fdesc:
+                fdesc.write(line)
+        except (IOError, OSError) as exc:
+            log_error('Failed to write trace: {error}', error=exc)
+
+
+def read_records():
+    """Return all records from the trace files, oldest first"""
+    import os
+    from io import open as io_open
+    from json import loads
+    records = []
+    for path in get_trace_files():
+        if not os.path.exists(path):
+            continue
+        with io_open(path, 'r', encoding='utf-8') as fdesc:
+            for line in fdesc:
+                try:
+                    records.append(loads(line))
+                except ValueError:  # Partially written line
+                    continue
+    return records
+
+
+def percentile(values, fraction):
+    """Return a nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    from math import ceil
+    return values[max(0, int(ceil(fraction * len(values))) - 1)]
+
+
+def summarize(invocations=10):
+    """Return p50/p95 latencies per endpoint over the last plugin invocations"""
+    records = [record for record in read_records() if record.get('invocation')]
+    last = []
+    for record in reversed(records):
+        if record.get('invocation') not in last:
+            if len(last) >= invocations:
+                break
+            last.append(record.get('invocation'))
+
+    endpoints = {}
+    for record in records:
+        if record.get('invocation') not in last:
+            continue
+        key = record.get('endpoint')
+        if record.get('caller') and record.get('caller') not in key:
+            key = '{endpoint} ({caller})'.format(endpoint=key, caller=record.get('caller'))
+        summary = endpoints.setdefault(key, {'endpoint': key, 'requests': 0, 'hits': 0, 'bytes': 0, 'latencies': []})
+        summary['requests'] += 1
+        if record.get('cache') == 'hit':
+            summary['hits'] += 1
+            continue
+        summary['bytes'] += record.get('bytes', 0)
+        summary['latencies'].append(record.get('total'))
+
+    summaries = []
+    for summary in endpoints.values():
+        latencies = sorted(summary.pop('latencies'))
+        summary['p50'] = percentile(latencies, 0.50)
+        summary['p95'] = percentile(latencies, 0.95)
+        summaries.append(summary)
+    return len(last), sorted(summaries, key=lambda item: item.get('p95') or 0, reverse=True)
+
+
+def show_summary(invocations=10):
+    """Show p50/p95 latencies per endpoint in a text viewer"""
+    from kodiutils import get_cache_stats, localize, textviewer
+    count, summaries = summarize(invocations)
+    lines = ['{count} invocations, {endpoints} endpoints'.format(count=count, endpoints=len(summaries)),
+             'Cache: {entries} entries, {size} bytes, {expirations} expired, {evictions} evicted'.format(**get_cache_stats()), '']
+    for summary in summaries:
+        lines.append('[B]{endpoint}[/B]'.format(**summary))
+        if summary.get('p50') is None:
+            lines.append('    {requests} requests, {hits} cache hits'.format(**summary))
+        else:
+            lines.append('    {requests} requests, {hits} cache hits, p50 {p50:.0f} ms, p95 {p95:.0f} ms, {bytes} bytes'.format(**summary))
+    textviewer(heading=localize(30947), text='\n'.join(lines))
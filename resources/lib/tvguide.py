@@ -11,11 +11,11 @@ import dateutil.tz
 from data import CHANNELS, RELATIVE_DATES
 from favorites import Favorites
 from helperobjects import TitleItem
-from kodiutils import (colour, get_cached_url_json, get_url_json, has_addon, localize,
+from kodiutils import (colour, get_cached_url_json, get_url_json, get_url_json_many, has_addon, localize,
                        localize_datelong, show_listing, themecolour, ttl, url_for)
 from metadata import Metadata
 from resumepoints import ResumePoints
-from utils import add_https_proto, find_entry, html_to_kodi, url_to_program
+from utils import add_https_proto, find_entry, html_to_kodi, parse_datetime, url_to_program
 
 
 class TVGuide:
@@ -148,6 +148,14 @@ class TVGuide:
             ))
         return channel_items
 
+    def get_schedule_request(self, date):
+        """Return the request for the schedule of a given date, relative dates are cached"""
+        now = datetime.now(dateutil.tz.tzlocal())
+        epg_url = self.parse(date, now).strftime(self.VRT_TVGUIDE)
+        if date in ('today', 'yesterday', 'tomorrow'):
+            return {'url': epg_url, 'cache': 'schedule.{date}.json'.format(date=date), 'ttl': ttl('indirect'), 'fail': {}}
+        return {'url': epg_url, 'fail': {}}
+
     def get_episode_items(self, date, channel):
         """Show episodes for a given date and channel"""
         now = datetime.now(dateutil.tz.tzlocal())
@@ -168,12 +176,13 @@ class TVGuide:
             episodes = schedule.get(entry.get('id'), [])
         else:
             episodes = []
+        stream_ids = self.get_stream_ids_many(episodes)
         episode_items = []
         for episode in episodes:
             program = url_to_program(episode.get('url', ''))
             context_menu, favorite_marker = self._metadata.get_context_menu(episode, program, cache_file)
             label = self._metadata.get_label(episode)
-            path = self.get_episode_path(episode, channel)
+            path = self.get_episode_path(episode, channel, stream_ids=stream_ids)
             # Playable item
             if '/play/' in path:
                 is_playable = True
@@ -184,8 +193,8 @@ class TVGuide:
                 label = '[COLOR={greyedout}]%s[/COLOR]' % label
 
             # Now playing
-            start_date = dateutil.parser.parse(episode.get('startTime'))
-            end_date = dateutil.parser.parse(episode.get('endTime'))
+            start_date = parse_datetime(episode.get('startTime'))
+            end_date = parse_datetime(episode.get('endTime'))
             if start_date <= now <= end_date:
                 if is_playable:
                     label = '[COLOR={highlighted}]%s[/COLOR] %s' % (label, localize(30301))
@@ -207,40 +216,47 @@ class TVGuide:
         return episode_items
 
     @staticmethod
-    def get_stream_ids(episode_id=None):
-        """Get videoId and publicationId using VRT MAX REST API"""
-        from api import api_req
-        video_id = None
-        publication_id = None
-        graphql_query = """
-            query Stream($id: ID!) {
-              catalogMember(id: $id) {
-                ...stream
-              }
-            }
-            fragment stream on Episode {
-              watchAction {
-                videoId
-                publicationId
-              }
-            }
-        """
+    def get_stream_ids_query(episode_id):
+        """Return the GraphQL query for the videoId and publicationId of an episode"""
+        from graphql_data import get_episode_query
         operation_name = 'Stream'
         variables = {
             'id': episode_id
         }
-        episode = api_req(graphql_query, operation_name, variables).get('data').get('catalogMember')
-        if episode:
-            video_id = episode.get('watchAction').get('videoId')
-            publication_id = episode.get('watchAction').get('publicationId')
-        return video_id, publication_id
+        return get_episode_query(operation_name), operation_name, variables
+
+    @staticmethod
+    def parse_stream_ids(api_data):
+        """Return videoId and publicationId from a Stream query result"""
+        episode = (api_data.get('data') or {}).get('catalogMember')
+        if not episode:
+            return None, None
+        return episode.get('watchAction').get('videoId'), episode.get('watchAction').get('publicationId')
+
+    def get_stream_ids(self, episode_id=None):
+        """Get videoId and publicationId using VRT MAX GraphQL API"""
+        from api import api_req
+        return self.parse_stream_ids(api_req(*self.get_stream_ids_query(episode_id)))
+
+    def get_stream_ids_many(self, episodes):
+        """Get videoId and publicationId of all playable episodes in batched requests, returns a dict keyed by episodeId"""
+        from api import api_req_batch
+        episode_ids = []
+        for episode in episodes:
+            if episode.get('url') and episode.get('episodeId') and episode.get('episodeId') not in episode_ids:
+                episode_ids.append(episode.get('episodeId'))
+        queries = [self.get_stream_ids_query(episode_id) for episode_id in episode_ids]
+        return {episode_id: self.parse_stream_ids(api_data) for episode_id, api_data in zip(episode_ids, api_req_batch(queries))}
 
-    def get_episode_path(self, episode, channel):
+    def get_episode_path(self, episode, channel, stream_ids=None):
         """Return a playable plugin:// path for an episode"""
         now = datetime.now(dateutil.tz.tzlocal())
-        end_date = dateutil.parser.parse(episode.get('endTime'))
+        end_date = parse_datetime(episode.get('endTime'))
         if episode.get('url') and episode.get('episodeId'):
-            video_id, publication_id = self.get_stream_ids(episode_id=episode.get('episodeId'))
+            if stream_ids and episode.get('episodeId') in stream_ids:
+                video_id, publication_id = stream_ids.get(episode.get('episodeId'))
+            else:
+                video_id, publication_id = self.get_stream_ids(episode_id=episode.get('episodeId'))
             return url_for('play_id', video_id=video_id, publication_id=publication_id)
         if now - timedelta(hours=24) <= end_date <= now:
             return url_for('play_air_date', channel, episode.get('startTime')[:19], episode.get('endTime')[:19])
@@ -251,10 +267,12 @@ class TVGuide:
         now = datetime.now(dateutil.tz.tzlocal())
 
         epg_data = {}
-        for date in ['yesterday', 'today', 'tomorrow']:
-            epg = self.parse(date, now)
-            epg_url = epg.strftime(self.VRT_TVGUIDE)
-            schedule = get_url_json(url=epg_url, fail={})
+        # Fetch the schedules of all days concurrently
+        requests = [{'url': self.parse(date, now).strftime(self.VRT_TVGUIDE), 'fail': {}} for date in ['yesterday', 'today', 'tomorrow']]
+        schedules = get_url_json_many(requests)
+        # Fetch the stream ids of all episodes in batched requests
+        stream_ids = self.get_stream_ids_many([episode for schedule in schedules for episodes in schedule.values() for episode in episodes])
+        for schedule in schedules:
             for channel_id, episodes in list(schedule.items()):
                 channel = find_entry(CHANNELS, 'id', channel_id)
                 epg_id = channel.get('epg_id')
@@ -262,7 +280,7 @@ class TVGuide:
                     epg_data[epg_id] = []
                 for episode in episodes:
                     if episode.get('url') and episode.get('episodeId'):
-                        video_id, publication_id = self.get_stream_ids(episode_id=episode.get('episodeId'))
+                        video_id, publication_id = stream_ids.get(episode.get('episodeId'), (None, None))
                         path = url_for('play_id', video_id=video_id, publication_id=publication_id)
                     else:
                         path = None
@@ -298,8 +316,8 @@ class TVGuide:
                 episode = next(episodes)
             except StopIteration:
                 break
-            start_date = dateutil.parser.parse(episode.get('startTime'))
-            end_date = dateutil.parser.parse(episode.get('endTime'))
+            start_date = parse_datetime(episode.get('startTime'))
+            end_date = parse_datetime(episode.get('endTime'))
             if start_date <= now <= end_date:  # Now playing
                 return episode.get('title')
         return ''
@@ -332,8 +350,8 @@ class TVGuide:
                 episode = next(episodes)
             except StopIteration:
                 break
-            start_date = dateutil.parser.parse(episode.get('startTime'))
-            end_date = dateutil.parser.parse(episode.get('endTime'))
+            start_date = parse_datetime(episode.get('startTime'))
+            end_date = parse_datetime(episode.get('endTime'))
             if start_date <= now <= end_date:  # Now playing
                 description = '[COLOR={highlighted}][B]%s[/B] %s[/COLOR]\n' % (localize(30421), self.episode_description(episode))
                 try:
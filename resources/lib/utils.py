@@ -27,6 +27,10 @@ HTML_MAPPING = [
     (re.compile('<br>\n{0,1}', re.I), ' '),  # This appears to be specific formatting for VRT MAX, but unwanted by us
     (re.compile('(&nbsp;\n){2,}', re.I), '\n'),  # Remove repeating non-blocking spaced newlines
 ]
+ISO8601_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?(?:(Z)|([+-])(\d{2}):?(\d{2}))?$')
+ISO8601_CACHE_SIZE = 4096
+
+_DATETIMES = {}
 
 
 def to_unicode(text, encoding='utf-8', errors='strict'):
@@ -255,3 +259,30 @@ def youtube_to_plugin_url(url):
     if not url.endswith('/'):
         url += '/'
     return url
+
+
+def parse_datetime(value):
+    """Parse a VRT timestamp like 2023-01-01T20:00:00.000+01:00, other formats are parsed by dateutil"""
+    result = _DATETIMES.get(value)
+    if result is not None:
+        return result
+    match = ISO8601_RE.match(value)
+    if match is None:
+        import dateutil.parser
+        result = dateutil.parser.parse(value)
+    else:
+        from datetime import datetime
+        import dateutil.tz
+        year, month, day, hour, minute, second, fraction, utc, sign, tz_hours, tz_minutes = match.groups()
+        tzinfo = None
+        if utc:
+            tzinfo = dateutil.tz.UTC
+        elif sign:
+            offset = (int(tz_hours) * 60 + int(tz_minutes)) * 60
+            tzinfo = dateutil.tz.tzoffset(None, -offset if sign == '-' else offset) if offset else dateutil.tz.UTC
+        microsecond = int(fraction[:6].ljust(6, '0')) if fraction else 0
+        result = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0), microsecond, tzinfo)
+    if len(_DATETIMES) >= ISO8601_CACHE_SIZE:
+        _DATETIMES.clear()
+    _DATETIMES[value] = result
+    return result
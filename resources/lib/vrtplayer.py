@@ -3,13 +3,14 @@
 """Implements a VRTPlayer class"""
 
 from __future__ import absolute_import, division, unicode_literals
-from api import (get_categories, get_channels, get_continue_episodes, get_episode_by_air_date, get_featured, get_programs, get_episodes, get_favorite_programs,
-                 get_recent_episodes, get_offline_programs, get_single_episode, get_latest_episode, get_youtube)
+from api import (api_req, get_categories, get_channels, get_continue_episodes, get_episode_by_air_date, get_featured, get_programs,
+                 get_programs_query, get_episodes, get_favorite_programs, get_recent_episodes, get_offline_programs, get_single_episode,
+                 get_latest_episode, get_youtube)
 from helperobjects import TitleItem
 from kodiutils import (delete_cached_thumbnail, end_of_directory, get_addon_info,
-                       get_setting, get_setting_bool, has_credentials,
+                       get_cached_setting_bool, get_setting, get_url_json_many, has_credentials,
                        has_inputstream_adaptive, localize, kodi_version_major, log_error,
-                       ok_dialog, play, set_setting, show_listing, url_for,
+                       ok_dialog, play, set_setting, show_cached_listing, show_listing, ttl, url_for,
                        wait_for_resumepoints)
 from utils import find_entry
 
@@ -138,7 +139,7 @@ class VRTPlayer:
                     info_dict={'plot': localize(30055)})
             )
 
-        if get_setting_bool('addmymovies', default=True):
+        if get_cached_setting_bool('addmymovies', default=True):
             favorites_items.append(
                 TitleItem(label=localize(30042),  # My movies
                           path=url_for('categories', category='films'),
@@ -146,7 +147,7 @@ class VRTPlayer:
                           info_dict={'plot': localize(30043)})
             )
 
-        if get_setting_bool('addmydocu', default=True):
+        if get_cached_setting_bool('addmydocu', default=True):
             favorites_items.append(
                 TitleItem(label=localize(30044),  # My documentaries
                           path=url_for('categories', category='docu'),
@@ -154,7 +155,7 @@ class VRTPlayer:
                           info_dict={'plot': localize(30045)})
             )
 
-        if get_setting_bool('addmymusic', default=True):
+        if get_cached_setting_bool('addmymusic', default=True):
             favorites_items.append(
                 TitleItem(label=localize(30046),  # My music
                           path=url_for('categories', category='muziek'),
@@ -166,16 +167,20 @@ class VRTPlayer:
 
     def show_favorites_tvshow_menu(self, end_cursor=''):
         """The VRT MAX add-on 'All programs' listing menu"""
-        tvshow_items = get_favorite_programs(end_cursor=end_cursor)
-        show_listing(tvshow_items, category=30440, sort='label', content='tvshows')  # A-Z
+        if show_cached_listing(ttl('indirect')):
+            return
+        tvshow_items = get_favorite_programs(end_cursor=end_cursor, lazy=True)
+        show_listing(tvshow_items, category=30440, sort='label', content='tvshows', cache_listing=True)  # A-Z
 
     def show_category_menu(self, category=None, end_cursor=''):
         """The VRT MAX add-on 'Categories' listing menu"""
         if category:
-            tvshow_items = get_programs(category=category, end_cursor=end_cursor)
+            if show_cached_listing(ttl('indirect')):
+                return
+            tvshow_items = get_programs(category=category, end_cursor=end_cursor, lazy=True)
             from data import CATEGORIES
             category_msgctxt = find_entry(CATEGORIES, 'id', category).get('msgctxt')
-            show_listing(tvshow_items, category=category_msgctxt, sort='label', content='tvshows')
+            show_listing(tvshow_items, category=category_msgctxt, sort='label', content='tvshows', cache_listing=True)
         else:
             category_items = get_categories()
             show_listing(category_items, category=30014, sort='unsorted', content='files')  # Categories
@@ -184,13 +189,24 @@ class VRTPlayer:
         """The VRT MAX add-on 'Channels' listing menu"""
         if channel:
             if not end_cursor:
+                from threading import Thread
                 from tvguide import TVGuide
+                tvguide = TVGuide()
+                # Fetch today's schedule into its cache while the TV shows are fetched
+                schedule = Thread(target=get_url_json_many, args=([tvguide.get_schedule_request('today')],))
+                schedule.start()
+                _, programs_query = get_programs_query(channel=channel)
+                programs_data = api_req(*programs_query)
+                schedule.join()
                 channel_items = get_channels(channels=[channel])  # Live TV
-                channel_items.extend(TVGuide().get_channel_items(channel=channel))  # TV guide
+                channel_items.extend(tvguide.get_channel_items(channel=channel))  # TV guide
                 channel_items.extend(get_youtube(channels=[channel]))  # YouTube
-                channel_items.extend(get_programs(channel=channel))  # TV shows
+                if programs_data and programs_data.get('data'):
+                    channel_items.extend(get_programs(channel=channel, api_data=programs_data))  # TV shows
+                else:
+                    log_error('Failed to get TV shows of channel {channel}', channel=channel)
             else:
-                channel_items = get_programs(channel=channel, end_cursor=end_cursor)
+                channel_items = get_programs(channel=channel, end_cursor=end_cursor, lazy=True)
             from data import CHANNELS
             channel_name = find_entry(CHANNELS, 'name', channel).get('label')
             show_listing(channel_items, category=channel_name, sort='unsorted', content='tvshows', cache=False)  # Channel
@@ -201,8 +217,10 @@ class VRTPlayer:
     @staticmethod
     def show_featured_menu(feature=None, end_cursor=''):
         """The VRT MAX add-on 'Featured content' listing menu"""
-        featured_items, sort, ascending, content = get_featured(feature=feature, end_cursor=end_cursor)
-        show_listing(featured_items, category=30024, sort=sort, ascending=ascending, content=content)
+        if show_cached_listing(ttl('indirect')):
+            return
+        featured_items, sort, ascending, content = get_featured(feature=feature, end_cursor=end_cursor, lazy=True)
+        show_listing(featured_items, category=30024, sort=sort, ascending=ascending, content=content, cache_listing=True)
 
     def show_livetv_menu(self):
         """The VRT MAX add-on 'Live TV' listing menu"""
@@ -211,25 +229,33 @@ class VRTPlayer:
 
     def show_episodes_menu(self, program_name, season_name=None, end_cursor=''):
         """The VRT MAX add-on episodes listing menu"""
-        episodes, sort, ascending, content = get_episodes(program_name=program_name, season_name=season_name, end_cursor=end_cursor)
+        if show_cached_listing(ttl('direct')):
+            return
+        episodes, sort, ascending, content = get_episodes(program_name=program_name, season_name=season_name, end_cursor=end_cursor, lazy=True)
         # FIXME: Translate program in Program Title
-        show_listing(episodes, category=program_name.title(), sort=sort, ascending=ascending, content=content, cache=False)
+        show_listing(episodes, category=program_name.title(), sort=sort, ascending=ascending, content=content, cache=False, cache_listing=True)
 
     def show_recent_menu(self, end_cursor='', use_favorites=False):
         """The VRT MAX add-on 'Most recent' and 'My most recent' listing menu"""
-        episodes, sort, ascending, content = get_recent_episodes(end_cursor=end_cursor, use_favorites=use_favorites)
-        show_listing(episodes, category=30020, sort=sort, ascending=ascending, content=content, cache=False)
+        if show_cached_listing(ttl('direct')):
+            return
+        episodes, sort, ascending, content = get_recent_episodes(end_cursor=end_cursor, use_favorites=use_favorites, lazy=True)
+        show_listing(episodes, category=30020, sort=sort, ascending=ascending, content=content, cache=False, cache_listing=True)
 
     def show_offline_menu(self, end_cursor='', use_favorites=False):
         """The VRT MAX add-on 'Soon offline' and 'My soon offline' listing menu"""
-        programs = get_offline_programs(end_cursor=end_cursor, use_favorites=use_favorites)
-        show_listing(programs, category=30022, content='tvshows', cache=False)
+        if show_cached_listing(ttl('indirect')):
+            return
+        programs = get_offline_programs(end_cursor=end_cursor, use_favorites=use_favorites, lazy=True)
+        show_listing(programs, category=30022, content='tvshows', cache=False, cache_listing=True)
 
     @staticmethod
     def show_continue_menu(end_cursor=''):
         """The VRT MAX add-on 'Continue waching' listing menu"""
-        episodes, sort, ascending, content = get_continue_episodes(end_cursor=end_cursor)
-        show_listing(episodes, category=30054, sort=sort, ascending=ascending, content=content, cache=False)
+        if show_cached_listing(ttl('direct')):
+            return
+        episodes, sort, ascending, content = get_continue_episodes(end_cursor=end_cursor, lazy=True)
+        show_listing(episodes, category=30054, sort=sort, ascending=ascending, content=content, cache=False, cache_listing=True)
 
     def play_latest_episode(self, program_name):
         """A hidden feature in the VRT MAX add-on to play the latest episode of a program"""
@@ -305,9 +331,9 @@ class VRTPlayer:
     @staticmethod
     def favorites_is_activated():
         """Is favorites activated in the menu and do we have credentials ?"""
-        return get_setting_bool('usefavorites', default=True) and has_credentials()
+        return get_cached_setting_bool('usefavorites', default=True) and has_credentials()
 
     @staticmethod
     def resumepoints_is_activated():
         """Is resumepoints activated in the menu and do we have credentials ?"""
-        return get_setting_bool('usefavorites', default=True) and get_setting_bool('useresumepoints', default=True) and has_credentials()
+        return get_cached_setting_bool('usefavorites', default=True) and get_cached_setting_bool('useresumepoints', default=True) and has_credentials()
@@ -0,0 +1,352 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Run micro-benchmarks of the VRT MAX add-on on the commandline"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+from io import BytesIO
+from timeit import default_timer
+
+# Add current working directory to import paths
+CWD = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(os.path.realpath(__file__))), os.pardir, 'resources/lib'))
+sys.path.insert(0, CWD)
+import fixtures  # noqa: E402  pylint: disable=wrong-import-position
+import kodiutils  # noqa: E402  pylint: disable=wrong-import-position
+
+# pylint: disable=invalid-name
+xbmc = __import__('xbmc')
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+
+
+class BodyResponse(BytesIO):
+    """An in-memory HTTP response body"""
+
+    @staticmethod
+    def getcode():
+        """Return the HTTP status code"""
+        return 200
+
+
+class JsonRpcCounter:
+    """Count (and optionally delay) JSON-RPC calls to emulate a round trip into Kodi"""
+
+    def __init__(self, latency=0.0):
+        """Wrap xbmc.executeJSONRPC"""
+        self.calls = 0
+        self.latency = latency
+        self._orig = xbmc.executeJSONRPC
+
+    def __enter__(self):
+        """Install the wrapper"""
+        def execute_jsonrpc(*args, **kwargs):
+            """Count and delay a JSON-RPC call"""
+            self.calls += 1
+            if self.latency:
+                time.sleep(self.latency)
+            return self._orig(*args, **kwargs)
+        xbmc.executeJSONRPC = execute_jsonrpc
+        return self
+
+    def __exit__(self, *args):
+        """Restore the original xbmc.executeJSONRPC"""
+        xbmc.executeJSONRPC = self._orig
+
+
+def report(name, seconds, requests, **extra):
+    """Print a single benchmark result"""
+    details = ''.join(', {key}={value}'.format(key=key, value=value) for key, value in sorted(extra.items()))
+    print('{name:<32} {total:9.3f} ms total, {per:8.4f} ms/request{details}'.format(
+        name=name, total=seconds * 1000, per=seconds * 1000 / requests, details=details))
+
+
+def benchmark_network_config(args):
+    """Compare resolving proxies and building an opener per request with the memoized network configuration"""
+    try:  # Python 3
+        from urllib.request import build_opener, ProxyHandler
+    except ImportError:  # Python 2
+        from urllib2 import build_opener, ProxyHandler
+
+    xbmc.settings['network.usehttpproxy'] = True
+    try:
+        with JsonRpcCounter(args.latency) as counter:
+            start = default_timer()
+            for _ in range(args.requests):
+                proxies = kodiutils.resolve_proxies()
+                build_opener(ProxyHandler(proxies))
+            report('per-request proxies/opener', default_timer() - start, args.requests, jsonrpc_calls=counter.calls)
+
+        kodiutils.invalidate_network_config()
+        with JsonRpcCounter(args.latency) as counter:
+            start = default_timer()
+            for _ in range(args.requests):
+                kodiutils.get_opener()
+            report('memoized network config', default_timer() - start, args.requests, jsonrpc_calls=counter.calls)
+    finally:
+        xbmc.settings['network.usehttpproxy'] = False
+        kodiutils.invalidate_network_config()
+
+
+def fixture_bodies(path, pattern='.json'):
+    """Return the recorded JSON response bodies in a fixture directory, or a synthetic listing"""
+    bodies = []
+    for root, _, files in sorted(os.walk(path)):
+        for name in sorted(files):
+            if name.endswith(pattern):
+                fixture = fixtures.load_fixture(root, name)
+                if 'json' in fixture:
+                    bodies.append((os.path.relpath(os.path.join(root, name), path), fixtures.fixture_body(fixture)))
+    if bodies:
+        return bodies
+    print('No fixtures found in %s, using a synthetic listing' % path)
+    episode = {
+        '__typename': 'EpisodeTile', 'title': 'Aflevering', 'description': 'Een beschrijving van deze aflevering' * 4,
+        'image': {'templateUrl': 'https://images.vrt.be/orig/2023/01/01/abcdef.jpg', 'alt': None},
+        'onTimeRaw': '2023-01-01T20:00:00.000+01:00', 'offTimeRaw': '2024-01-01T23:59:00.000+01:00',
+        'program': {'title': 'Programma', 'link': '/vrtnu/a-z/programma/'}, 'watchAction': {'videoId': 'vid-1', 'publicationId': 'pbs-pub-1'},
+    }
+    listing = {'data': {'page': {'paginatedItems': {'edges': [{'node': dict(episode, id='ep-%d' % idx)} for idx in range(50)]}}}}
+    return [('synthetic.json', json.dumps(listing).encode('utf-8'))]
+
+
+def benchmark_cache_store(args):
+    """Compare writing, reading and invalidating cache entries as files and in the cache store"""
+    import fnmatch  # pylint: disable=import-outside-toplevel
+    data = json.dumps({'data': {'list': {'paginated': {'edges': [{'node': {'id': idx}} for idx in range(50)]}}}})
+    keys = ['benchmark.%d.json' % idx for idx in range(args.requests)]
+    cache_dir = 'benchmark'
+
+    start = default_timer()
+    for key in keys:
+        kodiutils.update_file_cache(key, data, cache_dir)
+    report('files: write', default_timer() - start, len(keys))
+    start = default_timer()
+    for key in keys:
+        kodiutils.get_file_cache(key, ttl=60, cache_dir=cache_dir)
+    report('files: read', default_timer() - start, len(keys))
+    start = default_timer()
+    for _ in range(args.repeat):
+        _, files = kodiutils.listdir(kodiutils.get_cache_dir(cache_dir))
+        fnmatch.filter(files, 'listing.*.json')
+    report('files: invalidate (no match)', (default_timer() - start) / args.repeat, 1)
+    for key in keys:
+        kodiutils.delete(kodiutils.get_cache_path(key, cache_dir))
+
+    start = default_timer()
+    for key in keys:
+        kodiutils.update_cache(key, data)
+    report('cache store: write', default_timer() - start, len(keys))
+    start = default_timer()
+    for key in keys:
+        kodiutils.get_cache(key, ttl=60)
+    report('cache store: read', default_timer() - start, len(keys))
+    start = default_timer()
+    for _ in range(args.repeat):
+        kodiutils.invalidate_caches('listing.*.json')
+    report('cache store: invalidate (no match)', (default_timer() - start) / args.repeat, 1)
+    kodiutils.invalidate_caches('benchmark.*.json')
+
+
+def benchmark_compression(args):
+    """Compare bytes on the wire and decode time of identity, gzip and deflate encoded fixtures"""
+    total = {'identity': 0, 'gzip': 0, 'deflate': 0}
+    for name, body in fixture_bodies(args.fixtures):
+        fdesc = BytesIO()
+        with gzip.GzipFile(fileobj=fdesc, mode='wb') as gzipfile:
+            gzipfile.write(body)
+        encoded = {'identity': body, 'gzip': fdesc.getvalue(), 'deflate': zlib.compress(body)}
+        for encoding in ('identity', 'gzip', 'deflate'):
+            total[encoding] += len(encoded.get(encoding))
+            start = default_timer()
+            for _ in range(args.repeat):
+                response = BodyResponse(encoded.get(encoding))
+                if encoding != 'identity':
+                    response = kodiutils.DecodedResponse(response, encoding)
+                kodiutils.get_json_data(response)
+            report('%s (%s)' % (name, encoding), (default_timer() - start) / args.repeat, 1, bytes=len(encoded.get(encoding)))
+    print('Total bytes: ' + ', '.join('%s=%d' % (key, value) for key, value in sorted(total.items())))
+
+
+def benchmark_datetime(args):
+    """Compare parsing VRT timestamps with dateutil and with the memoizing ISO-8601 parser"""
+    from datetime import datetime, timedelta  # pylint: disable=import-outside-toplevel
+    import dateutil.parser  # pylint: disable=import-outside-toplevel
+    import utils  # pylint: disable=import-outside-toplevel
+    start_time = datetime(2023, 1, 1, 6, 0)
+    # Schedules and listings repeat the same timestamps, one in four is unique
+    values = [(start_time + timedelta(minutes=15 * (idx % (args.timestamps // 4 or 1)))).strftime('%Y-%m-%dT%H:%M:%S.000+01:00')
+              for idx in range(args.timestamps)]
+    start = default_timer()
+    for value in values:
+        dateutil.parser.parse(value)
+    report('dateutil.parser.parse', default_timer() - start, len(values))
+    utils._DATETIMES.clear()  # pylint: disable=protected-access
+    start = default_timer()
+    for value in values:
+        utils.parse_datetime(value)
+    report('parse_datetime (cold)', default_timer() - start, len(values))
+    start = default_timer()
+    for value in values:
+        utils.parse_datetime(value)
+    report('parse_datetime (memoized)', default_timer() - start, len(values))
+
+
+def benchmark_strings(args):
+    """Compare localizing the labels and context menus of a listing with and without the string table and template cache"""
+    from string import Formatter  # pylint: disable=import-outside-toplevel
+    # The localized strings of an episode item: plot, follow/unfollow, go to program, refresh
+    calls = [(30410, {}), (30411, {'title': 'programma'}), (30412, {'title': 'programma'}), (30417, {}), (30413, {}), (30204, {'days': 12})]
+
+    def localize_uncached(string_id, **kwargs):
+        """The former kodiutils.localize()"""
+        if kwargs:
+            return Formatter().vformat(kodiutils.ADDON.getLocalizedString(string_id), (), kodiutils.SafeDict(**kwargs))
+        return kodiutils.ADDON.getLocalizedString(string_id)
+
+    for items in (50, 300):
+        start = default_timer()
+        for _ in range(args.repeat):
+            for _ in range(items):
+                for string_id, kwargs in calls:
+                    localize_uncached(string_id, **kwargs)
+        report('%d items, uncached' % items, (default_timer() - start) / args.repeat, items * len(calls))
+        kodiutils._STRINGS.clear()  # pylint: disable=protected-access
+        kodiutils._TEMPLATES.clear()  # pylint: disable=protected-access
+        start = default_timer()
+        for _ in range(args.repeat):
+            for _ in range(items):
+                for string_id, kwargs in calls:
+                    kodiutils.localize(string_id, **kwargs)
+        report('%d items, string table' % items, (default_timer() - start) / args.repeat, items * len(calls))
+
+
+def search_listing(items):
+    """Return a synthetic paginated search result with episodes"""
+    image = {'templateUrl': 'https://images.vrt.be/orig/2023/01/01/abcdef.jpg'}
+    program = {'id': 'prog-1', 'title': 'Programma', 'link': '/vrtnu/a-z/programma/', 'programType': 'series', 'subtitle': 'Een ondertitel',
+               'image': image, 'posterImage': image}
+    edges = [{'node': {'episode': {
+        'id': 'ep-%d' % idx, 'title': 'Aflevering %d' % idx, 'description': 'Een beschrijving van deze aflevering' * 4,
+        'onTimeRaw': '2023-01-01T20:00:00.000+01:00', 'offTimeRaw': '2024-01-01T23:59:00.000+01:00', 'ageRaw': 'AL', 'regionRaw': 'BE',
+        'productPlacementShortValue': None, 'permalink': 'https://vrt.be/vrtnu/a-z/programma/1/programma-s1a%d/' % idx,
+        'durationSeconds': 1800, 'episodeNumberRaw': str(idx), 'season': {'titleRaw': '1'}, 'brand': 'een', 'image': image,
+        'analytics': {'airDate': '2023-01-01T20:00:00.000+01:00', 'categories': 'humor,series'}, 'program': program,
+        'watchAction': {'videoId': 'vid-%d' % idx, 'publicationId': 'pbs-pub-%d' % idx, 'resumePoint': None, 'resumePointTotal': None},
+        'favoriteAction': {'favorite': False},
+    }}} for idx in range(items)]
+    return {'data': {'list': {'paginated': {'edges': edges, 'pageInfo': {'hasNextPage': False, 'endCursor': None}}}}}
+
+
+def benchmark_memory(args):
+    """Compare peak memory and allocations of converting and showing search results with and without __slots__ and streaming"""
+    try:  # Python 3
+        import tracemalloc  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Python 2
+        print('Measuring memory requires tracemalloc (Python 3)')
+        return
+    import gc  # pylint: disable=import-outside-toplevel
+    import api  # pylint: disable=import-outside-toplevel
+    from helperobjects import TitleItem  # pylint: disable=import-outside-toplevel
+
+    class DictTitleItem:  # pylint: disable=too-few-public-methods
+        """The former dict-backed TitleItem"""
+        __init__ = TitleItem.__dict__['__init__']
+
+    api_data = search_listing(args.items)
+
+    def measure(name, convert_and_show):
+        """Report the peak memory and the number of memory blocks allocated by converting and showing a listing"""
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        start = default_timer()
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                items = convert_and_show()
+            finally:
+                sys.stdout = stdout
+        elapsed = default_timer() - start
+        blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del items
+        report(name, elapsed, args.items, peak_kib=peak // 1024, retained_blocks=blocks)
+
+    def convert(lazy=False):
+        """Convert the search result like api.get_search() does"""
+        return api.convert_episodes(api_data, destination='search_query', lazy=lazy, keywords='programma')[0]
+
+    convert()  # Warm up the string table, url templates and timestamps
+    for title_item in (DictTitleItem, TitleItem):
+        api.TitleItem = title_item
+        try:
+            measure('convert, %s' % title_item.__name__, convert)
+            measure('convert+show, %s' % title_item.__name__, lambda: kodiutils.show_listing(convert(), category=30032, content='tvshows'))
+        finally:
+            api.TitleItem = TitleItem
+    measure('convert+show, streamed', lambda: kodiutils.show_listing(convert(lazy=True), category=30032, content='tvshows'))
+
+
+def benchmark_routes(args):
+    """Time plugin routes with cold caches, replaying recorded fixtures instead of using the network"""
+    os.environ.setdefault('VRTMAX_FIXTURES', 'replay')
+    os.environ.setdefault('VRTMAX_FIXTURES_DIR', args.fixtures)
+    kodiutils.invalidate_network_config()
+    import addon  # pylint: disable=import-outside-toplevel
+    for route in args.routes:
+        elapsed = 0.0
+        for _ in range(args.repeat):
+            kodiutils.invalidate_caches('*.json')
+            start = default_timer()
+            with open(os.devnull, 'w') as devnull:
+                stdout, sys.stdout = sys.stdout, devnull
+                try:
+                    addon.run(['plugin://plugin.video.vrt.nu' + route, '0', ''])
+                finally:
+                    sys.stdout = stdout
+            elapsed += default_timer() - start
+        report(route, elapsed / args.repeat, 1)
+
+
+BENCHMARKS = {
+    'cache_store': benchmark_cache_store,
+    'compression': benchmark_compression,
+    'datetime': benchmark_datetime,
+    'memory': benchmark_memory,
+    'network_config': benchmark_network_config,
+    'routes': benchmark_routes,
+    'strings': benchmark_strings,
+}
+
+
+def main():
+    """Run the selected benchmarks"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark', help='one of %s (default: all)' % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--requests', type=int, default=50, help='number of requests in a session (default: 50)')
+    parser.add_argument('--items', type=int, default=300, help='number of search results to convert (default: 300)')
+    parser.add_argument('--timestamps', type=int, default=10000, help='number of timestamps to parse (default: 10000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='emulated JSON-RPC round trip in seconds (default: 0)')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='directory with recorded fixtures (default: tests/fixtures)')
+    parser.add_argument('--repeat', type=int, default=20, help='number of repetitions for timings (default: 20)')
+    parser.add_argument('--routes', nargs='+', default=['/', '/featured', '/tvguide/date/today', '/recent'],
+                        help='plugin routes to run against the fixtures (default: /, /featured, /tvguide/date/today, /recent)')
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmark: %s' % ', '.join(sorted(unknown)))
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        print('** Benchmark %s' % name)
+        BENCHMARKS.get(name)(args)
+
+
+if __name__ == '__main__':
+    main()
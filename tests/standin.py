@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Run a local stand-in for the VRT APIs, serving recorded fixtures
+
+Record fixtures once:  VRTMAX_FIXTURES=record python tests/run.py /tvguide/date/today
+Serve them:            python tests/standin.py --plant-token
+Run the add-on:        VRTMAX_STANDIN=http://127.0.0.1:8765 python tests/run.py /tvguide/date/today
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import argparse
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from threading import Thread
+
+try:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# Add current working directory to import paths
+CWD = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(os.path.realpath(__file__))), os.pardir, 'resources/lib'))
+sys.path.insert(0, CWD)
+import fixtures  # noqa: E402  pylint: disable=wrong-import-position
+
+USERDATA_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'userdata')
+TOKEN_FILE = os.path.join('tokens', 'vrtnusite_profile_at.tkn')  # The name TokenResolver gives the cached 'vrtnu-site_profile_at' token
+SCHEDULE_RE = re.compile(r'^(.*/)schedule\.\d{4}-\d{2}-\d{2}\.json$')
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server serving fixtures"""
+    daemon_threads = True
+    directory = fixtures.FIXTURES_DIR
+    latency = 0.0
+    persisted_queries = True
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    """Serve a recorded response for a request, the original host is the first path component"""
+    protocol_version = 'HTTP/1.1'
+
+    def get_fixture(self, data=None):
+        """Return the fixture for this request"""
+        host, _, path = self.path.lstrip('/').partition('/')
+        url = 'https://{host}/{path}'.format(host=host, path=path)
+        name = fixtures.fixture_name(url, data)
+        fixture = fixtures.load_fixture(self.server.directory, name)
+        match = SCHEDULE_RE.match(name)
+        if fixture is None and match:
+            # Serve the most recent recorded schedule for any date
+            directory = os.path.join(self.server.directory, match.group(1))
+            schedules = sorted(item for item in os.listdir(directory) if SCHEDULE_RE.match('/' + item)) if os.path.isdir(directory) else []
+            if schedules:
+                fixture = fixtures.load_fixture(directory, schedules[-1])
+        return name, fixture
+
+    def send_fixture(self, data=None):
+        """Send a fixture, or an HTTP 404 error"""
+        name, fixture = self.get_fixture(data)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if fixture is None:
+            body = 'No fixture {name}'.format(name=name).encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type', 'text/plain')
+        else:
+            body = fixtures.fixture_body(fixture)
+            self.send_response(fixture.get('status', 200), fixture.get('reason'))
+            for header, value in fixture.get('headers', []):
+                self.send_header(header, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve a GET request"""
+        self.send_fixture()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Serve a POST request, GraphQL requests are keyed by operation name and variables"""
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = fixtures.get_graphql_payload(data)
+        if payload and not payload.get('query') and not self.server.persisted_queries:
+            # Answer like a GraphQL server without automatic persisted queries
+            body = b'{"errors": [{"message": "Must provide query string."}]}'
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_fixture(data)
+
+    do_DELETE = do_GET
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the output quiet"""
+
+
+def plant_token(userdata=USERDATA_DIR):
+    """Store a fake VRT MAX access token, so the add-on does not log in"""
+    from json import dump
+    token_file = os.path.join(userdata, TOKEN_FILE)
+    if not os.path.exists(os.path.dirname(token_file)):
+        os.makedirs(os.path.dirname(token_file))
+    with open(token_file, 'w') as fdesc:
+        dump({'vrtnu-site_profile_at': 'standin', 'expirationDate': '2100-01-01T00:00:00.000000Z'}, fdesc)
+
+
+@contextmanager
+def standin_server(directory=fixtures.FIXTURES_DIR, port=0, latency=0.0, persisted_queries=True):
+    """Run a stand-in server in a background thread and yield its base url"""
+    server = StandInServer(('127.0.0.1', port), StandInRequestHandler)
+    server.directory = directory
+    server.latency = latency
+    server.persisted_queries = persisted_queries
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main():
+    """Run the stand-in server"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    parser.add_argument('--fixtures', default=fixtures.FIXTURES_DIR, help='directory with recorded fixtures (default: tests/fixtures)')
+    parser.add_argument('--latency', type=float, default=0.0, help='emulated server latency in seconds (default: 0)')
+    parser.add_argument('--no-persisted-queries', action='store_true', help='answer requests without query text with an error')
+    parser.add_argument('--plant-token', action='store_true', help='store a fake access token in tests/userdata')
+    args = parser.parse_args()
+    if args.plant_token:
+        plant_token()
+    server = StandInServer(('127.0.0.1', args.port), StandInRequestHandler)
+    server.directory = args.fixtures
+    server.latency = args.latency
+    server.persisted_queries = not args.no_persisted_queries
+    print('Serving fixtures from %s on http://127.0.0.1:%d' % (args.fixtures, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
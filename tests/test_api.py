@@ -5,11 +5,18 @@
 # pylint: disable=invalid-name
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import os
 import unittest
-from api import (delete_continue, finish_continue, get_continue_episodes, get_episodes, get_favorite_programs, get_latest_episode,
-                 get_next_info, get_online_categories, get_offline_programs, get_programs, get_recent_episodes,
-                 get_resumepoint_data, get_search, get_single_episode, set_resumepoint, valid_categories)
+from json import dumps, loads
+from api import (RESUMEPOINT_CACHE_INVALIDATES, api_req, api_req_batch, delete_continue, finish_continue, format_label, get_api_cache, get_api_cache_file,
+                 get_api_payload, get_api_request_batch, get_continue_episodes, get_episodes, get_favorite_programs, get_follow_label, get_latest_episode,
+                 get_next_info, get_online_categories, get_offline_programs, get_paginated_episodes_query, get_paginated_programs_query, get_programs,
+                 get_query, get_recent_episodes, get_resumepoint_data, get_search, get_single_episode, get_single_episode_data, invalidate_api_caches,
+                 is_persisted_query_miss, set_resumepoint, update_api_cache, valid_categories)
 from data import CATEGORIES
+from graphql_data import EPISODE_FIELDS, EPISODE_PROJECTIONS, LISTED_EPISODES_QUERIES
+from kodiutils import (colour, get_cache, get_listing_cache_file, invalidate_caches, invalidate_network_config, invalidate_settings, prefetch_listings,
+                       render_listing)
 from xbmcextra import kodi_to_ansi
 
 xbmc = __import__('xbmc')
@@ -96,6 +103,15 @@ class TestApi(unittest.TestCase):
         print(len(program_items))
         self.assertTrue(program_items)
 
+    def test_get_search_lazy(self):
+        """Test streaming search items gives the same items"""
+        keywords = 'kaas'
+        program_items = get_search(keywords=keywords)
+        lazy_items = get_search(keywords=keywords, lazy=True)
+        self.assertFalse(isinstance(lazy_items, list))
+        self.assertEqual([item.path for item in lazy_items], [item.path for item in program_items])
+        self.assertFalse(hasattr(program_items[0], '__dict__'))
+
     def test_get_favorite_programs(self):
         """Test getting favorite programs"""
         programs = get_favorite_programs()
@@ -168,6 +184,18 @@ class TestApi(unittest.TestCase):
         data = delete_continue(episode_id)
         self.assertEqual(data.get('data').get('setListDeleteActionItem').get('title'), 'Verwijderd')
 
+    def test_api_req_batch(self):
+        """Test batched GraphQL requests return the same results as separate requests"""
+        from tvguide import TVGuide
+        queries = [TVGuide.get_stream_ids_query(episode_id) for episode_id in ('1392412940738', '1392412940740', '1392412940741')]
+        self.assertEqual(api_req_batch(queries), [api_req(*query) for query in queries])
+        self.assertEqual(api_req_batch(queries[:1]), [api_req(*queries[0])])
+
+    def test_persisted_queries(self):
+        """Test GraphQL requests using persisted queries"""
+        from favorites import Favorites
+        self.assertTrue(Favorites().get_program_id_graphql('het-journaal'))
+
     def test_get_categories(self):
         """Test to ensure our local hardcoded categories conforms to online categories"""
         # Remove thumbnails from scraped categories first
@@ -182,5 +210,287 @@ class TestApi(unittest.TestCase):
         self.assertEqual(online_categories, local_categories)
 
 
+class TestLabels(unittest.TestCase):
+    """TestCase class"""
+
+    def test_labels(self):
+        """Test labels are formatted from templates that are built once"""
+        from kodiutils import localize
+        self.assertEqual(get_follow_label(30411, 'series'), localize(30411, title=localize(30410)))
+        self.assertEqual(get_follow_label(30412, 'oneoff'), localize(30412, title=''))
+        self.assertIs(get_follow_label(30411, 'series'), get_follow_label(30411, 'daily'))
+        self.assertEqual(format_label('Winteruur', 'Aflevering 1', 'mixed_episodes', is_favorite=True),
+                         '[B]Winteruur[/B] - Aflevering 1' + colour('[COLOR={highlighted}]ᵛ[/COLOR]'))
+
+
+class TestPersistedQueries(unittest.TestCase):
+    """TestCase class"""
+
+    def test_persisted_query_payload(self):
+        """Test persisted query payloads contain the query hash instead of the query text"""
+        graphql_query = 'query Page($id: ID!) { page(id: $id) { id } }'
+        payload = loads(get_api_payload(graphql_query, 'Page', {'id': '/vrtnu/'}, persisted=True))
+        self.assertNotIn('query', payload)
+        self.assertEqual(payload.get('variables'), {'id': '/vrtnu/'})
+        self.assertEqual(payload.get('extensions').get('persistedQuery').get('sha256Hash'), '39ae6a306cb6d74aa044960389f9e9154ba259d5f791fcf4447502159936555b')
+        self.assertEqual(loads(get_api_payload(graphql_query, 'Page', {'id': '/vrtnu/'})).get('query'), graphql_query)
+        self.assertIs(get_query(graphql_query, 'Page'), get_query(graphql_query, 'Page'))
+
+    def test_list_type_queries(self):
+        """Test list queries are built for paginated and static lists"""
+        for get_list_query in (get_paginated_episodes_query, get_paginated_programs_query):
+            paginated, _, _ = get_list_query('dynamic:/vrtnu.model.json@resume-list-video', 50)
+            static, _, _ = get_list_query('static:/vrtnu/kijk.model.json@par_list_copy', 50)
+            self.assertIn('on PaginatedTileList', paginated)
+            self.assertNotIn('on StaticTileList', paginated)
+            self.assertEqual(static, paginated.replace('on PaginatedTileList', 'on StaticTileList'))
+
+    def test_persisted_query_miss(self):
+        """Test detecting unknown persisted queries"""
+        self.assertTrue(is_persisted_query_miss({'errors': [{'message': 'PersistedQueryNotFound'}]}))
+        self.assertTrue(is_persisted_query_miss({'errors': [{'message': 'Not found', 'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}]}))
+        self.assertFalse(is_persisted_query_miss({'data': {'page': None}, 'errors': [{'message': 'Page not found'}]}))
+        # A server without automatic persisted queries answers with a generic error
+        self.assertTrue(is_persisted_query_miss({'errors': [{'message': 'Must provide query string.'}]}))
+        # Network failures are not sent again with the full query text
+        self.assertFalse(is_persisted_query_miss(None))
+        self.assertFalse(is_persisted_query_miss({}))
+
+
+class TestApiCache(unittest.TestCase):
+    """TestCase class"""
+
+    def test_api_cache_file(self):
+        """Test GraphQL responses are cached per operation, variables and user"""
+        graphql_query = 'query VideoProgramPage($pageId: ID!) { page(id: $pageId) { id } }'
+        variables = {'pageId': '/vrtnu/a-z/winteruur/', 'lazyItemCount': 15}
+        cache_file = get_api_cache_file(graphql_query, 'VideoProgramPage', variables)
+        self.assertTrue(cache_file.startswith('graphql.VideoProgramPage.'))
+        self.assertEqual(cache_file, get_api_cache_file(graphql_query, 'VideoProgramPage', {'lazyItemCount': 15, 'pageId': '/vrtnu/a-z/winteruur/'}))
+        self.assertNotEqual(cache_file, get_api_cache_file(graphql_query, 'VideoProgramPage', variables, client='MobileAndroid'))
+        addon.settings['credentials_hash'] = 'other'
+        invalidate_settings()
+        self.assertNotEqual(cache_file, get_api_cache_file(graphql_query, 'VideoProgramPage', variables))
+        addon.settings.pop('credentials_hash')
+        invalidate_settings()
+        self.assertIsNone(get_api_cache_file('query PlayerData { id }', 'PlayerData', {'id': '1'}))
+        self.assertIsNone(get_api_cache_file('mutation setFavorite { id }', 'setFavorite', {'input': {'id': '1'}}))
+
+    def test_api_cache_file_per_query(self):
+        """Test query variants of the same operation and variables are cached separately"""
+        variables = {'listId': 'dynamic:/vrtnu.model.json@resume-list-video', 'endCursor': '', 'pageSize': 10}
+        cache_files = set(get_api_cache_file(graphql_query, 'ListedEpisodes', variables) for graphql_query in set(LISTED_EPISODES_QUERIES.values()))
+        self.assertEqual(len(cache_files), len(set(LISTED_EPISODES_QUERIES.values())))
+
+    def test_api_cache_invalidation(self):
+        """Test mutations invalidate the cached responses they affect"""
+        cache_file = get_api_cache_file(*get_paginated_programs_query('dynamic:/vrtnu.model.json@favorites-list-video', 10))
+        update_api_cache(cache_file, 'PaginatedPrograms', {'data': {'list': None}})
+        self.assertEqual(get_api_cache(cache_file, 'PaginatedPrograms'), {'data': {'list': None}})
+        update_api_cache(None, 'setFavorite', {'errors': [{'message': 'Failed'}]})
+        self.assertIsNotNone(get_api_cache(cache_file, 'PaginatedPrograms'))
+        update_api_cache(None, 'setFavorite', {'data': {'setFavorite': {'favorite': True}}})
+        self.assertIsNone(get_api_cache(cache_file, 'PaginatedPrograms'))
+
+        # Updating a resume point invalidates the continue list
+        cache_file = get_api_cache_file(*get_paginated_episodes_query('dynamic:/vrtnu.model.json@resume-list-video', 10))
+        update_api_cache(cache_file, 'ListedEpisodes', {'data': {'list': None}})
+        invalidate_api_caches(RESUMEPOINT_CACHE_INVALIDATES)
+        self.assertIsNone(get_api_cache(cache_file, 'ListedEpisodes'))
+
+
+EPISODE_ID = '1392412940738'
+IMAGE = {'alt': '', 'templateUrl': 'https://images.vrt.be/orig/2023/01/01/image.jpg'}
+PROGRAM = {'id': '1392407806771', 'title': 'Winteruur', 'link': '/vrtnu/a-z/winteruur/', 'programType': 'series', 'image': IMAGE, 'posterImage': IMAGE}
+PLAYER_DATA = {
+    '__typename': 'Episode',
+    'id': EPISODE_ID,
+    'title': 'Aflevering 1',
+    'description': 'De eerste aflevering',
+    'episodeNumberRaw': '1',
+    'durationSeconds': 600,
+    'offTimeRaw': '2030-01-01T00:00:00.000+01:00',
+    'onTimeRaw': '2023-01-01T20:00:00.000+01:00',
+    'image': IMAGE,
+    'analytics': {'airDate': '2023-01-01T20:00:00.000+01:00', 'categories': 'talkshows'},
+    'program': PROGRAM,
+    'season': {'titleRaw': '1'},
+    'watchAction': {'avodUrl': None, 'completed': False, 'resumePoint': 100, 'resumePointTotal': 600, 'resumePointProgress': 16,
+                    'resumePointTitle': 'winteruur-a1', 'episodeId': EPISODE_ID, 'videoId': 'vid-1', 'publicationId': 'pbs-pub-1', 'streamId': 'stream-1'},
+    'favoriteAction': {'favorite': False, 'id': PROGRAM.get('id'), 'title': PROGRAM.get('title')},
+    'nextUp': {'title': 'Volgende aflevering', 'autoPlay': True, 'countdown': 10, 'tile': {
+        '__typename': 'EpisodeTile',
+        'id': 'tile-2',
+        'title': 'Aflevering 2',
+        'episode': {'id': '1392412940740', 'title': 'Aflevering 2', 'description': 'De tweede aflevering', 'episodeNumberRaw': '2', 'durationSeconds': 660,
+                    'image': IMAGE, 'analytics': {'airDate': '2023-01-02T20:00:00.000+01:00'}, 'program': PROGRAM, 'season': {'titleRaw': '1'}},
+    }},
+}
+
+
+def project_fields(data, fields, paths=None):
+    """Return the part of a canonical response selected by a projection, like the server would"""
+    result = {}
+    for field in fields:
+        name, subfields = field if isinstance(field, tuple) else (field, None)
+        subpaths = None
+        if paths is not None and name not in paths:
+            subpaths = [path[len(name) + 1:] for path in paths if path.startswith(name + '.')]
+            if not subpaths or not subfields:
+                continue
+        if name.startswith('...'):  # A fragment spread selects the complete object
+            result.update(data)
+        elif name in data:
+            result[name] = project_fields(data.get(name), subfields, subpaths) if subfields and data.get(name) else data.get(name)
+    return result
+
+
+class StandInTestCase(unittest.TestCase):
+    """TestCase class for GraphQL responses served from fixtures by a stand-in server"""
+
+    def setUp(self):
+        """Create a fixtures directory, and plant a fake access token"""
+        import tempfile
+        from standin import TOKEN_FILE, USERDATA_DIR, plant_token
+        self.directory = tempfile.mkdtemp()
+        self.token_file = os.path.join(USERDATA_DIR, TOKEN_FILE)
+        self.token = None
+        if os.path.exists(self.token_file):
+            with open(self.token_file) as fdesc:
+                self.token = fdesc.read()
+        plant_token()
+
+    def tearDown(self):
+        """Restore the access token and the network configuration"""
+        import shutil
+        os.environ.pop('VRTMAX_STANDIN', None)
+        invalidate_network_config()
+        invalidate_caches('graphql.*.json')
+        if self.token is None:
+            os.remove(self.token_file)
+        else:
+            with open(self.token_file, 'w') as fdesc:
+                fdesc.write(self.token)
+        shutil.rmtree(self.directory)
+
+    def save_graphql_fixture(self, operation_name, variables, data):
+        """Store the GraphQL response of an operation as a fixture"""
+        import fixtures
+        request = dumps({'operationName': operation_name, 'variables': variables}).encode('utf-8')
+        fixture = {'headers': [['Content-Type', 'application/json']], 'json': {'data': data}}
+        fixtures.save_fixture(self.directory, fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/v1', request), fixture)
+
+
+class TestEpisodeProjections(StandInTestCase):
+    """TestCase class"""
+
+    def setUp(self):
+        """Store a fixture of every episode projection, and a fake access token"""
+        super(TestEpisodeProjections, self).setUp()
+        for operation_name, paths in EPISODE_PROJECTIONS.items():
+            self.save_graphql_fixture(operation_name, {'id': EPISODE_ID}, {'catalogMember': project_fields(PLAYER_DATA, EPISODE_FIELDS, paths)})
+
+    def test_episode_projections(self):
+        """Test every episode projection has the fields its use case needs"""
+        from standin import standin_server
+        from tvguide import TVGuide
+        with standin_server(self.directory) as standin:
+            os.environ['VRTMAX_STANDIN'] = standin
+            invalidate_network_config()
+            self.assertEqual(get_resumepoint_data(EPISODE_ID), ('vid-1', 'winteruur-a1'))
+            self.assertEqual(TVGuide().get_stream_ids(EPISODE_ID), ('vid-1', 'pbs-pub-1'))
+            next_info = get_next_info(EPISODE_ID)
+            self.assertEqual(next_info.get('current_episode').get('runtime'), 600)
+            self.assertEqual(next_info.get('next_episode').get('episodeid'), '1392412940740')
+            self.assertEqual(get_single_episode_data(EPISODE_ID).get('data').get('catalogMember'), PLAYER_DATA)
+
+    def test_api_req_batch_failure(self):
+        """Test a batched request that fails with a server error is sent again as separate requests"""
+        import fixtures
+        from graphql_data import get_episode_query
+        from standin import standin_server
+        queries = [(get_episode_query(operation_name), operation_name, {'id': EPISODE_ID}) for operation_name in ('ResumePoint', 'Stream')]
+        with standin_server(self.directory) as standin:
+            os.environ['VRTMAX_STANDIN'] = standin
+            invalidate_network_config()
+            request = get_api_request_batch(queries, persisted=True)
+            fixture = {'status': 503, 'reason': 'Service Unavailable', 'headers': [['Content-Type', 'text/plain']], 'text': 'Unavailable'}
+            fixtures.save_fixture(self.directory, fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/v1', request.get('data')), fixture)
+            results = api_req_batch(queries)
+            self.assertEqual([data_json.get('data').get('catalogMember').get('watchAction').get('videoId') for data_json in results], ['vid-1', 'vid-1'])
+
+    def test_persisted_queries_unsupported(self):
+        """Test queries are sent again with their query text to a server without automatic persisted queries"""
+        from graphql_data import get_episode_query
+        from standin import standin_server
+        queries = [(get_episode_query(operation_name), operation_name, {'id': EPISODE_ID}) for operation_name in ('ResumePoint', 'Stream')]
+        with standin_server(self.directory, persisted_queries=False) as standin:
+            os.environ['VRTMAX_STANDIN'] = standin
+            invalidate_network_config()
+            self.assertEqual(get_resumepoint_data(EPISODE_ID), ('vid-1', 'winteruur-a1'))
+            # The stand-in server rejects the batch as well, so these are sent as separate requests
+            results = api_req_batch(queries)
+            self.assertEqual([data_json.get('data').get('catalogMember').get('watchAction').get('videoId') for data_json in results], ['vid-1', 'vid-1'])
+
+
+LIST_ID = 'dynamic:/vrtnu.model.json@resume-list-video'
+PAGES = {'': 'c1', 'c1': 'c2', 'c2': None}
+
+
+class TestPrefetch(StandInTestCase):
+    """TestCase class"""
+
+    def setUp(self):
+        """Store a fixture of every page of a paginated list, and a fake access token"""
+        super(TestPrefetch, self).setUp()
+        for end_cursor, next_cursor in PAGES.items():
+            page_info = {'endCursor': next_cursor, 'hasNextPage': next_cursor is not None}
+            self.save_graphql_fixture('ListedEpisodes', {'listId': LIST_ID, 'endCursor': end_cursor, 'pageSize': 1},
+                                      {'list': {'paginated': {'edges': [{'node': {'episode': PLAYER_DATA}}], 'pageInfo': page_info}}})
+        addon.settings['prefetch'] = True
+        addon.settings['itemsperpage'] = 1
+        invalidate_settings()
+
+    def tearDown(self):
+        """Restore the settings, the access token and the network configuration"""
+        addon.settings.pop('prefetch', None)
+        addon.settings['itemsperpage'] = itemsperpage
+        invalidate_settings()
+        invalidate_caches('listing.*.json')
+        super(TestPrefetch, self).tearDown()
+
+    @staticmethod
+    def is_cached(end_cursor):
+        """Whether a page of the continue listing is cached pre-rendered"""
+        return get_cache(get_listing_cache_file('/resumepoints/continue/' + end_cursor)) is not None
+
+    def test_render_listing(self):
+        """Test rendering a listing in the background stores it under the plugin path of its 'More...' item"""
+        from standin import standin_server
+        with standin_server(self.directory) as standin:
+            os.environ['VRTMAX_STANDIN'] = standin
+            invalidate_network_config()
+            next_page, size = render_listing('resumepoints_continue', end_cursor='c1')
+            self.assertEqual(next_page, ('resumepoints_continue', {'end_cursor': 'c2'}))
+            self.assertTrue(size > 0)
+            listing = get_cache(get_listing_cache_file('/resumepoints/continue/c1'))
+            self.assertEqual([item.get('path') for item in listing.get('items')][1:], ['plugin://plugin.video.vrt.nu/resumepoints/continue/c2'])
+            self.assertFalse(self.is_cached('c2'))
+
+    def test_prefetch_listings(self):
+        """Test prefetching the next pages of a listing is capped by depth and size"""
+        from standin import standin_server
+        with standin_server(self.directory) as standin:
+            os.environ['VRTMAX_STANDIN'] = standin
+            invalidate_network_config()
+            prefetch_listings('resumepoints_continue', {'end_cursor': 'c1'}, depth=1)
+            self.assertEqual([self.is_cached(cursor) for cursor in ('c1', 'c2')], [True, False])
+            invalidate_caches('listing.*.json')
+            prefetch_listings('resumepoints_continue', {'end_cursor': 'c1'}, size=1, depth=5)
+            self.assertEqual([self.is_cached(cursor) for cursor in ('c1', 'c2')], [True, False])
+            prefetch_listings('resumepoints_continue', {'end_cursor': 'c1'}, depth=5)
+            self.assertEqual([self.is_cached(cursor) for cursor in ('c1', 'c2')], [True, True])
+
+
 if __name__ == '__main__':
     unittest.main()
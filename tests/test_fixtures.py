@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Unit tests for recording and replaying HTTP fixtures"""
+
+# pylint: disable=invalid-name,line-too-long
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import shutil
+import tempfile
+import unittest
+import fixtures
+import kodiutils
+from standin import standin_server
+from test_kodiutils import http_server
+
+GRAPHQL_DATA = b'{"operationName": "PageQuery", "variables": {"pageId": "/vrtnu/"}, "query": "query PageQuery { page { id } }"}'
+
+
+class TestFixtures(unittest.TestCase):
+    """TestCase class"""
+
+    def setUp(self):
+        """Create an empty fixture store"""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the fixture store and restore the network configuration"""
+        for key in ('VRTMAX_FIXTURES', 'VRTMAX_FIXTURES_DIR', 'VRTMAX_STANDIN'):
+            os.environ.pop(key, None)
+        kodiutils.invalidate_network_config()
+        shutil.rmtree(self.directory)
+
+    def set_environ(self, **environ):
+        """Change the fixtures environment and rebuild the openers"""
+        for key in ('VRTMAX_FIXTURES', 'VRTMAX_STANDIN'):
+            os.environ.pop(key, None)
+        os.environ['VRTMAX_FIXTURES_DIR'] = self.directory
+        os.environ.update(environ)
+        kodiutils.invalidate_network_config()
+
+    def test_fixture_name(self):
+        """Test GraphQL requests are keyed by operation name and variables"""
+        self.assertEqual(fixtures.fixture_name('https://www.vrt.be/bin/epg/schedule.2023-01-01.json'), 'www.vrt.be/bin/epg/schedule.2023-01-01.json')
+        name = fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/v1', GRAPHQL_DATA)
+        self.assertTrue(name.startswith('graphql/PageQuery.'))
+        self.assertEqual(name, fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/public/v1', GRAPHQL_DATA.replace(b'{ id }', b'{ title }')))
+        self.assertNotEqual(name, fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/v1', GRAPHQL_DATA.replace(b'/vrtnu/', b'/vrtnu/a-z/')))
+        self.assertNotIn('..', fixtures.fixture_name('https://www.vrt.be/../../etc/passwd'))
+
+    def test_record_replay(self):
+        """Test replaying recorded responses without network"""
+        with http_server() as (server, url):
+            self.set_environ(VRTMAX_FIXTURES='record')
+            self.assertEqual(kodiutils.get_url_json(url + '/gzip').get('path'), '/gzip')
+            self.assertEqual(kodiutils.get_url_json(url + '/graphql', data=GRAPHQL_DATA).get('path'), '/graphql')
+            requests = server.requests
+
+            self.set_environ(VRTMAX_FIXTURES='replay')
+            self.assertEqual(kodiutils.get_url_json(url + '/gzip').get('text'), 'Één keer' * 1000)
+            self.assertEqual(kodiutils.get_url_json(url + '/graphql', data=GRAPHQL_DATA).get('path'), '/graphql')
+            self.assertEqual(kodiutils.get_url_json(url + '/missing', fail={}), {})
+            self.assertEqual(server.requests, requests)
+
+    def test_standin_server(self):
+        """Test serving fixtures from a stand-in server"""
+        schedule = {'status': 200, 'headers': [['Content-Type', 'application/json']], 'json': {'een': []}}
+        fixtures.save_fixture(self.directory, 'www.vrt.be/bin/epg/schedule.2023-01-01.json', schedule)
+        page = {'json': {'data': {'page': {'id': '1'}}}}
+        fixtures.save_fixture(self.directory, fixtures.fixture_name('https://www.vrt.be/vrtnu-api/graphql/v1', GRAPHQL_DATA), page)
+        with standin_server(self.directory) as standin:
+            self.set_environ(VRTMAX_STANDIN=standin)
+            self.assertEqual(kodiutils.get_url_json('https://www.vrt.be/bin/epg/schedule.2024-05-05.json'), {'een': []})
+            self.assertEqual(kodiutils.get_url_json('https://www.vrt.be/vrtnu-api/graphql/v1', data=GRAPHQL_DATA), {'data': {'page': {'id': '1'}}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,23 @@
 # pylint: disable=invalid-name,line-too-long
 
 from __future__ import absolute_import, division, print_function, unicode_literals
+import gzip
+import sys
+import time
 import unittest
+import zlib
+from contextlib import contextmanager
+from io import BytesIO
+from threading import Thread
 import kodiutils
 
+try:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
 xbmc = __import__('xbmc')
 xbmcaddon = __import__('xbmcaddon')
 xbmcgui = __import__('xbmcgui')
@@ -17,6 +31,87 @@ xbmcvfs = __import__('xbmcvfs')
 addon = xbmcaddon.Addon()
 
 
+class CountingHTTPServer(ThreadingMixIn, HTTPServer):
+    """A threaded HTTP server counting incoming connections"""
+    daemon_threads = True
+    connections = 0
+    not_modified = 0
+    requests = 0
+    failures = 0
+
+
+class KeepAliveRequestHandler(BaseHTTPRequestHandler):
+    """An HTTP/1.1 request handler returning a small, optionally compressed, JSON document"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        """Count a new connection"""
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Return a JSON document, compressed when requested by the path"""
+        self.server.requests += 1
+        if self.path.endswith('/slow'):
+            time.sleep(0.3)
+        if self.server.failures:
+            self.server.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.endswith('/etag') and self.headers.get('If-None-Match') == '"v1"':
+            self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        body = b'{"path": "%s", "text": "%s"}' % (self.path.encode(), 'Één keer'.encode('utf-8') * 1000)
+        headers = {'Content-Type': 'application/json'}
+        accept_encoding = self.headers.get('Accept-Encoding', '')
+        if self.path.endswith('/gzip') and 'gzip' in accept_encoding:
+            fdesc = BytesIO()
+            with gzip.GzipFile(fileobj=fdesc, mode='wb') as gzipfile:
+                gzipfile.write(body)
+            body = fdesc.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        elif self.path.endswith('/deflate') and 'deflate' in accept_encoding:
+            body = zlib.compress(body)
+            headers['Content-Encoding'] = 'deflate'
+        if self.path.endswith('/etag'):
+            headers['ETag'] = '"v1"'
+            headers['Last-Modified'] = 'Sat, 01 Jul 2023 12:00:00 GMT'
+        headers['Content-Length'] = str(len(body))
+        self.send_response(400 if '/error/' in self.path else 200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Consume the request body and return a JSON document"""
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep the test output quiet"""
+
+
+@contextmanager
+def http_server():
+    """Run a local keep-alive HTTP server and yield its base url"""
+    server = CountingHTTPServer(('127.0.0.1', 0), KeepAliveRequestHandler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server, 'http://127.0.0.1:{port}'.format(port=server.server_address[1])
+    finally:
+        kodiutils.get_connection_pool().clear()
+        server.shutdown()
+        server.server_close()
+
+
 class TestKodiUtils(unittest.TestCase):
     """TestCase class"""
 
@@ -41,6 +136,15 @@ class TestKodiUtils(unittest.TestCase):
         #self.assertEqual(msg, "There is a problem with this VRT MAX MPEG-DASH stream. Try again with Widevine DRM enabled or try to play this program from the VRT MAX website. Please report this problem at https://www.vrt.be/vrtmax/help/")  # noqa
         self.assertEqual(msg, "Er is een probleem met deze VRT MAX MPEG-DASH-stream. Probeer het opnieuw met Widevine DRM enabled of probeer dit programma af te spelen vanaf de VRT MAX-website. Meld dit probleem op https://www.vrt.be/vrtmax/help/")  # noqa
 
+    def test_format_template(self):
+        """Test formatting cached templates like string.Formatter"""
+        from string import Formatter
+        for template, kwargs in (('{title} and {missing}', {'title': 'programma'}), ('{days!r:>5} {{days}}', {'days': 12}),
+                                 ('{title:{width}}', {'title': 'x', 'width': 3}), ('{item[title]}', {'item': {'title': 'y'}}), ('plain', {})):
+            expected = Formatter().vformat(template, (), kodiutils.SafeDict(**kwargs))
+            self.assertEqual(kodiutils.format_template(template, **kwargs), expected)
+            self.assertEqual(kodiutils.format_template(template, **kwargs), expected)
+
     @staticmethod
     def test_log_disabled():
         """Test with logging disabled"""
@@ -94,6 +198,275 @@ class TestKodiUtils(unittest.TestCase):
         self.assertTrue(isinstance(ret, list))
         self.assertEqual(len(ret), 2)
 
+    def test_settings_snapshot(self):
+        """Test settings are read once per invocation, until they are invalidated or changed"""
+        kodiutils.invalidate_settings()
+        self.assertEqual(kodiutils.get_cached_setting_int('itemsperpage', default=50), 50)
+        addon.settings['itemsperpage'] = '25'
+        self.assertEqual(kodiutils.get_cached_setting_int('itemsperpage', default=50), 50)
+        kodiutils.invalidate_settings()
+        self.assertEqual(kodiutils.get_cached_setting_int('itemsperpage', default=50), 25)
+        self.assertTrue(kodiutils.get_cached_setting_bool('showfanart', default=False))
+        kodiutils.set_setting_bool('showfanart', False)
+        self.assertFalse(kodiutils.get_cached_setting_bool('showfanart', default=True))
+        addon.settings['showfanart'] = 'true'
+        kodiutils.set_setting('itemsperpage', '50')
+        self.assertEqual(kodiutils.get_cached_setting_int('itemsperpage', default=50), 50)
+
+    @unittest.skipIf(sys.version_info < (3, 0, 0), 'Skipping keep-alive tests on Python 2')
+    def test_keepalive_connection_reuse(self):
+        """Test reusing a keep-alive connection for sequential requests"""
+        with http_server() as (server, url):
+            for idx in range(5):
+                self.assertEqual(kodiutils.get_url_json(url + '/' + str(idx)).get('path'), '/' + str(idx))
+            self.assertEqual(server.connections, 1)
+
+    def test_compressed_transfer(self):
+        """Test decompressing gzip and deflate encoded responses"""
+        with http_server() as (_, url):
+            for encoding in ('gzip', 'deflate'):
+                data = kodiutils.get_url_json(url + '/' + encoding)
+                self.assertEqual(data.get('path'), '/' + encoding)
+                self.assertEqual(data.get('text'), 'Één keer' * 1000)
+
+                # JSON error responses are returned by open_url() and decompressed as well
+                data = kodiutils.get_url_json(url + '/error/' + encoding)
+                self.assertEqual(data.get('path'), '/error/' + encoding)
+
+    def test_get_url_json_many(self):
+        """Test fetching multiple URLs concurrently"""
+        with http_server() as (_, url):
+            requests = [url + '/0', {'url': url + '/1'}, None, {'url': url + '/error/3', 'fail': {}}, url + '/4']
+            results = kodiutils.get_url_json_many(requests, max_workers=3)
+            self.assertEqual([result.get('path') if result else result for result in results], ['/0', '/1', None, '/error/3', '/4'])
+
+            # HTTP errors a request asks for are raised once all requests are done
+            requests = [url + '/0', {'url': url + '/error/1', 'raise_errors': 'all', 'fail': {}}, url + '/2']
+            with self.assertRaises(kodiutils.HTTPError):
+                kodiutils.get_url_json_many(requests, max_workers=3)
+
+    def test_deferred_dialogs(self):
+        """Test collecting OK dialogs instead of showing them"""
+        dialogs = []
+        with kodiutils.deferred_dialogs(dialogs):
+            kodiutils.ok_dialog(heading='HTTP Error 500', message='Internal Server Error')
+        self.assertEqual(dialogs, [('HTTP Error 500', 'Internal Server Error')])
+
+    def test_conditional_revalidation(self):
+        """Test revalidating an expired cache entry using its ETag"""
+        cache_file = 'test_etag.json'
+        kodiutils.delete_cache(cache_file)
+        kodiutils.delete_cache(cache_file, kodiutils.VALIDATORS_CACHE_DIR)
+        try:
+            with http_server() as (server, url):
+                data = kodiutils.get_cached_url_json(url + '/etag', cache=cache_file, ttl=-1)
+                self.assertEqual(data.get('path'), '/etag')
+                self.assertEqual(kodiutils.get_validators(cache_file), {'If-None-Match': '"v1"', 'If-Modified-Since': 'Sat, 01 Jul 2023 12:00:00 GMT'})
+
+                # An expired cache entry is revalidated and served from cache
+                data = kodiutils.get_cached_url_json(url + '/etag', cache=cache_file, ttl=-1)
+                self.assertEqual(data.get('path'), '/etag')
+                self.assertEqual(server.not_modified, 1)
+
+                # Invalidated caches are fetched unconditionally
+                kodiutils.invalidate_caches('test_etag*.json')
+                self.assertEqual(kodiutils.get_validators(cache_file), {})
+                data = kodiutils.get_cached_url_json(url + '/etag', cache=cache_file, ttl=-1)
+                self.assertEqual(data.get('path'), '/etag')
+                self.assertEqual(server.not_modified, 1)
+        finally:
+            kodiutils.delete_cache(cache_file)
+            kodiutils.delete_cache(cache_file, kodiutils.VALIDATORS_CACHE_DIR)
+
+    def test_stale_while_revalidate(self):
+        """Test serving a recently expired cache entry and refreshing it in the background"""
+        cache_file = 'test_stale.json'
+        addon.settings['staleserving'] = True
+        kodiutils.invalidate_settings()
+        try:
+            with http_server() as (server, url):
+                kodiutils.get_cached_url_json(url + '/etag', cache=cache_file, ttl=-1)
+                self.assertEqual(server.requests, 1)
+
+                # An expired cache entry is served without a request
+                data = kodiutils.get_cached_url_json(url + '/etag', cache=cache_file, ttl=-1)
+                self.assertEqual(data.get('path'), '/etag')
+                self.assertEqual(server.requests, 1)
+
+                # Revalidating an unchanged response reports no change
+                self.assertFalse(kodiutils.revalidate_cache(url + '/etag', cache=cache_file, ttl=-1))
+                self.assertEqual(server.not_modified, 1)
+
+                # Entries refreshed meanwhile are not fetched again
+                self.assertFalse(kodiutils.revalidate_cache(url + '/etag', cache=cache_file, ttl=60))
+                self.assertEqual(server.requests, 2)
+        finally:
+            addon.settings.pop('staleserving')
+            kodiutils.invalidate_settings()
+            kodiutils.delete_cache(cache_file)
+            kodiutils.delete_cache(cache_file, kodiutils.VALIDATORS_CACHE_DIR)
+
+    def test_cache_store(self):
+        """Test storing, expiring and invalidating entries in the cache store"""
+        kodiutils.update_cache('test_store.json', '{"path": "/store"}')
+        kodiutils.update_cache('test_store.json', '{"etag": "v1"}', kodiutils.VALIDATORS_CACHE_DIR)
+        kodiutils.update_cache('test_expired.json', '{"expirationDate": "2000-01-01T00:00:00.000Z"}')
+        self.assertEqual(kodiutils.get_cache('test_store.json', ttl=60), {'path': '/store'})
+        self.assertIsNone(kodiutils.get_cache('test_store.json', ttl=-1))
+        self.assertEqual(kodiutils.get_cache('test_store.json', cache_dir=kodiutils.VALIDATORS_CACHE_DIR), {'etag': 'v1'})
+        self.assertIsNone(kodiutils.get_cache('test_expired.json'))
+        self.assertTrue(kodiutils.has_cache('test_expired.json'))
+        kodiutils.invalidate_caches('test_store.*', 'test_exp*.json')
+        self.assertFalse(kodiutils.has_cache('test_store.json'))
+        self.assertFalse(kodiutils.has_cache('test_store.json', kodiutils.VALIDATORS_CACHE_DIR))
+        self.assertFalse(kodiutils.has_cache('test_expired.json'))
+        self.assertFalse(kodiutils.touch_cache('test_store.json'))
+
+    def test_cache_garbage_collection(self):
+        """Test removing expired entries and evicting the least recently used entries over budget"""
+        kodiutils.invalidate_caches('*')
+        data = '{"data": "%s"}' % ('x' * 1000)
+        for key in ('test_gc_1.json', 'test_gc_2.json', 'test_gc_3.json'):
+            kodiutils.update_cache(key, data)
+        kodiutils.update_cache('test_gc_expired.json', '{"expirationDate": "2000-01-01T00:00:00.000Z"}')
+        stats = kodiutils.get_cache_stats()
+        kodiutils.collect_cache_garbage(budget=2 * len(data))
+        self.assertFalse(kodiutils.has_cache('test_gc_expired.json'))
+        self.assertFalse(kodiutils.has_cache('test_gc_1.json'))
+        self.assertFalse(kodiutils.has_cache('test_gc_2.json'))
+        self.assertTrue(kodiutils.has_cache('test_gc_3.json'))
+        self.assertEqual(kodiutils.get_cache_stats().get('expirations'), stats.get('expirations') + 1)
+        self.assertEqual(kodiutils.get_cache_stats().get('evictions'), stats.get('evictions') + 2)
+        kodiutils.invalidate_caches('test_gc_*.json')
+
+    def test_cache_migration(self):
+        """Test moving cache files of former versions into the cache store"""
+        directory = kodiutils.get_cache_dir()
+        if not kodiutils.exists(directory):
+            kodiutils.mkdirs(directory)
+        path = kodiutils.get_cache_path('test_migrated.json')
+        with kodiutils.open_file(path, 'w') as fdesc:
+            fdesc.write('{"path": "/migrated"}')
+        try:
+            # The caller removes the migrated files once the cache store committed them
+            self.assertIn(path, kodiutils.migrate_cache_files(kodiutils.get_cache_db()))
+            self.assertTrue(kodiutils.exists(path))
+            self.assertEqual(kodiutils.get_cache('test_migrated.json', ttl=60), {'path': '/migrated'})
+        finally:
+            kodiutils.delete(path)
+            kodiutils.delete_cache('test_migrated.json')
+
+    def test_single_flight(self):
+        """Test coalescing concurrent refreshes of the same cache file"""
+        cache_file = 'test_single_flight.json'
+        kodiutils.delete_cache(cache_file)
+        try:
+            with http_server() as (server, url):
+                results = []
+                threads = [Thread(target=lambda: results.append(kodiutils.get_cached_url_json(url + '/slow', cache=cache_file, ttl=60))) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual([result.get('path') for result in results], ['/slow'] * 4)
+                self.assertEqual(server.requests, 1)
+                cursor = kodiutils.execute_cache_db('SELECT COUNT(*) FROM locks WHERE key = ?', (cache_file,))
+                self.assertEqual(cursor.fetchone()[0], 0)
+        finally:
+            kodiutils.delete_cache(cache_file)
+
+    def test_retry_backoff(self):
+        """Test retrying transient failures of queries, but not of mutations"""
+        kodiutils.RETRY_BACKOFF = 0.01
+        try:
+            with http_server() as (server, url):
+                server.failures = 2
+                self.assertEqual(kodiutils.get_url_json(url + '/0').get('path'), '/0')
+                self.assertEqual(server.requests, 3)
+
+                server.failures = 1
+                data = b'{"operationName": "PageQuery", "query": "query PageQuery { page { id } }"}'
+                self.assertEqual(kodiutils.get_url_json(url + '/1', data=data).get('path'), '/1')
+                self.assertEqual(server.requests, 5)
+
+                server.failures = 1
+                data = b'{"operationName": "setFavorite", "query": "mutation setFavorite { id }"}'
+                self.assertEqual(kodiutils.get_url_json(url + '/2', data=data, fail={}), {})
+                self.assertEqual(server.requests, 6)
+
+                server.failures = 1
+                data = b'[{"operationName": "PageQuery", "query": "query PageQuery { id }"}, {"operationName": "Stream", "query": "query Stream { id }"}]'
+                self.assertEqual(kodiutils.get_url_json(url + '/3', data=data).get('path'), '/3')
+                self.assertEqual(server.requests, 8)
+        finally:
+            kodiutils.RETRY_BACKOFF = 0.5
+
+    def test_retry_persisted_query(self):
+        """Test retrying persisted queries sent by hash, but not persisted mutations or unknown hashes"""
+        from helperobjects import GraphQLQuery
+        query = GraphQLQuery('query PageQuery { page { id } }', 'PageQuery')
+        mutation = GraphQLQuery('mutation setFavorite { id }', 'setFavorite')
+        unknown = GraphQLQuery('query Unknown { id }', 'Unknown')
+        kodiutils.register_persisted_query(query.hash, query.is_mutation)
+        kodiutils.register_persisted_query(mutation.hash, mutation.is_mutation)
+        kodiutils.RETRY_BACKOFF = 0.01
+        try:
+            with http_server() as (server, url):
+                server.failures = 1
+                data = (query.prefixes.get('persisted') + '{}}').encode()
+                self.assertEqual(kodiutils.get_url_json(url + '/0', data=data).get('path'), '/0')
+                self.assertEqual(server.requests, 2)
+
+                for graphql_query in (mutation, unknown):
+                    server.failures = 1
+                    data = (graphql_query.prefixes.get('persisted') + '{}}').encode()
+                    self.assertEqual(kodiutils.get_url_json(url + '/1', data=data, fail={}), {})
+                self.assertEqual(server.requests, 4)
+        finally:
+            kodiutils.RETRY_BACKOFF = 0.5
+
+    def test_circuit_breaker(self):
+        """Test failing fast and serving stale cache while a host is failing"""
+        cache_file = 'test_circuit.json'
+        kodiutils.RETRY_BACKOFF = 0.01
+        try:
+            with http_server() as (server, url):
+                host = url.split('//')[1]
+                self.assertEqual(kodiutils.get_cached_url_json(url + '/0', cache=cache_file, ttl=-1).get('path'), '/0')
+                server.failures = 100
+                for _ in range(kodiutils.CIRCUIT_FAILURES):
+                    self.assertEqual(kodiutils.get_cached_url_json(url + '/0', cache=cache_file, ttl=-1).get('path'), '/0')
+                self.assertTrue(kodiutils.is_circuit_open(host))
+
+                # An open circuit fails fast without requests
+                requests = server.requests
+                self.assertEqual(kodiutils.get_cached_url_json(url + '/0', cache=cache_file, ttl=-1).get('path'), '/0')
+                self.assertIsNone(kodiutils.get_url_json(url + '/1'))
+                self.assertEqual(server.requests, requests)
+
+                # A host that responds again closes the circuit
+                kodiutils.record_success(host)
+                server.failures = 0
+                self.assertEqual(kodiutils.get_url_json(url + '/1').get('path'), '/1')
+                self.assertFalse(kodiutils.is_circuit_open(host))
+        finally:
+            kodiutils.RETRY_BACKOFF = 0.5
+            kodiutils.delete_cache(cache_file)
+
+    def test_decoded_response(self):
+        """Test reading a decompressed response in parts"""
+        body = b'{"line": 1}\n{"line": 2}\n'
+        response = kodiutils.DecodedResponse(BytesIO(zlib.compress(body)), 'deflate')
+        self.assertEqual(response.read(5), body[:5])
+        self.assertEqual(response.readline(), body[5:12])
+        self.assertEqual(response.read(), body[12:])
+        self.assertEqual(response.read(), b'')
+
+        # Raw deflate streams without zlib header
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        response = kodiutils.DecodedResponse(BytesIO(compressor.compress(body) + compressor.flush()), 'deflate')
+        self.assertEqual(list(response), [b'{"line": 1}\n', b'{"line": 2}\n'])
+
 
 if __name__ == '__main__':
     unittest.main()
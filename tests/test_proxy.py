@@ -9,6 +9,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import sys
 import unittest
 import addon
+from kodiutils import invalidate_network_config
 
 xbmc = __import__('xbmc')
 xbmcaddon = __import__('xbmcaddon')
@@ -29,10 +30,12 @@ class TestProxy(unittest.TestCase):
         xbmc.settings['network.httpproxytype'] = 0
         xbmc.settings['network.httpproxyserver'] = 'localhost'
         xbmc.settings['network.httpproxyport'] = '8899'
+        invalidate_network_config()
 
     def tearDown(self):
         """Clean up function for TestCase class"""
         xbmc.settings['network.usehttpproxy'] = False
+        invalidate_network_config()
 
     # Delete tokens method: '/tokens/delete'
     def test_clear_cookies_route(self):
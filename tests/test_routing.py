@@ -9,6 +9,7 @@ from datetime import datetime, timedelta
 import unittest
 import dateutil.tz
 import addon
+import kodiutils
 
 
 xbmc = __import__('xbmc')
@@ -273,6 +274,39 @@ class TestRouting(unittest.TestCase):
         addon.run(['plugin://plugin.video.vrt.nu/show/settings/addons', '0', ''])
         self.assertEqual(plugin.url_for(addon.show_settings_addons), 'plugin://plugin.video.vrt.nu/show/settings/addons')
 
+    def test_show_tracing(self):
+        """Show HTTP request timings: /tracing"""
+        addon.run(['plugin://plugin.video.vrt.nu/tracing', '0', ''])
+        self.assertEqual(plugin.url_for(addon.show_tracing), 'plugin://plugin.video.vrt.nu/tracing')
+
+    def test_listing_cache(self):
+        """Test showing a pre-rendered listing from cache"""
+        from helperobjects import TitleItem
+        addon.run(['plugin://plugin.video.vrt.nu/noop', '0', ''])
+        kodiutils.invalidate_caches('listing.*.json')
+        self.assertFalse(kodiutils.show_cached_listing(60))
+        title_item = TitleItem(label='Thuis', path='plugin://plugin.video.vrt.nu/programs/thuis', info_dict={'title': 'Thuis'},
+                               context_menu=[('Volg', 'RunPlugin(plugin://plugin.video.vrt.nu/follow/1/Thuis)')])
+        kodiutils.show_listing([title_item], category=30014, content='tvshows', cache_listing=True)
+        self.assertTrue(kodiutils.show_cached_listing(60))
+        kodiutils.invalidate_caches('listing.*.json')
+        self.assertFalse(kodiutils.show_cached_listing(60))
+
+    def test_url_for_templates(self):
+        """Test the route templates build the same URLs as routing"""
+        values = ['thuis', 'de ideale wereld', 'Thuis%2FFamilie', 'één', '2023-01-01T19:00:00', 1655824964821]
+        for func, rules in plugin._rules.items():  # pylint: disable=protected-access
+            for rule in rules:
+                keywords = rule._keywords  # pylint: disable=protected-access
+                for value in values:
+                    kwargs = {keyword: value for keyword in keywords}
+                    self.assertEqual(kodiutils.url_for(func.__name__, **kwargs), plugin.url_for(func, **kwargs))
+                    kwargs.update(end_cursor='MjA=', feature=value)
+                    self.assertEqual(kodiutils.url_for(func.__name__, **kwargs), plugin.url_for(func, **kwargs))
+                    if keywords:
+                        args = tuple(value for _ in keywords)
+                        self.assertEqual(kodiutils.url_for(func.__name__, *args), plugin.url_for(func, *args))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -8,7 +8,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import os
 import unittest
 from addon import plugin
-from kodiutils import open_settings
+from kodiutils import invalidate_settings, open_settings
 from streamservice import StreamService
 from tokenresolver import TokenResolver
 
@@ -38,6 +38,7 @@ class TestSettings(unittest.TestCase):
         addon.settings['useinputstreamadaptive'] = True
         addon.settings['usemenucaching'] = True
         addon.settings['useresumepoints'] = True
+        invalidate_settings()
 
     @staticmethod
     @unittest.skipUnless(addon.settings.get('username'), 'Skipping as VRT username is missing.')
@@ -46,6 +47,7 @@ class TestSettings(unittest.TestCase):
         """Test without menu caching"""
         addon.settings['usehttpcaching'] = True
         addon.settings['usemenucaching'] = False
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/recent', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/recent', '0', ''])
 
@@ -56,6 +58,7 @@ class TestSettings(unittest.TestCase):
         """Test without http caching"""
         addon.settings['usehttpcaching'] = False
         addon.settings['usemenucaching'] = True
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/offline', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/offline', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/tvguide/date/today/canvas', '0', ''])
@@ -68,6 +71,7 @@ class TestSettings(unittest.TestCase):
         plugin.run(['plugin://plugin.video.vrt.nu/', '0', ''])
         addon.settings['usefavorites'] = False
         addon.settings['useresumepoints'] = True
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/favorites', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/favorites/recent', '0', ''])
@@ -81,6 +85,7 @@ class TestSettings(unittest.TestCase):
         plugin.run(['plugin://plugin.video.vrt.nu/favorites', '0', ''])
         addon.settings['usefavorites'] = True
         addon.settings['useresumepoints'] = False
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/favorites', '0', ''])
         plugin.run(['plugin://plugin.video.vrt.nu/resumepoints/continue', '0', ''])
 
@@ -95,12 +100,14 @@ class TestSettings(unittest.TestCase):
     def test_youtube_disabled():
         """Test with showyoutube disabled"""
         addon.settings['showyoutube'] = False
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/channels/radio1', '0', ''])
 
     @staticmethod
     def test_showfanart_disabled():
         """Test with showfanart disabled"""
         addon.settings['showfanart'] = False
+        invalidate_settings()
         plugin.run(['plugin://plugin.video.vrt.nu/categories', '0', ''])
 
     @unittest.skipUnless(addon.settings.get('username'), 'Skipping as VRT username is missing.')
@@ -109,6 +116,7 @@ class TestSettings(unittest.TestCase):
         """Test ondemand stream"""
         addon.settings['usedrm'] = False
         addon.settings['useinputstreamadaptive'] = False
+        invalidate_settings()
         video = {'video_url': 'https://www.vrt.be/vrtmax/a-z/winteruur/1/winteruur-s1a1/'}
         stream = self._streamservice.get_stream(video)
         # NOTE: Testing live streams only works within Europe
@@ -121,6 +129,7 @@ class TestSettings(unittest.TestCase):
         """Test with usedrm disabled"""
         addon.settings['usedrm'] = False
         addon.settings['useinputstreamadaptive'] = True
+        invalidate_settings()
         video = {'video_url': 'https://www.vrt.be/vrtmax/a-z/winteruur/1/winteruur-s1a1/'}
         stream = self._streamservice.get_stream(video)
         # NOTE: Testing live streams only works within Europe
@@ -133,6 +142,7 @@ class TestSettings(unittest.TestCase):
         """Test with useinputstreamadaptive disabled"""
         addon.settings['usedrm'] = True
         addon.settings['useinputstreamadaptive'] = False
+        invalidate_settings()
         video = {'video_url': 'https://www.vrt.be/vrtmax/a-z/winteruur/1/winteruur-s1a1/'}
         stream = self._streamservice.get_stream(video)
         # NOTE: Testing live streams only works within Europe
@@ -145,6 +155,7 @@ class TestSettings(unittest.TestCase):
         """Test with usedrm and useinputstreamadaptive disabled"""
         addon.settings['usedrm'] = True
         addon.settings['useinputstreamadaptive'] = True
+        invalidate_settings()
         video = {'video_url': 'https://www.vrt.be/vrtmax/a-z/winteruur/1/winteruur-s1a1/'}
         stream = self._streamservice.get_stream(video)
         # NOTE: Testing live streams only works within Europe
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# GNU General Public License v3.0 (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""Unit tests for HTTP request tracing"""
+
+# pylint: disable=invalid-name,line-too-long
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import unittest
+import kodiutils
+import tracing
+from test_kodiutils import http_server
+
+xbmcaddon = __import__('xbmcaddon')
+
+addon = xbmcaddon.Addon()
+
+
+class TestTracing(unittest.TestCase):
+    """TestCase class"""
+
+    def setUp(self):
+        """Enable tracing with empty trace files"""
+        addon.settings['tracing'] = True
+        kodiutils.invalidate_settings()
+        for path in tracing.get_trace_files():
+            if os.path.exists(path):
+                os.remove(path)
+
+    def tearDown(self):
+        """Disable tracing and remove the trace files"""
+        addon.settings.pop('tracing', None)
+        kodiutils.invalidate_settings()
+        for path in tracing.get_trace_files():
+            if os.path.exists(path):
+                os.remove(path)
+        kodiutils.delete_cache('test_tracing.json')
+
+    def test_trace_requests(self):
+        """Test tracing requests and cache hits"""
+        tracing.start_invocation('plugin://plugin.video.vrt.nu/')
+        with http_server() as (_, url):
+            kodiutils.get_cached_url_json(url + '/gzip', cache='test_tracing.json', ttl=60)
+            kodiutils.get_cached_url_json(url + '/gzip', cache='test_tracing.json', ttl=60)
+            kodiutils.get_url_json(url + '/1?token=secret', data=b'{"operationName": "PageQuery"}')
+
+        records = tracing.read_records()
+        self.assertEqual([record.get('cache') for record in records], ['miss', 'hit', None])
+        miss, operation = records[0], records[2]
+        self.assertEqual(miss.get('caller'), 'test_tracing.json')
+        self.assertEqual(miss.get('status'), 200)
+        for key in ('dns', 'connect', 'ttfb', 'transfer', 'decode', 'total'):
+            self.assertIn(key, miss)
+        self.assertLess(miss.get('bytes'), len('Één keer'.encode('utf-8') * 1000))
+        self.assertEqual(operation.get('caller'), 'PageQuery')
+        self.assertNotIn('secret', operation.get('endpoint'))
+        self.assertNotIn('connect', operation)  # Reused keep-alive connection
+
+        count, summaries = tracing.summarize(invocations=1)
+        self.assertEqual(count, 1)
+        self.assertEqual(sorted((summary.get('requests'), summary.get('hits')) for summary in summaries), [(1, 0), (2, 1)])
+
+    def test_disabled(self):
+        """Test no traces are written when tracing is disabled"""
+        addon.settings.pop('tracing', None)
+        kodiutils.invalidate_settings()
+        with http_server() as (_, url):
+            kodiutils.get_url_json(url + '/1')
+        self.assertEqual(tracing.read_records(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
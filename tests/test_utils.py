@@ -163,6 +163,16 @@ class TestUtils(unittest.TestCase):
         self.assertEqual('plugin://plugin.video.youtube/foo/bar/', utils.youtube_to_plugin_url('https://www.youtube.com/foo/bar'))
         self.assertEqual('plugin://plugin.video.youtube/foo/bar/baz/', utils.youtube_to_plugin_url('https://www.youtube.com/foo/bar/baz/'))
 
+    def test_parse_datetime(self):
+        """Test parse_datetime matches dateutil for VRT timestamps"""
+        import dateutil.parser
+        for value in ('2023-01-01T20:00:00.000+01:00', '2023-07-01T06:05:00+02:00', '2100-01-01T00:00:00.000000Z', '2023-01-01T20:00:00.000-05:30',
+                      '2023-01-01T20:00:00.1234567+00:00', '2023-01-01T20:00', '2023-01-01', '1 january 2023'):
+            parsed = utils.parse_datetime(value)
+            self.assertEqual(parsed, dateutil.parser.parse(value))
+            self.assertEqual(parsed.utcoffset(), dateutil.parser.parse(value).utcoffset())
+            self.assertIs(utils.parse_datetime(value), parsed)
+
 
 if __name__ == '__main__':
     unittest.main()
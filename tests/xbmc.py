@@ -248,6 +248,11 @@ def getCondVisibility(string):
     return True
 
 
+def getGlobalIdleTime():
+    """A reimplementation of the xbmc getGlobalIdleTime() function"""
+    return 0
+
+
 def getInfoLabel(key):
     """A reimplementation of the xbmc getInfoLabel() function"""
     assert isinstance(key, basestring)